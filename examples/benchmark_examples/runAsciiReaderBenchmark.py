@@ -0,0 +1,68 @@
+"""
+Compare the time taken to read the SED and throughput files in
+tests/cartoonSedTestData with readAsciiColumns against the parsers
+previously used by Sed.readSED_flambda (numpy.genfromtxt) and by
+Sed.readSED_fnu/Bandpass.readThroughput (a python loop over lines).
+"""
+from __future__ import print_function
+import os
+import gzip
+import time
+import numpy
+from lsst.utils import getPackageDir
+from lsst.sims.photUtils import readAsciiColumns
+
+
+def read_genfromtxt(file_name):
+    dtype = numpy.dtype([('wavelen', float), ('flux', float)])
+    data = numpy.genfromtxt(file_name, dtype=dtype)
+    return data['wavelen'], data['flux']
+
+
+def read_line_loop(file_name):
+    if file_name.endswith('.gz'):
+        f = gzip.open(file_name, 'rt')
+    else:
+        f = open(file_name, 'r')
+    wavelen = []
+    flux = []
+    for line in f:
+        if line.startswith("#") or line.startswith('$') or line.startswith('!'):
+            continue
+        values = line.split()
+        if len(values) < 2:
+            continue
+        wavelen.append(float(values[0]))
+        flux.append(float(values[1]))
+    f.close()
+    return numpy.array(wavelen), numpy.array(flux)
+
+
+def time_reader(reader, file_name_list, n_iterations):
+    t_start = time.time()
+    for ix in range(n_iterations):
+        for file_name in file_name_list:
+            reader(file_name)
+    return (time.time()-t_start)/n_iterations
+
+
+if __name__ == "__main__":
+
+    data_dir = os.path.join(getPackageDir('sims_photUtils'), 'tests', 'cartoonSedTestData')
+
+    sed_list = []
+    for dir_name, sub_dir_list, file_list in os.walk(data_dir):
+        sed_list += [os.path.join(dir_name, name) for name in file_list if name.endswith('.gz')]
+    throughput_list = [os.path.join(data_dir, name) for name in os.listdir(data_dir)
+                       if name.endswith('.dat')]
+
+    n_iterations = 5
+    print('%d gzipped SEDs, %d throughput files; mean of %d iterations\n'
+          % (len(sed_list), len(throughput_list), n_iterations))
+
+    for label, file_name_list in (('SEDs', sed_list), ('throughputs', throughput_list)):
+        t_fast = time_reader(readAsciiColumns, file_name_list, n_iterations)
+        for reader_name, reader in (('genfromtxt', read_genfromtxt), ('line loop', read_line_loop)):
+            t_slow = time_reader(reader, file_name_list, n_iterations)
+            print('%-12s %-10s %8.3f s   readAsciiColumns %8.3f s   speedup %5.1f'
+                  % (label, reader_name, t_slow, t_fast, t_slow/t_fast))
@@ -62,9 +62,10 @@ from builtins import object
 import os
 import warnings
 import numpy
-import scipy.interpolate as interpolate
-import gzip
 from .PhysicalParameters import PhysicalParameters
+from .asciiUtils import readAsciiColumns
+from .Resampler import get_resampler
+from .WavelenGrids import wavelen_grid_fingerprint
 from .Sed import Sed  # For ZP_t and M5 calculations. And for 'fast mags' calculation.
 
 __all__ = ["Bandpass"]
@@ -198,38 +199,17 @@ class Bandpass(object):
             self.readThroughputList(componentList=filename,
                                     wavelen_min=self.wavelen_min, wavelen_max=self.wavelen_max,
                                     wavelen_step=self.wavelen_step)
-        # Filename is single file, now try to open file and read data.
+        # Filename is single file, now try to read data (with and without the gz).
+        # The throughput file should have wavelength(A), throughput(Sb) as first two columns;
+        # lines starting with '#', '$' or '!' are comments.
         try:
-            if filename.endswith('.gz'):
-                f = gzip.open(filename, 'r')
-            else:
-                f = open(filename, 'r')
+            wavelen, sb = readAsciiColumns(filename)
         except IOError:
-            try:
-                if filename.endswith('.gz'):
-                    f = open(filename[:-3], 'r')
-                else:
-                    f = gzip.open(filename+'.gz', 'r')
-            except IOError:
-                raise IOError('The throughput file %s does not exist' %(filename))
-        # The throughput file should have wavelength(A), throughput(Sb) as first two columns.
-        wavelen = []
-        sb = []
-        for line in f:
-            if line.startswith("#") or line.startswith('$') or line.startswith('!'):
-                continue
-            values = line.split()
-            if len(values)<2:
-                continue
-            if (values[0] == '$') or (values[0] =='#') or (values[0] =='!'):
-                continue
-            wavelen.append(float(values[0]))
-            sb.append(float(values[1]))
-        f.close()
+            raise IOError('The throughput file %s does not exist' %(filename))
         self.bandpassname = filename
         # Set up wavelen/sb.
-        self.wavelen = numpy.array(wavelen, dtype='float')
-        self.sb = numpy.array(sb, dtype='float')
+        self.wavelen = wavelen
+        self.sb = sb
         # Check that wavelength is monotonic increasing and non-repeating in wavelength. (Sort on wavelength).
         if len(self.wavelen) != len(numpy.unique(self.wavelen)):
             raise ValueError('The wavelength values in file %s are non-unique.' %(filename))
@@ -326,16 +306,14 @@ class Bandpass(object):
         update_self = self.checkUseSelf(wavelen, wavelen)
         if update_self:
             wavelen = self.wavelen
-        wavelen_max_in = wavelen[len(wavelen)-1]
-        wavelen_min_in = wavelen[0]
-        wavelen_step_in = wavelen[1]-wavelen[0]
+        # The first/last values and the (uniform) step of the grid; these are
+        # looked up, not recalculated, for interned grids (see WavelenGrids.py).
+        fingerprint = wavelen_grid_fingerprint(wavelen)
         # Start check if data is already gridded.
         need_regrid=True
-        # First check minimum/maximum and first step in array.
-        if ((wavelen_min_in == wavelen_min) and (wavelen_max_in == wavelen_max)):
-            # Then check on step size.
-            stepsize = numpy.unique(numpy.diff(wavelen))
-            if (len(stepsize) == 1) and (stepsize[0] == wavelen_step):
+        # First check minimum/maximum and then the step size.
+        if ((fingerprint.wavelen_min == wavelen_min) and (fingerprint.wavelen_max == wavelen_max)):
+            if fingerprint.wavelen_step == wavelen_step:
                 need_regrid = False
         # At this point, need_grid=True unless it's proven to be False, so return value.
         return need_regrid
@@ -361,11 +339,13 @@ class Bandpass(object):
         # Set up gridded wavelength.
         wavelen_grid = numpy.arange(wavelen_min, wavelen_max+wavelen_step/2.0, wavelen_step, dtype='float')
         # Do the interpolation of wavelen/sb onto the grid. (note wavelen/sb type failures will die here).
-        f = interpolate.interp1d(wavelen, sb, fill_value=0, bounds_error=False)
-        sb_grid = f(wavelen_grid)
+        # The interpolation weights are cached for each pair of grids (see Resampler.py).
+        sb_grid = get_resampler(wavelen, wavelen_grid, fill_value=0.0).resample(sb)
         # Update self values if necessary.
         if update_self:
             self.phi = None
+            # (a writeable array, which self may change in place; the copies
+            # made by BandpassDict share the canonical array of the grid)
             self.wavelen = wavelen_grid
             self.sb = sb_grid
             self.setWavelenLimits(wavelen_min, wavelen_max, wavelen_step)
@@ -1,15 +1,156 @@
 from builtins import zip
 from builtins import object
 import copy
+import hashlib
 import numpy
 import os
+import warnings
+import zipfile
 from lsst.utils import getPackageDir
 from collections import OrderedDict
 from .Bandpass import Bandpass
-from .Sed import Sed
+from .Sed import Sed, _wavelen_grid_hash, _check_flux_dtype
+from .PhysicalParameters import PhysicalParameters
+from .WavelenGrids import intern_wavelen_grid, wavelen_grid_fingerprint
+from .Resampler import Resampler, get_resampler
+from .SedBatch import SedBatch
+from .DustMagTable import DustMagTable
+from .RedshiftFluxTable import RedshiftFluxTable
 
 __all__ = ["BandpassDict"]
 
+# the number of Seds whose flux densities are stacked into one array
+# (and integrated with one matrix product) at a time by the SedList
+# methods of BandpassDict
+_sed_stack_rows = 1024
+
+# the number of integration matrices of native wavelength grids
+# kept by each BandpassDict (see BandpassDict._nativeIntegrator)
+_max_native_integrators = 16
+
+# the number of sets of rest-frame interpolation weights (one per wavelength
+# grid and redshift) kept by each BandpassDict (see BandpassDict._restFrameResampler)
+_max_rest_frame_resamplers = 64
+
+# the number of DustMagTables kept by each BandpassDict (see BandpassDict.dustMagTableForSed)
+_max_dust_mag_tables = 256
+
+# the version of the format of the files written by _write_bandpass_cache
+# (part of the name of each file, so that old caches are never read)
+_bandpass_cache_version = 1
+
+
+def _sed_shape_hash(flambda):
+    """
+    Return a hex string identifying the shape of the spectrum flambda, i.e. flambda
+    up to its normalization.  flambda is divided by its largest absolute value and
+    rounded to single precision, so that copies of a template normalized
+    differently (which differ by rounding as well as by the factor) agree.
+    """
+    flambda = numpy.asarray(flambda, dtype=float)
+    with numpy.errstate(invalid='ignore'):
+        scale = numpy.nanmax(numpy.abs(flambda)) if len(flambda) > 0 else 0.0
+    if not numpy.isfinite(scale) or scale == 0.0:
+        scale = 1.0
+    shape = numpy.ascontiguousarray(flambda/scale, dtype=numpy.float32)
+    return hashlib.md5(shape.tobytes()).hexdigest()[:16]
+
+
+def _throughput_file_hash(filename):
+    """
+    Return the md5 hash of the contents of the throughput file filename, or of its
+    alternate (with '.gz' appended or removed, as in readAsciiColumns) if filename
+    does not exist.  Returns None if neither exists.
+    """
+    if filename.endswith('.gz'):
+        alternate_filename = filename[:-3]
+    else:
+        alternate_filename = filename + '.gz'
+    for name in (filename, alternate_filename):
+        if os.path.exists(name):
+            md5 = hashlib.md5()
+            with open(name, 'rb') as file_handle:
+                while True:
+                    chunk = file_handle.read(1 << 20)
+                    if not chunk:
+                        break
+                    md5.update(chunk)
+            return md5.hexdigest()
+    return None
+
+
+def _bandpass_cache_name(loader, bandpassNames, fileLists):
+    """
+    Return the name of the file in which the bandpasses read by loader (the name
+    of a BandpassDict class method) are cached.  The name is a hash of
+    the bandpass names, of the contents of the throughput files (fileLists
+    is a list of the files read for each bandpass) and of the default
+    wavelength grid onto which throughputs are resampled, so that any change
+    to them gives a different file.  Returns None if a file does not exist.
+    """
+    physParams = PhysicalParameters()
+    md5 = hashlib.md5()
+    md5.update(("%s %d %s %r %r %r" % (loader, _bandpass_cache_version, ' '.join(bandpassNames),
+                                       physParams.minwavelen, physParams.maxwavelen,
+                                       physParams.wavelenstep)).encode('utf-8'))
+    # the files shared by every bandpass are only read once
+    file_hashes = {}
+    for fileList in fileLists:
+        for filename in fileList:
+            if filename not in file_hashes:
+                file_hashes[filename] = _throughput_file_hash(filename)
+            if file_hashes[filename] is None:
+                return None
+            md5.update(file_hashes[filename].encode('utf-8'))
+        md5.update(b'|')
+    return 'bandpass_cache_%s.npz' % md5.hexdigest()
+
+
+def _read_bandpass_cache(cacheDir, cacheName):
+    """
+    Return a dict of the arrays in cacheDir/cacheName,
+    or None if the file does not exist or cannot be read.
+    """
+    file_name = os.path.join(cacheDir, cacheName)
+    if not os.path.exists(file_name):
+        return None
+    try:
+        with numpy.load(file_name) as data:
+            return dict((key, data[key]) for key in data.files)
+    except (IOError, OSError, ValueError, zipfile.BadZipfile):
+        return None
+
+
+def _write_bandpass_cache(cacheDir, cacheName, bandpassDictList):
+    """
+    Write the wavelength grid and the sb array of each of the BandpassDicts in
+    bandpassDictList to cacheDir/cacheName (see _read_bandpass_cache).  phi and
+    phiArray are not stored: BandpassDict recalculates them from sb.  Nothing
+    is written if the bandpasses of a dict are not all on its wavelenMatch.
+    """
+    arrays = {}
+    for ix, bandpassDict in enumerate(bandpassDictList):
+        bandpassList = bandpassDict.values()
+        if any(bp.wavelen is not bandpassDict.wavelenMatch for bp in bandpassList):
+            return
+        arrays['wavelen_%d' % ix] = bandpassDict.wavelenMatch
+        arrays['sb_%d' % ix] = numpy.array([bp.sb for bp in bandpassList], dtype=float)
+
+    if not os.path.exists(cacheDir):
+        try:
+            os.mkdir(cacheDir)
+        except OSError:
+            # another job made it first
+            pass
+    file_name = os.path.join(cacheDir, cacheName)
+    # many jobs may write the same cache at once; each writes its own
+    # temporary file, and the (atomic) rename of the last one wins
+    tmp_name = '%s.tmp%d' % (file_name, os.getpid())
+    with open(tmp_name, 'wb') as file_handle:
+        numpy.savez(file_handle, **arrays)
+    os.rename(tmp_name, file_name)
+
+
 class BandpassDict(object):
     """
     This class will wrap an OrderedDict of Bandpass instantiations.
@@ -33,13 +174,27 @@ class BandpassDict(object):
     into BandpassDict objects.
     """
 
-    def __init__(self, bandpassList, bandpassNameList):
+    def __init__(self, bandpassList, bandpassNameList, dtype=None, nativeGrids=False):
         """
         @param [in] bandpassList is a list of Bandpass instantiations
 
         @param [in] bandpassNameList is a list of tags to be associated
         with those Bandpasses.  These will be used as keys for the BandpassDict.
+
+        @param [in] dtype is the dtype (float32 or float64) in which phiArray
+        is stored.  Defaults to the dtype set by set_flux_dtype.  Magnitudes
+        are always integrated in float64.
+
+        @param [in] nativeGrids is a boolean.  If True, the fluxes of Seds which are
+        not sampled on the wavelength grid of the Bandpasses are calculated with
+        an integration matrix of their own grid (see _nativeIntegrator), so that
+        no resampled copy of them is made.  The matrices of the most recently used
+        grids are kept, which pays off when many Seds share a grid (e.g. SED
+        templates); a grid used by only one Sed (e.g. a redshifted Sed) is cheaper
+        to resample.  The fluxes agree with those of the resampled Seds to rounding,
+        but not bit for bit.  Defaults to False.
         """
+        self._nativeGrids = nativeGrids
         self._bandpassDict = OrderedDict()
         self._wavelen_match = None
         for bandpassName, bandpass in zip(bandpassNameList, bandpassList):
@@ -49,11 +204,35 @@ class BandpassDict(object):
                                    + "to BandpassDict")
 
             self._bandpassDict[bandpassName] = copy.deepcopy(bandpass)
+            # the copy shares the canonical array of its grid (see WavelenGrids.py)
+            if self._bandpassDict[bandpassName].wavelen is not None:
+                self._bandpassDict[bandpassName].wavelen = \
+                    intern_wavelen_grid(self._bandpassDict[bandpassName].wavelen)
             if self._wavelen_match is None:
                 self._wavelen_match = self._bandpassDict[bandpassName].wavelen
 
         dummySed = Sed()
         self._phiArray, self._wavelenStep = dummySed.setupPhiArray(list(self._bandpassDict.values()))
+        # setupPhiArray gives the copies it regrids new (private) arrays
+        for bandpass in self._bandpassDict.values():
+            bandpass.wavelen = intern_wavelen_grid(bandpass.wavelen)
+        self._phiArray = self._phiArray.astype(_check_flux_dtype(dtype), copy=False)
+        # the range of wavelengths over which each phi is non-zero
+        self._phiSupport = dummySed.setupPhiSupport(self._phiArray)
+        # fnu is flambda times this function of wavelength
+        physParams = dummySed._physParams
+        self._fnuFactor = self._wavelen_match*self._wavelen_match*physParams.nm2m/physParams.lightspeed
+        self._fnuFactor = self._fnuFactor*physParams.ergsetc2jansky
+
+        # integration matrices of the grids of Seds which are not
+        # on self._wavelen_match, keyed on the fingerprint of the grid
+        self._nativeIntegrators = OrderedDict()
+        # Resamplers from rest-frame grids onto self._wavelen_match/(1+z),
+        # keyed on the fingerprint of the grid and the redshift
+        self._restFrameResamplers = OrderedDict()
+
+        # DustMagTables, keyed on the shape of the SED and the A_v, R_v grids
+        self._dustMagTables = OrderedDict()
 
 
     def __getitem__(self, bandpass):
@@ -91,7 +270,8 @@ class BandpassDict(object):
                                 componentList = ['detector.dat', 'm1.dat', 'm2.dat', 'm3.dat',
                                                  'lens1.dat', 'lens2.dat', 'lens3.dat'],
                                 atmoTransmission=os.path.join(getPackageDir('throughputs'),
-                                                              'baseline','atmos_std.dat')):
+                                                              'baseline','atmos_std.dat'),
+                                cacheDir=None, nativeGrids=False):
         """
         Load bandpass information from files into BandpassDicts.
         This method will separate the bandpasses into contributions due to instrumentations
@@ -117,6 +297,15 @@ class BandpassDict(object):
         transmissivity of the atmosphere (defaults to baseline/atmos_std.dat in the LSST
         'throughputs' package).
 
+        @param [in] cacheDir is an optional directory in which to cache the loaded
+        bandpasses.  If it is given, the resampled throughputs are written to a
+        .npz file there the first time a set of files is loaded, and read from that
+        file (without parsing or resampling the throughput files) thereafter.
+        The file is keyed on the contents of the throughput files, so editing
+        them gives a new cache file.
+
+        @param [in] nativeGrids is passed to the BandpassDicts (see __init__)
+
         @param [out] bandpassDict is a BandpassDict containing the total
         throughput (instrumentation + atmosphere)
 
@@ -128,23 +317,45 @@ class BandpassDict(object):
         for cc in componentList:
             commonComponents.append(os.path.join(filedir,cc))
 
+        hardwareComponentLists = []
+        componentLists = []
+        for w in bandpassNames:
+            components = commonComponents + [os.path.join(filedir,"%s.dat" % (bandpassRoot +w))]
+            hardwareComponentLists.append(components)
+            componentLists.append(components + [atmoTransmission])
+
+        cacheName = None
+        if cacheDir is not None:
+            cacheName = _bandpass_cache_name('loadBandpassesFromFiles', bandpassNames, componentLists)
+            cached = None if cacheName is None else _read_bandpass_cache(cacheDir, cacheName)
+            if cached is not None:
+                bandpassDict = cls._fromCachedArrays(bandpassNames, cached['wavelen_0'], cached['sb_0'],
+                                                     [''.join(cc) for cc in componentLists],
+                                                     nativeGrids=nativeGrids)
+                hardwareBandpassDict = cls._fromCachedArrays(bandpassNames, cached['wavelen_1'],
+                                                             cached['sb_1'],
+                                                             [''.join(cc) for cc in hardwareComponentLists],
+                                                             nativeGrids=nativeGrids)
+                return bandpassDict, hardwareBandpassDict
+
         bandpassList = []
         hardwareBandpassList = []
 
-        for w in bandpassNames:
-            components = commonComponents + [os.path.join(filedir,"%s.dat" % (bandpassRoot +w))]
+        for hardwareComponents, components in zip(hardwareComponentLists, componentLists):
             bandpassDummy = Bandpass()
-            bandpassDummy.readThroughputList(components)
+            bandpassDummy.readThroughputList(hardwareComponents)
             hardwareBandpassList.append(bandpassDummy)
 
-            components += [atmoTransmission]
             bandpassDummy = Bandpass()
             bandpassDummy.readThroughputList(components)
             bandpassList.append(bandpassDummy)
 
 
-        bandpassDict = cls(bandpassList, bandpassNames)
-        hardwareBandpassDict = cls(hardwareBandpassList, bandpassNames)
+        bandpassDict = cls(bandpassList, bandpassNames, nativeGrids=nativeGrids)
+        hardwareBandpassDict = cls(hardwareBandpassList, bandpassNames, nativeGrids=nativeGrids)
+
+        if cacheName is not None:
+            _write_bandpass_cache(cacheDir, cacheName, [bandpassDict, hardwareBandpassDict])
 
         return bandpassDict, hardwareBandpassDict
 
@@ -153,7 +364,8 @@ class BandpassDict(object):
     def loadTotalBandpassesFromFiles(cls,
                                     bandpassNames=['u', 'g', 'r', 'i', 'z', 'y'],
                                     bandpassDir = os.path.join(getPackageDir('throughputs'),'baseline'),
-                                    bandpassRoot = 'total_'):
+                                    bandpassRoot = 'total_',
+                                    cacheDir=None, nativeGrids=False):
         """
         This will take the list of band passes named by bandpassNames and load them into
         a BandpassDict
@@ -174,17 +386,71 @@ class BandpassDict(object):
         if we want to load bandpasses for a telescope other than LSST, we would do so
         by altering bandpassDir and bandpassRoot
 
+        @param [in] cacheDir is an optional directory in which to cache the loaded
+        bandpasses (see loadBandpassesFromFiles)
+
+        @param [in] nativeGrids is passed to the BandpassDict (see __init__)
+
         @param [out] bandpassDict is a BandpassDict containing the loaded throughputs
         """
 
+        fileNames = [os.path.join(bandpassDir,"%s.dat" % (bandpassRoot + w)) for w in bandpassNames]
+
+        cacheName = None
+        if cacheDir is not None:
+            cacheName = _bandpass_cache_name('loadTotalBandpassesFromFiles', bandpassNames,
+                                             [[ff] for ff in fileNames])
+            cached = None if cacheName is None else _read_bandpass_cache(cacheDir, cacheName)
+            if cached is not None:
+                return cls._fromCachedArrays(bandpassNames, cached['wavelen_0'], cached['sb_0'], fileNames,
+                                             nativeGrids=nativeGrids)
+
         bandpassList = []
 
-        for w in bandpassNames:
+        for fileName in fileNames:
+            bandpassDummy = Bandpass()
+            bandpassDummy.readThroughput(fileName)
+            bandpassList.append(bandpassDummy)
+
+        bandpassDict = cls(bandpassList, bandpassNames, nativeGrids=nativeGrids)
+
+        if cacheName is not None:
+            _write_bandpass_cache(cacheDir, cacheName, [bandpassDict])
+
+        return bandpassDict
+
+
+    @classmethod
+    def _fromCachedArrays(cls, bandpassNames, wavelen, sbArray, sourceNames, nativeGrids=False):
+        """
+        This is a private method which will return a BandpassDict of Bandpasses
+        on the wavelength grid wavelen with throughputs given by the rows of sbArray
+        (see loadBandpassesFromFiles).  sourceNames are the bandpassnames the
+        Bandpasses would have been given had they been read from their files.
+        nativeGrids is passed to the BandpassDict (see __init__).
+        """
+        bandpassList = []
+        for sb, sourceName in zip(sbArray, sourceNames):
             bandpassDummy = Bandpass()
-            bandpassDummy.readThroughput(os.path.join(bandpassDir,"%s.dat" % (bandpassRoot + w)))
+            bandpassDummy.wavelen = wavelen
+            bandpassDummy.sb = sb
+            bandpassDummy.bandpassname = sourceName
             bandpassList.append(bandpassDummy)
+        return cls(bandpassList, bandpassNames, nativeGrids=nativeGrids)
+
 
-        return cls(bandpassList, bandpassNames)
+    def _resampledSed(self, sedobj):
+        """
+        This is a private method which will return a (read-only) copy of sedobj
+        resampled onto self._wavelen_match, with fnu calculated.
+
+        If sedobj is an unaltered template which has been cached on
+        self._wavelen_match with cache_resampled_seds, the cached
+        resampled flambda and fnu are used directly.  The copy is kept by
+        sedobj until sedobj is changed, so that BandpassDicts sharing a
+        wavelength grid resample and convert each Sed only once.
+        """
+        return sedobj._resampledCopy(self._wavelen_match)
 
 
     def _magListForSed(self, sedobj, indices=None):
@@ -199,25 +465,15 @@ class BandpassDict(object):
         if sedobj.wavelen is None:
             return [numpy.NaN]*len(self._bandpassDict)
         else:
-
-            #for some reason, moving this call to flambdaTofnu()
-            #to a point earlier in the
-            #process results in some SEDs having 'None' for fnu.
-            #
-            #I looked more carefully at the documentation in Sed.py
-            #Any time you update flambda in any way, fnu gets set to 'None'
-            #This is to prevent the two arrays from getting out synch
-            #(e.g. renormalizing flambda but forgettint to renormalize fnu)
-            #
-            sedobj.flambdaTofnu()
-
             if indices is not None:
                 outputList = [numpy.NaN] * len(self._bandpassDict)
-                magList = sedobj.manyMagCalc(self._phiArray, self._wavelenStep, observedBandpassInd=indices)
+                magList = sedobj.manyMagCalc(self._phiArray, self._wavelenStep, observedBandpassInd=indices,
+                                             phiSupport=self._phiSupport)
                 for i, ix in enumerate(indices):
                     outputList[ix] = magList[i]
             else:
-                outputList = sedobj.manyMagCalc(self._phiArray, self._wavelenStep)
+                outputList = sedobj.manyMagCalc(self._phiArray, self._wavelenStep,
+                                                phiSupport=self._phiSupport)
 
             return outputList
 
@@ -241,11 +497,14 @@ class BandpassDict(object):
         if sedobj.wavelen is not None:
 
             # If the Sed's wavelength grid agrees with self._wavelen_match to one part in
-            # 10^6, just use the Sed as-is.  Otherwise, copy it and resample it onto
-            # self._wavelen_match
+            # 10^6, just use the Sed as-is.  Otherwise, integrate it on its own grid
+            # (see _nativeIntegrator) or copy it and resample it onto self._wavelen_match
             if sedobj._needResample(wavelen_match=self._wavelen_match):
-                dummySed = Sed(wavelen=sedobj.wavelen, flambda=sedobj.flambda)
-                dummySed.resampleSED(force=True, wavelen_match=self._wavelen_match)
+                fingerprint = self._nativeGrid(sedobj)
+                if fingerprint is not None:
+                    fluxList = self._nativeFluxListForSed(sedobj, fingerprint, indices=indices)
+                    return -2.5*numpy.log10(fluxList) - sedobj.zp
+                dummySed = self._resampledSed(sedobj)
             else:
                 dummySed = sedobj
 
@@ -283,6 +542,211 @@ class BandpassDict(object):
         return outputDict
 
 
+    def _nativeIntegrator(self, wavelen, fingerprint):
+        """
+        This is a private method which will return the integration matrix of
+        the wavelength grid wavelen: a 2-D numpy array (one row per bandpass)
+        whose product with the flambda of an Sed sampled on wavelen is the flux
+        of that Sed in each bandpass (divided by self._wavelenStep).
+        Interpolating flambda onto self._wavelen_match, converting it into fnu
+        and integrating it over phi are all linear, so they are folded into
+        one matrix (see Resampler.fold) and no resampled copy is made.
+
+        Returns the matrix, the support of each of its rows (see Sed.setupPhiSupport)
+        and whether wavelen covers the whole of self._wavelen_match (if it does not,
+        the resampled Sed is NaN somewhere, and so are all of its fluxes; see
+        _nativeFluxListForSed).  The matrices of the most recently used grids are
+        kept, keyed on the fingerprint of the grid.
+        """
+        integrator = self._nativeIntegrators.pop(fingerprint, None)
+        if integrator is None:
+            phiFlambda = self._phiArray.astype(float)*self._fnuFactor
+            matrix = get_resampler(wavelen, self._wavelen_match).fold(phiFlambda)
+            # the test of Sed.resampleSED
+            covered = wavelen[0] <= self._wavelen_match[0] and wavelen[-1] >= self._wavelen_match[-1]
+            if not covered:
+                warnings.warn('There is an area of non-overlap between the wavelength range of '
+                              + 'the BandpassDict (%.2f to %.2f) ' % (self._wavelen_match.min(),
+                                                                     self._wavelen_match.max())
+                              + 'and a wavelength grid of Seds (%.2f to %.2f)' % (wavelen.min(),
+                                                                                   wavelen.max()))
+            integrator = (matrix, Sed().setupPhiSupport(matrix), covered)
+        self._nativeIntegrators[fingerprint] = integrator
+        while len(self._nativeIntegrators) > _max_native_integrators:
+            self._nativeIntegrators.popitem(last=False)
+        return integrator
+
+
+    def _nativeFluxListForSed(self, sedobj, fingerprint, indices=None):
+        """
+        This is a private method which will calculate the fluxes of sedobj,
+        which is sampled on a grid other than self._wavelen_match, directly
+        from its flambda with the integration matrix of its grid
+        (see _nativeIntegrator).  fingerprint is the fingerprint of its grid.
+
+        If sedobj does not cover self._wavelen_match, or its flambda is not
+        finite everywhere, its resampled copy is integrated instead, so that
+        its fluxes are NaN as they would be without nativeGrids.
+
+        The results are returned as a numpy array.
+        """
+        matrix, support, covered = self._nativeIntegrator(sedobj.wavelen, fingerprint)
+        flambda = sedobj.flambda
+        if not covered or not numpy.isfinite(flambda).all():
+            return numpy.array(self._fluxListForSed(self._resampledSed(sedobj), indices=indices))
+        if indices is None:
+            indices = range(len(self._bandpassDict))
+        fluxList = numpy.NaN*numpy.ones(len(self._bandpassDict), dtype=float)
+        for ix in indices:
+            first, last = support[ix]
+            fluxList[ix] = numpy.dot(matrix[ix, first:last], flambda[first:last])
+        fluxList *= self._wavelenStep
+        return fluxList
+
+
+    def _nativeGrid(self, sedobj):
+        """
+        This is a private method which will return the fingerprint of the grid
+        of sedobj (which is not on self._wavelen_match) if its fluxes are to be
+        calculated with the integration matrix of its grid (see _nativeIntegrator),
+        or None if they are to be calculated from a resampled copy of it.
+
+        Integration matrices are used for every grid if this BandpassDict was
+        created with nativeGrids=True, and for none otherwise (see __init__).
+        """
+        if self._nativeGrids:
+            return wavelen_grid_fingerprint(sedobj.wavelen)
+        return None
+
+
+    def _windowIntegrator(self, matrix, support, indices):
+        """
+        This is a private method which will restrict an integration matrix (one row
+        per bandpass; see _nativeIntegrator) to the rows in indices and to
+        the columns inside of the union of the supports of those rows.
+
+        Returns the first and last+1 columns of the window and the window of the
+        matrix (in float64).
+        """
+        support = [support[ix] for ix in indices]
+        nonEmpty = [ss for ss in support if ss[1] > ss[0]]
+        if len(nonEmpty) > 0:
+            first = min(ss[0] for ss in nonEmpty)
+            last = max(ss[1] for ss in nonEmpty)
+        else:
+            first = last = 0
+        matrixWindow = numpy.asarray(matrix[indices, first:last], dtype=float)
+        return first, last, matrixWindow
+
+
+    def _integrateSedStack(self, fluxStack, window):
+        """
+        This is a private method which will integrate a 2-D numpy array of flux
+        densities (one Sed per row, restricted to the columns of window) against
+        the window of an integration matrix (see _windowIntegrator) with one
+        matrix product.  The flux densities are expected to be finite.
+        """
+        fluxArray = numpy.dot(fluxStack, window[2].T)
+        fluxArray *= self._wavelenStep
+        return fluxArray
+
+
+    def _fluxArrayForSedList(self, sedList, indices=None):
+        """
+        This is a private method which will return a 2-D numpy array of the
+        fluxes of every Sed in sedList (the rows) in the bandpasses stored
+        in this Dict (the columns).
+
+        The flux densities of the Seds are stacked, _sed_stack_rows Seds at
+        a time, and integrated with one matrix product: the fnu of Seds on
+        self._wavelen_match against phiArray, their flambda (if fnu has not
+        been calculated) against phiArray times the conversion into fnu, and
+        the flambda of Seds on other grids against the integration matrix of
+        their grid (if this Dict was created with nativeGrids=True; see _nativeGrid).  Any other Sed is
+        replaced by its resampled copy (see _resampledSed).  Only the
+        wavelengths over which some integrand is non-zero are stacked.
+
+        Seds whose flux densities are not finite everywhere on the grid (e.g.
+        because they do not cover all of it) are not stacked, but integrated
+        over the whole grid by fluxListForSed, so that their fluxes are NaN.
+        """
+        outputArray = numpy.NaN*numpy.ones((len(sedList), len(self._bandpassDict)), dtype=float)
+        if indices is None:
+            indices = list(range(len(self._bandpassDict)))
+        else:
+            indices = list(indices)
+        if len(sedList) == 0 or len(indices) == 0:
+            return outputArray
+
+        columns = numpy.array(indices)
+
+        # the window of the integration matrix, the rows of outputArray,
+        # the flux densities of each stack and whether the grid of the Seds
+        # covers self._wavelen_match, keyed on the kind of Sed
+        stacks = OrderedDict()
+        for iSed, sedobj in enumerate(sedList):
+            if sedobj.wavelen is None:
+                continue
+            if sedobj._needResample(wavelen_match=self._wavelen_match):
+                key = self._nativeGrid(sedobj)
+                if key is not None:
+                    if key not in stacks:
+                        matrix, support, covered = self._nativeIntegrator(sedobj.wavelen, key)
+                        stacks[key] = (self._windowIntegrator(matrix, support, indices), [], [], covered)
+                    fluxes = sedobj.flambda
+                else:
+                    sedobj = self._resampledSed(sedobj)
+                    key = 'fnu'
+                    fluxes = sedobj.fnu
+            elif sedobj._fnu is not None:
+                # (fnu has already been calculated; sedobj.fnu would calculate it)
+                key = 'fnu'
+                fluxes = sedobj.fnu
+            else:
+                key = 'flambda'
+                fluxes = sedobj.flambda
+
+            if key not in stacks:
+                if key == 'fnu':
+                    matrix = self._phiArray
+                else:
+                    # fnu is flambda times a function of wavelength; fold that function
+                    # into phi rather than calculating fnu for each Sed
+                    matrix = self._phiArray*self._fnuFactor
+                stacks[key] = (self._windowIntegrator(matrix, self._phiSupport, indices), [], [], True)
+
+            window, rows, fluxStack, covered = stacks[key]
+            if not covered or not numpy.isfinite(fluxes).all():
+                outputArray[iSed] = self.fluxListForSed(sedobj, indices=indices)
+                continue
+            rows.append(iSed)
+            fluxStack.append(fluxes[window[0]:window[1]])
+            if len(rows) == _sed_stack_rows:
+                outputArray[numpy.ix_(rows, columns)] = \
+                    self._integrateSedStack(numpy.array(fluxStack, dtype=float), window)
+                stacks[key] = (window, [], [], covered)
+
+        for window, rows, fluxStack, covered in stacks.values():
+            if len(rows) > 0:
+                outputArray[numpy.ix_(rows, columns)] = \
+                    self._integrateSedStack(numpy.array(fluxStack, dtype=float), window)
+
+        return outputArray
+
+
+    def _structuredArray(self, valueArray):
+        """
+        This is a private method which will convert a 2-D numpy array of values
+        (one column per bandpass) into a numpy array keyed to the keys of this
+        BandpassDict, filled one column at a time.
+        """
+        dtype = numpy.dtype([(bp, float) for bp in self._bandpassDict.keys()])
+        outputArray = numpy.empty(len(valueArray), dtype=dtype)
+        for ix, bp in enumerate(self._bandpassDict.keys()):
+            outputArray[bp] = valueArray[:, ix]
+        return outputArray
+
+
     def magListForSedList(self, sedList, indices=None):
         """
         Return a 2-D array of magnitudes from a SedList.
@@ -300,6 +764,8 @@ class BandpassDict(object):
         SEDs into your SedList and make sure that wavelenMatch = myBandpassDict.wavelenMatch.
         That way, this method will not have to waste time resampling the Seds
         onto the wavelength grid of the BandpassDict.
+        The magnitudes of all of the Seds are then calculated together, with one
+        matrix product per block of Seds.
 
         @param [in] sedList is a SedList containing the Seds
         whose magnitudes are desired.
@@ -314,26 +780,9 @@ class BandpassDict(object):
         (the columns)
         """
 
-        one_at_a_time = False
-        if sedList.wavelenMatch is None:
-            one_at_a_time = True
-        elif sedList[0]._needResample(wavelen_match=self._wavelen_match):
-            one_at_a_time = True
-
-        output_list = []
-        if one_at_a_time:
-            for sed_obj in sedList:
-                sub_list = self.magListForSed(sed_obj, indices=indices)
-                output_list.append(sub_list)
-        else:
-            # the difference between this block and the block above is that the block
-            # above performs the additional check of making sure that sed_obj.wavelen
-            # is equivalent to self._wavelen_match
-            for sed_obj in sedList:
-                sub_list = self._magListForSed(sed_obj, indices=indices)
-                output_list.append(sub_list)
-
-        return numpy.array(output_list)
+        fluxArray = self._fluxArrayForSedList(sedList, indices=indices)
+        zp = numpy.array([sedobj.zp for sedobj in sedList], dtype=float)
+        return -2.5*numpy.log10(fluxArray) - zp[:, numpy.newaxis]
 
 
     def magArrayForSedList(self, sedList, indices=None):
@@ -367,11 +816,7 @@ class BandpassDict(object):
 
         magList = self.magListForSedList(sedList, indices=indices)
 
-        dtype = numpy.dtype([(bp, numpy.float) for bp in self._bandpassDict.keys()])
-
-        outputArray = numpy.array([tuple(row) for row in magList], dtype=dtype)
-
-        return outputArray
+        return self._structuredArray(magList)
 
 
     def _fluxListForSed(self, sedobj, indices=None):
@@ -386,25 +831,15 @@ class BandpassDict(object):
         if sedobj.wavelen is None:
             return [numpy.NaN]*len(self._bandpassDict)
         else:
-
-            #for some reason, moving this call to flambdaTofnu()
-            #to a point earlier in the
-            #process results in some SEDs having 'None' for fnu.
-            #
-            #I looked more carefully at the documentation in Sed.py
-            #Any time you update flambda in any way, fnu gets set to 'None'
-            #This is to prevent the two arrays from getting out synch
-            #(e.g. renormalizing flambda but forgettint to renormalize fnu)
-            #
-            sedobj.flambdaTofnu()
-
             if indices is not None:
                 outputList = [numpy.NaN] * len(self._bandpassDict)
-                magList = sedobj.manyFluxCalc(self._phiArray, self._wavelenStep, observedBandpassInd=indices)
+                magList = sedobj.manyFluxCalc(self._phiArray, self._wavelenStep, observedBandpassInd=indices,
+                                              phiSupport=self._phiSupport)
                 for i, ix in enumerate(indices):
                     outputList[ix] = magList[i]
             else:
-                outputList = sedobj.manyFluxCalc(self._phiArray, self._wavelenStep)
+                outputList = sedobj.manyFluxCalc(self._phiArray, self._wavelenStep,
+                                                 phiSupport=self._phiSupport)
 
             return outputList
 
@@ -433,11 +868,13 @@ class BandpassDict(object):
         if sedobj.wavelen is not None:
 
             # If the Sed's wavelength grid agrees with self._wavelen_match to one part in
-            # 10^6, just use the Sed as-is.  Otherwise, copy it and resample it onto
-            # self._wavelen_match
+            # 10^6, just use the Sed as-is.  Otherwise, integrate it on its own grid
+            # (see _nativeIntegrator) or copy it and resample it onto self._wavelen_match
             if sedobj._needResample(wavelen_match=self._wavelen_match):
-                dummySed = Sed(wavelen=sedobj.wavelen, flambda=sedobj.flambda)
-                dummySed.resampleSED(force=True, wavelen_match=self._wavelen_match)
+                fingerprint = self._nativeGrid(sedobj)
+                if fingerprint is not None:
+                    return self._nativeFluxListForSed(sedobj, fingerprint, indices=indices)
+                dummySed = self._resampledSed(sedobj)
             else:
                 dummySed = sedobj
 
@@ -496,6 +933,8 @@ class BandpassDict(object):
         SEDs into your SedList and make sure that wavelenMatch = myBandpassDict.wavelenMatch.
         That way, this method will not have to waste time resampling the Seds
         onto the wavelength grid of the BandpassDict.
+        The fluxes of all of the Seds are then calculated together, with one
+        matrix product per block of Seds.
 
         @param [in] sedList is a SedList containing the Seds
         whose fluxes are desired.
@@ -515,26 +954,7 @@ class BandpassDict(object):
         http://www.lsst.org/scientists/scibook
         """
 
-        one_at_a_time = False
-        if sedList.wavelenMatch is None:
-            one_at_a_time = True
-        elif sedList[0]._needResample(wavelen_match=self._wavelen_match):
-            one_at_a_time = True
-
-        output_list = []
-        if one_at_a_time:
-            for sed_obj in sedList:
-                sub_list = self.fluxListForSed(sed_obj, indices=indices)
-                output_list.append(sub_list)
-        else:
-            # the difference between this block and the block above is that the block
-            # above performs the additional check of making sure that sed_obj.wavelen
-            # is equivalent to self._wavelen_match
-            for sed_obj in sedList:
-                sub_list = self._fluxListForSed(sed_obj, indices=indices)
-                output_list.append(sub_list)
-
-        return numpy.array(output_list)
+        return self._fluxArrayForSedList(sedList, indices=indices)
 
 
     def fluxArrayForSedList(self, sedList, indices=None):
@@ -575,13 +995,336 @@ class BandpassDict(object):
 
         fluxList = self.fluxListForSedList(sedList, indices=indices)
 
-        dtype = numpy.dtype([(bp, numpy.float) for bp in self._bandpassDict.keys()])
+        return self._structuredArray(fluxList)
+
+
+    def _fluxArrayForSedBatch(self, sedBatch, indices=None):
+        """
+        This is a private method which will return a 2-D numpy array of the
+        fluxes of every SED in sedBatch (the rows) in the bandpasses
+        stored in this Dict (the columns), calculated with a single matrix
+        product.  If sedBatch is not on self._wavelen_match, a resampled
+        copy is used.
+        """
+        if sedBatch._needResample(self._wavelen_match):
+            sedBatch = SedBatch(sedBatch.wavelen, flambda=sedBatch.flambda, dtype=sedBatch.dtype)
+            sedBatch.resampleSED(self._wavelen_match)
+
+        if indices is not None:
+            outputArray = numpy.NaN*numpy.ones((len(sedBatch), len(self._bandpassDict)), dtype=float)
+            outputArray[:, indices] = sedBatch.manyFluxCalc(self._phiArray, self._wavelenStep,
+                                                            observedBandpassInd=indices)
+            return outputArray
 
-        outputArray = numpy.array([tuple(row) for row in fluxList], dtype=dtype)
+        return sedBatch.manyFluxCalc(self._phiArray, self._wavelenStep)
 
+
+    def _restFrameResampler(self, wavelen, fingerprint, redshift, first, last):
+        """
+        This is a private method which will return a Resampler from the rest-frame
+        grid wavelen onto self._wavelen_match[first:last] blueshifted by redshift.
+
+        Redshifting multiplies the wavelengths of an Sed by (1+z), so interpolating
+        the redshifted Sed onto self._wavelen_match is interpolating the rest-frame
+        Sed onto self._wavelen_match/(1+z).  The Resamplers (i.e. the interpolation
+        weights) for the most recently used grids and redshifts are kept.
+        """
+        key = (fingerprint, float(redshift), first, last)
+        resampler = self._restFrameResamplers.pop(key, None)
+        if resampler is None:
+            # the same arithmetic as Sed.redshiftSED
+            if redshift < 0:
+                restWavelen = self._wavelen_match[first:last]*(1.0-redshift)
+            else:
+                restWavelen = self._wavelen_match[first:last]/(1.0+redshift)
+            resampler = Resampler(wavelen, restWavelen)
+        self._restFrameResamplers[key] = resampler
+        while len(self._restFrameResamplers) > _max_rest_frame_resamplers:
+            self._restFrameResamplers.popitem(last=False)
+        return resampler
+
+
+    def _fluxArrayForRestFrameStack(self, wavelen, flambdaStack, redshifts, dimming=False):
+        """
+        This is a private method which will return a 3-D numpy array of the
+        fluxes of a stack of rest-frame Seds (the rows of the 2-D numpy array
+        flambdaStack, sampled on wavelen) redshifted to each of redshifts, in
+        each of the bandpasses stored in this Dict (the last axis).
+
+        At each redshift, the stack is interpolated onto the blueshifted
+        wavelengths over which some phi is non-zero (see _restFrameResampler)
+        and integrated with one matrix product.
+
+        As for redshifted Seds resampled onto self._wavelen_match, the fluxes at
+        redshifts at which wavelen does not cover the whole grid are NaN, and
+        Seds whose flambda is not finite everywhere are redshifted and
+        integrated over the whole grid (see fluxListForSed).
+        """
+        fingerprint = wavelen_grid_fingerprint(wavelen)
+        redshifts = numpy.atleast_1d(redshifts)
+        allIndices = list(range(len(self._bandpassDict)))
+        # fnu is flambda times a function of the observed wavelength
+        # (see _fluxArrayForSedList)
+        window = self._windowIntegrator(self._phiArray*self._fnuFactor, self._phiSupport, allIndices)
+        finite = numpy.isfinite(flambdaStack).all(axis=1)
+        outputArray = numpy.empty((len(flambdaStack), len(redshifts), len(allIndices)), dtype=float)
+        for iz, redshift in enumerate(redshifts):
+            # the same arithmetic as Sed.redshiftSED
+            if redshift < 0:
+                restMatch = self._wavelen_match[[0, -1]]*(1.0-redshift)
+            else:
+                restMatch = self._wavelen_match[[0, -1]]/(1.0+redshift)
+            if wavelen[0] > restMatch[0] or wavelen[-1] < restMatch[1]:
+                outputArray[:, iz, :] = numpy.NaN
+                continue
+            resampler = self._restFrameResampler(wavelen, fingerprint, redshift, window[0], window[1])
+            for start in range(0, len(flambdaStack), _sed_stack_rows):
+                stop = start + _sed_stack_rows
+                outputArray[start:stop, iz, :] = self._integrateSedStack(
+                    resampler.resample(flambdaStack[start:stop]), window)
+            for iSed in numpy.flatnonzero(~finite):
+                sedobj = Sed(wavelen=wavelen, flambda=flambdaStack[iSed])
+                sedobj.redshiftSED(redshift)
+                outputArray[iSed, iz, :] = self.fluxListForSed(sedobj)
+            if dimming:
+                # cosmological dimming divides flambda by (1+z) (see Sed.redshiftSED)
+                if redshift < 0:
+                    outputArray[:, iz, :] *= (1.0-redshift)
+                else:
+                    outputArray[:, iz, :] /= (1.0+redshift)
         return outputArray
 
 
+    def fluxListForRedshiftedSed(self, sedobj, redshifts, dimming=False, indices=None):
+        """
+        Return a 2-D array of the fluxes of a rest-frame Sed at many redshifts.
+        Each row will correspond to a different redshift, each column will
+        correspond to a different bandpass, i.e. the fluxes are those of
+
+        sedobj.redshiftSED(redshifts[i], dimming=dimming)
+        myBandpassDict.fluxListForSed(sedobj)
+
+        but the Sed is not redshifted: each bandpass is mapped onto the rest
+        frame of the Sed instead (its wavelengths are divided by (1+z)), and the
+        Sed is only interpolated onto the wavelengths where some bandpass is non-zero.
+        The interpolation weights are kept for each redshift, so they are reused
+        by every Sed on the same grid at the same redshift.
+
+        @param [in] sedobj is an Sed object in its rest frame.  It is not changed.
+
+        @param [in] redshifts is a numpy array of redshifts
+
+        @param [in] dimming is a boolean indicating whether to add cosmological
+        dimming (as in Sed.redshiftSED)
+
+        @param [in] indices is an optional list of indices indicating which bandpasses to actually
+        calculate fluxes for.  Other fluxes will be listed as numpy.NaN
+
+        @param [out] a 2-D numpy array containing the fluxes of sedobj at
+        each redshift (the rows) in each bandpass contained in this BandpassDict
+        (the columns)
+
+        Note on units: Fluxes calculated this way will be the flux density integrated over the
+        weighted response curve of the bandpass.  See equaiton 2.1 of the LSST Science Book
+
+        http://www.lsst.org/scientists/scibook
+        """
+        redshifts = numpy.atleast_1d(redshifts)
+        if sedobj.wavelen is None:
+            return numpy.NaN*numpy.ones((len(redshifts), len(self._bandpassDict)), dtype=float)
+
+        flambdaStack = numpy.asarray(sedobj.flambda, dtype=float)[numpy.newaxis, :]
+        outputArray = self._fluxArrayForRestFrameStack(sedobj.wavelen, flambdaStack, redshifts,
+                                                       dimming=dimming)[0]
+        if indices is not None:
+            unused = numpy.ones(len(self._bandpassDict), dtype=bool)
+            unused[indices] = False
+            outputArray[:, unused] = numpy.NaN
+        return outputArray
+
+
+    def magListForRedshiftedSed(self, sedobj, redshifts, dimming=False, indices=None):
+        """
+        Return a 2-D array of the magnitudes of a rest-frame Sed at many redshifts.
+        Each row will correspond to a different redshift, each column will
+        correspond to a different bandpass (see fluxListForRedshiftedSed).
+
+        @param [in] sedobj is an Sed object in its rest frame.  It is not changed.
+
+        @param [in] redshifts is a numpy array of redshifts
+
+        @param [in] dimming is a boolean indicating whether to add cosmological
+        dimming (as in Sed.redshiftSED)
+
+        @param [in] indices is an optional list of indices indicating which bandpasses to actually
+        calculate magnitudes for.  Other magnitudes will be listed as numpy.NaN
+
+        @param [out] a 2-D numpy array containing the magnitudes of sedobj at
+        each redshift (the rows) in each bandpass contained in this BandpassDict
+        (the columns)
+        """
+        fluxArray = self.fluxListForRedshiftedSed(sedobj, redshifts, dimming=dimming, indices=indices)
+        return -2.5*numpy.log10(fluxArray) - sedobj.zp
+
+
+    def magListForSedBatch(self, sedBatch, indices=None):
+        """
+        Return a 2-D array of magnitudes from a SedBatch.
+        Each row will correspond to a different SED, each column
+        will correspond to a different bandpass (as in magListForSedList).
+
+        All of the magnitudes are calculated with a single matrix product.
+        For maximum efficiency, make sure that the wavelength grid of sedBatch
+        is myBandpassDict.wavelenMatch; otherwise, a resampled copy of the
+        batch will be made.
+
+        @param [in] sedBatch is a SedBatch containing the SEDs
+        whose magnitudes are desired.
+
+        @param [in] indices is an optional list of indices indicating which bandpasses to actually
+        calculate magnitudes for.  Other magnitudes will be listed as numpy.NaN
+
+        @param [out] a 2-D numpy array containing the magnitudes
+        of each SED (the rows) in each bandpass contained in this BandpassDict
+        (the columns).  SEDs with no flux in a bandpass get sedBatch.badval
+        (see SedBatch.magFromFlux).
+        """
+        fluxArray = self._fluxArrayForSedBatch(sedBatch, indices=indices)
+        magArray = sedBatch.magFromFlux(fluxArray)
+        if indices is not None:
+            unused = numpy.ones(len(self._bandpassDict), dtype=bool)
+            unused[list(indices)] = False
+            magArray[:, unused] = numpy.NaN
+        return magArray
+
+
+    def fluxListForSedBatch(self, sedBatch, indices=None):
+        """
+        Return a 2-D array of fluxes from a SedBatch.
+        Each row will correspond to a different SED, each column
+        will correspond to a different bandpass (as in fluxListForSedList).
+
+        All of the fluxes are calculated with a single matrix product.
+        For maximum efficiency, make sure that the wavelength grid of sedBatch
+        is myBandpassDict.wavelenMatch; otherwise, a resampled copy of the
+        batch will be made.
+
+        @param [in] sedBatch is a SedBatch containing the SEDs
+        whose fluxes are desired.
+
+        @param [in] indices is an optional list of indices indicating which bandpasses to actually
+        calculate fluxes for.  Other fluxes will be listed as numpy.NaN
+
+        @param [out] a 2-D numpy array containing the fluxes
+        of each SED (the rows) in each bandpass contained in this BandpassDict
+        (the columns)
+
+        Note on units: Fluxes calculated this way will be the flux density integrated over the
+        weighted response curve of the bandpass.  See equaiton 2.1 of the LSST Science Book
+
+        http://www.lsst.org/scientists/scibook
+        """
+        return self._fluxArrayForSedBatch(sedBatch, indices=indices)
+
+
+    def dustMagTableForSed(self, sedobj, avGrid=None, rvGrid=None):
+        """
+        Return the DustMagTable of the change in magnitude caused by CCM dust
+        in each bandpass of this dict for sedobj.  Tables are built the first
+        time they are requested and cached on this BandpassDict (up to
+        _max_dust_mag_tables of them), keyed on the grids and on the shape of
+        sedobj but not its normalization (which does not change the change in
+        magnitude), so that every Sed made from the same template reuses the
+        same table, whatever its magNorm.
+
+        @param [in] sedobj is the (dust-free) Sed
+
+        @param [in] avGrid is the grid of A_v values on which to sample the table
+        (default: 0 to 10 in steps of 0.1)
+
+        @param [in] rvGrid is the grid of R_v values on which to sample the table
+        (default: the single value 3.1)
+
+        @param [out] a DustMagTable.  Its maxError member is the largest absolute
+        error of the interpolated magnitudes in each bandpass.
+        """
+        key = (_wavelen_grid_hash(sedobj.wavelen), _sed_shape_hash(sedobj.flambda),
+               None if avGrid is None else _wavelen_grid_hash(avGrid),
+               None if rvGrid is None else _wavelen_grid_hash(rvGrid))
+
+        table = self._dustMagTables.pop(key, None)
+        if table is None:
+            table = DustMagTable(self, sedobj, avGrid=avGrid, rvGrid=rvGrid)
+        self._dustMagTables[key] = table
+        while len(self._dustMagTables) > _max_dust_mag_tables:
+            self._dustMagTables.popitem(last=False)
+        return table
+
+
+    def dustMagListForSed(self, sedobj, A_v, R_v=3.1, avGrid=None, rvGrid=None):
+        """
+        Return the change in magnitude caused by CCM dust for objects
+        whose spectrum is sedobj, interpolated in the (cached) DustMagTable
+        of sedobj.  Adding the result to the dust-free magnitudes of the
+        objects (e.g. from magListForSed) applies the extinction without
+        any operation on the spectrum.
+
+        @param [in] sedobj is the (dust-free) Sed shared by the objects
+
+        @param [in] A_v is a value or an array of values of A_v (within avGrid)
+
+        @param [in] R_v is a value or an array of values of R_v (within rvGrid)
+
+        @param [in] avGrid and rvGrid are the grids of the table
+        (see dustMagTableForSed; by default A_v may be between 0 and 10
+        and R_v must be 3.1)
+
+        @param [out] a 2-D numpy array of the change in magnitude of each object
+        (the rows) in each bandpass of this dict (the columns)
+        """
+        table = self.dustMagTableForSed(sedobj, avGrid=avGrid, rvGrid=rvGrid)
+        return table.deltaMagList(A_v, R_v=R_v)
+
+
+    def redshiftFluxTableForSedList(self, sedList, zGrid=None, dimming=True, sedNames=None):
+        """
+        Return a RedshiftFluxTable of the fluxes in each bandpass of this dict
+        of each template in sedList, on a grid of redshifts.  The fluxes and
+        magnitudes of objects drawn from the templates can then be interpolated
+        in the table (see RedshiftFluxTable.fluxArray and magArray), at a cost
+        per object which does not depend on the number of wavelengths.
+
+        @param [in] sedList is a list (or SedList) of rest-frame Seds
+
+        @param [in] zGrid is the grid of redshifts on which to sample the table
+        (default: 0 to 4 in steps of 0.01)
+
+        @param [in] dimming is a boolean indicating whether to add cosmological
+        dimming (as in Sed.redshiftSED; default True)
+
+        @param [in] sedNames is an optional list of the names of the templates
+        (default: the name of each Sed)
+
+        @param [out] a RedshiftFluxTable.  Its maxError member is the largest absolute
+        error (in magnitudes) of the interpolated fluxes of each template in each bandpass.
+        The table can be saved with its writeToFile method.
+        """
+        return RedshiftFluxTable(self, sedList, zGrid=zGrid, dimming=dimming, sedNames=sedNames)
+
+
+    def loadRedshiftFluxTable(self, fileName):
+        """
+        Read a RedshiftFluxTable written by RedshiftFluxTable.writeToFile.
+        A ValueError is raised if the table was not built for the bandpasses
+        of this dict.
+
+        @param [in] fileName is the name of the file to read
+
+        @param [out] a RedshiftFluxTable
+        """
+        return RedshiftFluxTable.readFromFile(fileName, bandpassDict=self)
+
+
     @property
     def phiArray(self):
         """
@@ -591,6 +1334,16 @@ class BandpassDict(object):
         return self._phiArray
 
 
+    @property
+    def phiSupport(self):
+        """
+        A tuple of (first, last+1) index pairs, one per bandpass in this dict,
+        giving the range of wavelenMatch over which phi is non-zero
+        (see Sed.setupPhiSupport).
+        """
+        return self._phiSupport
+
+
     @property
     def wavelenStep(self):
         """
@@ -0,0 +1,194 @@
+"""
+DustMagTable -
+
+A table of the change in magnitude, in each bandpass of a BandpassDict, caused
+by applying CCM dust (Sed.addCCMDust) to one SED, sampled on a grid of A_v and
+R_v.  Once a table has been built, the extinction of any number of objects that
+share the SED can be added to their (dust-free) magnitudes by bilinear
+interpolation in the table, without touching the spectrum.
+
+The change in magnitude does not depend on the normalization of the SED, so one
+table serves every object drawn from a template (e.g. every star with a given
+Kurucz model), whatever its magNorm.
+
+The accuracy of the interpolation is measured when the table is built: the
+exact change in magnitude is calculated at the midpoint of every grid cell
+(where the error of linear interpolation of a smooth function is largest) and
+compared to the interpolated value.  The largest absolute difference in each
+bandpass is stored in maxError.
+
+The table is interpolated linearly in A_v and in 1/R_v (the CCM extinction
+curve a(x) + b(x)/R_v is linear in 1/R_v).
+"""
+
+from builtins import object
+import warnings
+import numpy
+from .SedBatch import SedBatch
+
+__all__ = ["DustMagTable"]
+
+
+def _check_grid(grid, name):
+    """
+    Return grid as a 1-D numpy array of floats, raising a ValueError if it is
+    not strictly increasing.
+    """
+    grid = numpy.atleast_1d(numpy.array(grid, dtype=float))
+    if grid.ndim != 1 or len(grid) == 0:
+        raise ValueError("%s must be a 1-D array of values" % name)
+    if numpy.any(numpy.diff(grid) <= 0.0):
+        raise ValueError("%s must be strictly increasing" % name)
+    return grid
+
+
+def _grid_cell(grid, values, name, inverse=False, table_name='DustMagTable'):
+    """
+    Locate values on grid for linear interpolation.
+
+    @param [in] grid is a strictly increasing 1-D numpy array
+
+    @param [in] values is a numpy array of points to locate
+
+    @param [in] name is the name of the grid (used in error messages)
+
+    @param [in] inverse is a boolean; if True the interpolation is
+    linear in 1/values rather than in values
+
+    @param [in] table_name is the name of the table (used in error messages)
+
+    @param [out] i_lo is the index of the lower grid point of the cell
+    containing each value
+
+    @param [out] weight is the weight of grid point i_lo+1 for each value
+    (i_lo is 0 and weight is 0 if the grid has a single point)
+    """
+    if len(grid) == 1:
+        if not numpy.allclose(values, grid[0], rtol=1.0e-10, atol=0.0):
+            raise ValueError("This %s was only built for %s = %e" % (table_name, name, grid[0]))
+        return numpy.zeros(values.shape, dtype=int), numpy.zeros(values.shape)
+
+    if numpy.any(values < grid[0]) or numpy.any(values > grid[-1]) or numpy.any(numpy.isnan(values)):
+        raise ValueError("%s outside the range [%e, %e] of this %s"
+                         % (name, grid[0], grid[-1], table_name))
+
+    if inverse:
+        # -1/x is increasing on the (positive) grid
+        grid = -1.0/grid
+        values = -1.0/values
+
+    i_lo = numpy.clip(numpy.searchsorted(grid, values, side='right')-1, 0, len(grid)-2)
+    weight = (values - grid[i_lo])/(grid[i_lo+1] - grid[i_lo])
+    return i_lo, weight
+
+
+class DustMagTable(object):
+    """
+    A table of the change in magnitude caused by CCM dust in each bandpass
+    of a BandpassDict, for one SED, as a function of A_v and R_v.
+
+    Tables are usually obtained from BandpassDict.dustMagTableForSed, which
+    caches one table per SED.
+    """
+
+    def __init__(self, bandpassDict, sedobj, avGrid=None, rvGrid=None):
+        """
+        @param [in] bandpassDict is the BandpassDict in whose bandpasses
+        the changes in magnitude are calculated
+
+        @param [in] sedobj is the (dust-free) Sed.  Dust is applied after the SED
+        has been resampled onto bandpassDict.wavelenMatch (as SedList does when it
+        is given wavelenMatch).
+
+        @param [in] avGrid is the increasing grid of A_v values on which the table
+        is sampled (default: 0 to 10 in steps of 0.1)
+
+        @param [in] rvGrid is the increasing grid of R_v values on which the table
+        is sampled (default: the single value 3.1)
+        """
+        if avGrid is None:
+            avGrid = numpy.linspace(0.0, 10.0, 101)
+        if rvGrid is None:
+            rvGrid = [3.1]
+
+        self.avGrid = _check_grid(avGrid, 'avGrid')
+        self.rvGrid = _check_grid(rvGrid, 'rvGrid')
+        if self.rvGrid[0] <= 0.0:
+            raise ValueError("rvGrid must be positive")
+        if len(self.avGrid) < 2:
+            raise ValueError("avGrid must contain at least two values")
+        self.bandpassNames = bandpassDict.keys()
+
+        resampled = bandpassDict._resampledSed(sedobj)
+        self._wavelen = resampled.wavelen
+        self._flambda = resampled.flambda
+        self._bandpassDict = bandpassDict
+        self._mag0 = bandpassDict.magListForSedBatch(SedBatch(self._wavelen,
+                                                              flambda=self._flambda[numpy.newaxis, :]))[0]
+
+        self.deltaMag = self._calcDeltaMag(self.avGrid, self.rvGrid)
+        self.maxError = self._calcMaxError()
+
+        # only needed while the table is built
+        del self._wavelen, self._flambda, self._bandpassDict
+
+    def _calcDeltaMag(self, avValues, rvValues):
+        """
+        Calculate the exact change in magnitude on the grid avValues x rvValues.
+        Returns an array of shape (len(rvValues), len(avValues), number of bandpasses).
+        """
+        batch = SedBatch(self._wavelen, flambda=self._flambda[numpy.newaxis, :])
+        a_x, b_x = batch.setupCCMab()
+        deltaMag = numpy.zeros((len(rvValues), len(avValues), len(self.bandpassNames)), dtype=float)
+        for ix, rv in enumerate(rvValues):
+            batch = SedBatch(self._wavelen, flambda=numpy.tile(self._flambda, (len(avValues), 1)))
+            batch.addCCMDust(a_x, b_x, A_v=avValues, R_v=rv)
+            deltaMag[ix] = self._bandpassDict.magListForSedBatch(batch) - self._mag0
+        return deltaMag
+
+    def _calcMaxError(self):
+        """
+        Compare the interpolated table to the exact change in magnitude at the
+        midpoints of the grid cells.  Returns the largest absolute difference in
+        each bandpass.
+        """
+        avTest = 0.5*(self.avGrid[1:] + self.avGrid[:-1])
+        # the R_v nodes test interpolation in A_v alone, the midpoints (in 1/R_v) test both
+        rvMid = 2.0/(1.0/self.rvGrid[1:] + 1.0/self.rvGrid[:-1])
+        rvTest = numpy.sort(numpy.concatenate((self.rvGrid, rvMid)))
+        exact = self._calcDeltaMag(avTest, rvTest)
+
+        avValues = numpy.tile(avTest, len(rvTest))
+        rvValues = numpy.repeat(rvTest, len(avTest))
+        interpolated = self.deltaMagList(avValues, R_v=rvValues)
+        error = numpy.abs(interpolated - exact.reshape(-1, len(self.bandpassNames)))
+        with warnings.catch_warnings():
+            # bandpasses the SED does not cover have NaN magnitudes
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return numpy.nanmax(error, axis=0)
+
+    def deltaMagList(self, A_v, R_v=3.1):
+        """
+        Return the change in magnitude caused by CCM dust, interpolated
+        in the table.
+
+        @param [in] A_v is a value or an array of values of A_v
+
+        @param [in] R_v is a value or an array of values of R_v (default 3.1)
+
+        @param [out] a 2-D numpy array of the change in magnitude (to be added
+        to the dust-free magnitudes) of each object (the rows) in each bandpass
+        (the columns).  Raises a ValueError if A_v or R_v are outside of the table.
+        """
+        A_v, R_v = numpy.broadcast_arrays(numpy.atleast_1d(numpy.asarray(A_v, dtype=float)),
+                                          numpy.asarray(R_v, dtype=float))
+        i_av, w_av = _grid_cell(self.avGrid, A_v, 'A_v')
+        i_rv, w_rv = _grid_cell(self.rvGrid, R_v, 'R_v', inverse=True)
+        w_av = w_av[:, numpy.newaxis]
+        w_rv = w_rv[:, numpy.newaxis]
+
+        lower = self.deltaMag[i_rv, i_av]*(1.0-w_av) + self.deltaMag[i_rv, i_av+1]*w_av
+        if len(self.rvGrid) == 1:
+            return lower
+        upper = self.deltaMag[i_rv+1, i_av]*(1.0-w_av) + self.deltaMag[i_rv+1, i_av+1]*w_av
+        return lower*(1.0-w_rv) + upper*w_rv
@@ -0,0 +1,254 @@
+"""
+RedshiftFluxTable -
+
+A table of the flux, in each bandpass of a BandpassDict, of each template in a
+library of (rest-frame) SEDs, sampled on a grid of redshifts.  Once a table has
+been built, the fluxes (or magnitudes) of any number of objects drawn from the
+library can be found by linear interpolation in redshift, at a cost which does
+not depend on the number of wavelengths in the templates:
+
+    table = bandpassDict.redshiftFluxTableForSedList(sedList)
+    fluxes = table.fluxArray(templateIndex, redshift, magNorm=magNorm)
+
+Cosmological dimming (see Sed.redshiftSED) is folded into the table when it is
+built.  magNorm is the magnitude of the rest-frame template in the imsim
+bandpass (see getImsimFluxNorm), as in SedList; the magnitude of each template
+in the imsim bandpass is stored with the table, so normalizing an object is a
+multiplication of the interpolated fluxes.
+
+The fluxes are calculated with BandpassDict.fluxListForRedshiftedSed, which
+gives the same fluxes as redshifting and integrating each template.  The
+accuracy of the interpolation is measured when the table is built: the exact
+fluxes are calculated at the midpoint of every redshift cell and compared to
+the interpolated ones.  The largest absolute difference in magnitude for each
+template in each bandpass is stored in maxError.
+
+Tables can be written to a .npz file (writeToFile) and read back
+(RedshiftFluxTable.readFromFile or BandpassDict.loadRedshiftFluxTable).
+A table records the bandpasses it was built for, and refuses to be loaded
+for a BandpassDict with different bandpasses.
+"""
+
+from builtins import object
+import hashlib
+import os
+import warnings
+import numpy
+from .Sed import Sed
+from .SedUtils import _getImsimMag
+from .WavelenGrids import wavelen_grid_fingerprint
+from .DustMagTable import _check_grid, _grid_cell
+
+__all__ = ["RedshiftFluxTable"]
+
+
+def _bandpass_dict_hash(bandpassDict):
+    """
+    Return a hash of the names, wavelength grid and phi arrays of a BandpassDict
+    """
+    md5 = hashlib.md5()
+    md5.update('\n'.join(bandpassDict.keys()).encode('utf-8'))
+    md5.update(numpy.ascontiguousarray(bandpassDict.wavelenMatch, dtype=float).tobytes())
+    md5.update(numpy.ascontiguousarray(bandpassDict.phiArray, dtype=float).tobytes())
+    return md5.hexdigest()
+
+
+class RedshiftFluxTable(object):
+    """
+    A table of the fluxes in each bandpass of a BandpassDict of a library
+    of rest-frame templates, as a function of redshift.
+
+    Tables are usually obtained from BandpassDict.redshiftFluxTableForSedList.
+    """
+
+    def __init__(self, bandpassDict, sedList, zGrid=None, dimming=True, sedNames=None):
+        """
+        @param [in] bandpassDict is the BandpassDict in whose bandpasses
+        the fluxes are calculated
+
+        @param [in] sedList is a list (or SedList) of rest-frame Sed objects.
+        They are not changed.
+
+        @param [in] zGrid is the increasing grid of redshifts on which the table
+        is sampled (default: 0 to 4 in steps of 0.01)
+
+        @param [in] dimming is a boolean indicating whether to add cosmological
+        dimming (as in Sed.redshiftSED; default True)
+
+        @param [in] sedNames is an optional list of the names of the templates
+        (default: the name of each Sed)
+        """
+        if zGrid is None:
+            zGrid = numpy.linspace(0.0, 4.0, 401)
+
+        self.zGrid = _check_grid(zGrid, 'zGrid')
+        if len(self.zGrid) < 2:
+            raise ValueError("zGrid must contain at least two values")
+        if self.zGrid[0] <= -1.0:
+            raise ValueError("zGrid must be greater than -1")
+        self.dimming = bool(dimming)
+        self.bandpassNames = bandpassDict.keys()
+
+        sedList = list(sedList)
+        if sedNames is None:
+            sedNames = [sedobj.name for sedobj in sedList]
+        if len(sedNames) != len(sedList):
+            raise ValueError("You passed %d sedNames for %d Seds" % (len(sedNames), len(sedList)))
+        self.sedNames = [str(name) for name in sedNames]
+
+        self.imsimMag = numpy.empty(len(sedList), dtype=float)
+        # the templates are integrated in stacks of Seds on the same grid
+        self._groups = {}
+        for ix, sedobj in enumerate(sedList):
+            wavelen = sedobj.wavelen
+            flambda = numpy.asarray(sedobj.flambda, dtype=float)
+            try:
+                self.imsimMag[ix] = _getImsimMag(Sed(wavelen=wavelen, flambda=flambda))
+            except RuntimeError:
+                # this template cannot be normalized in the imsim bandpass
+                self.imsimMag[ix] = numpy.NaN
+            group = self._groups.setdefault(wavelen_grid_fingerprint(wavelen), (wavelen, [], []))
+            group[1].append(ix)
+            group[2].append(flambda)
+        self._bandpassDict = bandpassDict
+
+        self.flux = self._calcFlux(self.zGrid)
+        self.maxError = self._calcMaxError()
+        self._bandpassHash = _bandpass_dict_hash(bandpassDict)
+
+        # only needed while the table is built
+        del self._groups, self._bandpassDict
+
+    def _calcFlux(self, redshifts):
+        """
+        Calculate the exact fluxes of every template at redshifts.  Returns an
+        array of shape (number of templates, len(redshifts), number of bandpasses).
+        """
+        flux = numpy.empty((len(self.sedNames), len(redshifts), len(self.bandpassNames)), dtype=float)
+        for wavelen, indices, flambdaList in self._groups.values():
+            flux[indices] = self._bandpassDict._fluxArrayForRestFrameStack(wavelen,
+                                                                           numpy.array(flambdaList),
+                                                                           redshifts,
+                                                                           dimming=self.dimming)
+        return flux
+
+    def _calcMaxError(self):
+        """
+        Compare the interpolated table to the exact fluxes at the midpoints of
+        the redshift cells.  Returns the largest absolute difference in magnitude
+        for each template (the rows) in each bandpass (the columns).
+        """
+        zTest = 0.5*(self.zGrid[1:] + self.zGrid[:-1])
+        exact = self._calcFlux(zTest)
+
+        templateIndex = numpy.repeat(numpy.arange(len(self.sedNames)), len(zTest))
+        interpolated = self.fluxArray(templateIndex, numpy.tile(zTest, len(self.sedNames)))
+        interpolated = interpolated.reshape(exact.shape)
+        with warnings.catch_warnings():
+            # bandpasses the templates do not cover have NaN (or zero) fluxes
+            warnings.simplefilter('ignore', RuntimeWarning)
+            error = numpy.abs(2.5*numpy.log10(interpolated/exact))
+            return numpy.nanmax(error, axis=1)
+
+    def fluxArray(self, templateIndex, redshift, magNorm=None):
+        """
+        Return the fluxes of objects, interpolated in the table.
+
+        @param [in] templateIndex is an index or an array of indices of the
+        template (in the list the table was built from) of each object
+
+        @param [in] redshift is a value or an array of values of the redshift
+        of each object
+
+        @param [in] magNorm is an optional value or array of values of the
+        magnitude of each (rest-frame) object in the imsim bandpass.
+        If None, the templates are not renormalized.
+
+        @param [out] a 2-D numpy array of the flux of each object (the rows)
+        in each bandpass (the columns).  Raises a ValueError if redshift is
+        outside of the table.
+        """
+        templateIndex, redshift = numpy.broadcast_arrays(
+            numpy.atleast_1d(numpy.asarray(templateIndex, dtype=int)),
+            numpy.asarray(redshift, dtype=float))
+        i_z, w_z = _grid_cell(self.zGrid, redshift, 'redshift', table_name='RedshiftFluxTable')
+        w_z = w_z[:, numpy.newaxis]
+
+        flux = self.flux[templateIndex, i_z]*(1.0-w_z) + self.flux[templateIndex, i_z+1]*w_z
+        if magNorm is not None:
+            # see getImsimFluxNorm
+            fluxNorm = numpy.power(10.0, -0.4*(numpy.asarray(magNorm, dtype=float) -
+                                               self.imsimMag[templateIndex]))
+            flux *= fluxNorm[:, numpy.newaxis]
+        return flux
+
+    def magArray(self, templateIndex, redshift, magNorm=None):
+        """
+        Return the magnitudes of objects, interpolated in the table
+        (see fluxArray).
+
+        @param [in] templateIndex is an index or an array of indices of the
+        template of each object
+
+        @param [in] redshift is a value or an array of values of the redshift
+        of each object
+
+        @param [in] magNorm is an optional value or array of values of the
+        magnitude of each (rest-frame) object in the imsim bandpass
+
+        @param [out] a 2-D numpy array of the magnitude of each object (the rows)
+        in each bandpass (the columns)
+        """
+        return -2.5*numpy.log10(self.fluxArray(templateIndex, redshift, magNorm=magNorm)) - Sed().zp
+
+    def matchesBandpassDict(self, bandpassDict):
+        """
+        Return True if this table was built for the bandpasses of bandpassDict
+        """
+        return self._bandpassHash == _bandpass_dict_hash(bandpassDict)
+
+    def writeToFile(self, fileName):
+        """
+        Write this table to a numpy .npz file.
+
+        @param [in] fileName is the name of the file to write
+        """
+        with open(fileName + '.tmp', 'wb') as file_handle:
+            numpy.savez(file_handle,
+                        zGrid=self.zGrid,
+                        flux=self.flux,
+                        maxError=self.maxError,
+                        imsimMag=self.imsimMag,
+                        dimming=numpy.array(self.dimming),
+                        sedNames=numpy.array(self.sedNames, dtype=str),
+                        bandpassNames=numpy.array(self.bandpassNames, dtype=str),
+                        bandpassHash=numpy.array(self._bandpassHash))
+        os.rename(fileName + '.tmp', fileName)
+
+    @classmethod
+    def readFromFile(cls, fileName, bandpassDict=None):
+        """
+        Read a table written by writeToFile.
+
+        @param [in] fileName is the name of the file to read
+
+        @param [in] bandpassDict is an optional BandpassDict.  If it is given,
+        a ValueError is raised unless the table was built for its bandpasses.
+
+        @param [out] a RedshiftFluxTable
+        """
+        table = cls.__new__(cls)
+        with numpy.load(fileName) as data:
+            table.zGrid = data['zGrid']
+            table.flux = data['flux']
+            table.maxError = data['maxError']
+            table.imsimMag = data['imsimMag']
+            table.dimming = bool(data['dimming'])
+            table.sedNames = [str(name) for name in data['sedNames']]
+            table.bandpassNames = [str(name) for name in data['bandpassNames']]
+            table._bandpassHash = str(data['bandpassHash'])
+
+        if bandpassDict is not None and not table.matchesBandpassDict(bandpassDict):
+            raise ValueError("The RedshiftFluxTable in %s was not built for the bandpasses "
+                             "of this BandpassDict" % fileName)
+        return table
@@ -0,0 +1,209 @@
+"""
+Resampler -
+
+Linear interpolation from one wavelength grid onto another, with the
+bracketing indices and interpolation weights computed once per pair of grids.
+
+Sed.resampleSED and Bandpass.resampleBandpass interpolate every spectrum or
+throughput they are given, but most of them share a handful of grids (every
+Kurucz template is sampled on the same wavelengths, as is every BC03 template,
+and everything is resampled onto the grid of the bandpasses).  A Resampler
+holds the result of the search for the bracketing source points of every target
+point; applying it to a spectrum (or to a 2-D stack of spectra sampled on the
+same grid) is a gather plus a multiply-add.  The result is identical to
+numpy.interp.
+
+get_resampler() returns a cached Resampler for a pair of grids, so the
+search is only done the first time a pair of grids is seen.
+"""
+
+from builtins import object
+import threading
+import numpy
+from collections import OrderedDict
+from .WavelenGrids import intern_wavelen_grid
+try:
+    from lsst.sims.utils.CodeUtilities import sims_clean_up
+except:
+    sims_clean_up = None
+
+__all__ = ["Resampler", "get_resampler"]
+
+
+class Resampler(object):
+    """
+    Linearly interpolate quantities sampled on one wavelength grid onto another.
+    """
+
+    def __init__(self, wavelen, wavelen_match, fill_value=numpy.NaN):
+        """
+        @param [in] wavelen is the source wavelength grid.  It need not be sorted.
+
+        @param [in] wavelen_match is the target wavelength grid
+
+        @param [in] fill_value is the value given to target points outside
+        the range of wavelen (NaN for SEDs, 0 for throughputs)
+        """
+        if len(wavelen) < 2:
+            raise ValueError("Cannot interpolate from a grid of fewer than two wavelengths")
+
+        # (read-only) canonical arrays of the grids, see WavelenGrids.py
+        wavelen = intern_wavelen_grid(wavelen)
+        self.wavelen_match = intern_wavelen_grid(wavelen_match)
+        self.wavelen = wavelen
+        self.fill_value = fill_value
+
+        self._order = None
+        if numpy.any(numpy.diff(wavelen) < 0.0):
+            self._order = numpy.argsort(wavelen, kind='mergesort')
+            wavelen = wavelen[self._order]
+
+        # as in numpy.interp, each target point is interpolated from
+        # the last source point at or below it and the point after that
+        i_lo = numpy.searchsorted(wavelen, self.wavelen_match, side='right') - 1
+        self._outside = numpy.where(numpy.logical_or(self.wavelen_match < wavelen[0],
+                                                     self.wavelen_match > wavelen[-1]))[0]
+        # target points equal to the last source point take its value
+        self._at_end = numpy.where(self.wavelen_match == wavelen[-1])[0]
+        self._i_lo = numpy.clip(i_lo, 0, len(wavelen)-2)
+        self._i_hi = self._i_lo + 1
+        self._d_wavelen = wavelen[self._i_hi] - wavelen[self._i_lo]
+        self._offset = self.wavelen_match - wavelen[self._i_lo]
+
+    def matches(self, wavelen, wavelen_match, fill_value):
+        """
+        Return True if this Resampler maps wavelen onto wavelen_match with fill_value
+        """
+        if not (fill_value == self.fill_value or
+                (numpy.isnan(fill_value) and numpy.isnan(self.fill_value))):
+            return False
+        # interned grids are recognized by identity
+        return ((wavelen is self.wavelen or numpy.array_equal(wavelen, self.wavelen)) and
+                (wavelen_match is self.wavelen_match or
+                 numpy.array_equal(wavelen_match, self.wavelen_match)))
+
+    def resample(self, flux):
+        """
+        Interpolate flux onto the target grid.
+
+        @param [in] flux is either a 1-D numpy array sampled on the source
+        grid, or a 2-D numpy array each row of which is sampled on the source grid
+
+        @param [out] a new numpy array with the last axis sampled on the target grid.
+        Points outside of the source grid are set to fill_value.
+        """
+        flux = numpy.asarray(flux, dtype=float)
+        if flux.shape[-1] != len(self.wavelen):
+            raise ValueError("flux has %d points; the source grid has %d" %
+                             (flux.shape[-1], len(self.wavelen)))
+        if self._order is not None:
+            flux = flux[..., self._order]
+
+        # the same arithmetic as numpy.interp
+        flux_lo = flux.take(self._i_lo, axis=-1)
+        flux_grid = flux.take(self._i_hi, axis=-1)
+        flux_grid -= flux_lo
+        flux_grid /= self._d_wavelen
+        flux_grid *= self._offset
+        flux_grid += flux_lo
+
+        if len(self._at_end) > 0:
+            flux_grid[..., self._at_end] = flux[..., -1:]
+        if len(self._outside) > 0:
+            flux_grid[..., self._outside] = self.fill_value
+        return flux_grid
+
+    def fold(self, weights):
+        """
+        Fold weights on the target grid back onto the source grid, so that
+        integrals over resampled quantities can be taken without resampling them.
+
+        @param [in] weights is a 2-D numpy array, each row of which is sampled
+        on the target grid
+
+        @param [out] a 2-D numpy array, each row of which is sampled on the
+        source grid, such that numpy.dot(folded, flux) is
+        numpy.dot(weights, self.resample(flux)) (up to rounding).  Target points
+        outside of the source grid are ignored.
+        """
+        weights = numpy.atleast_2d(numpy.asarray(weights, dtype=float))
+        if weights.shape[-1] != len(self.wavelen_match):
+            raise ValueError("weights have %d points; the target grid has %d" %
+                             (weights.shape[-1], len(self.wavelen_match)))
+        # the fraction of each target point taken from the upper bracketing point
+        frac_hi = self._offset/self._d_wavelen
+        frac_hi[self._at_end] = 1.0
+        frac_lo = 1.0 - frac_hi
+        frac_lo[self._outside] = 0.0
+        frac_hi[self._outside] = 0.0
+        i_lo = self._i_lo
+        i_hi = self._i_hi
+        if self._order is not None:
+            i_lo = self._order[i_lo]
+            i_hi = self._order[i_hi]
+
+        n_source = len(self.wavelen)
+        folded = numpy.empty((len(weights), n_source), dtype=float)
+        for row, weight_row in zip(folded, weights):
+            row[:] = numpy.bincount(i_lo, weights=weight_row*frac_lo, minlength=n_source)
+            row += numpy.bincount(i_hi, weights=weight_row*frac_hi, minlength=n_source)
+        return folded
+
+
+# Resamplers, keyed on the length and end points of both grids;
+# each key maps to a list of Resamplers (which check the full grids)
+_global_resampler_cache = OrderedDict()
+_global_resampler_lock = threading.Lock()
+
+# the number of Resamplers kept by get_resampler()
+_max_resamplers = 32
+
+if sims_clean_up is not None:
+    sims_clean_up.targets.append(_global_resampler_cache)
+
+
+def get_resampler(wavelen, wavelen_match, fill_value=numpy.NaN):
+    """
+    Return a Resampler from wavelen onto wavelen_match.  The Resamplers
+    for the most recently used pairs of grids are cached, so that the
+    interpolation weights are only calculated once per pair of grids.
+
+    @param [in] wavelen is the source wavelength grid
+
+    @param [in] wavelen_match is the target wavelength grid
+
+    @param [in] fill_value is the value given to target points outside
+    the range of wavelen
+
+    @param [out] a Resampler
+    """
+    wavelen = numpy.asarray(wavelen)
+    wavelen_match = numpy.asarray(wavelen_match)
+    if len(wavelen) == 0 or len(wavelen_match) == 0:
+        return Resampler(wavelen, wavelen_match, fill_value=fill_value)
+
+    key = (len(wavelen), float(wavelen[0]), float(wavelen[-1]),
+           len(wavelen_match), float(wavelen_match[0]), float(wavelen_match[-1]))
+
+    with _global_resampler_lock:
+        candidates = _global_resampler_cache.pop(key, None)
+        if candidates is not None:
+            # mark the key as the most recently used one
+            _global_resampler_cache[key] = candidates
+            for resampler in candidates:
+                if resampler.matches(wavelen, wavelen_match, fill_value):
+                    return resampler
+
+    resampler = Resampler(wavelen, wavelen_match, fill_value=fill_value)
+
+    with _global_resampler_lock:
+        candidates = _global_resampler_cache.pop(key, [])
+        candidates.append(resampler)
+        _global_resampler_cache[key] = candidates
+        while sum(len(cc) for cc in _global_resampler_cache.values()) > _max_resamplers:
+            oldest = next(iter(_global_resampler_cache))
+            _global_resampler_cache[oldest].pop(0)
+            if len(_global_resampler_cache[oldest]) == 0:
+                _global_resampler_cache.pop(oldest)
+
+    return resampler
@@ -53,6 +53,19 @@ Methods:
   avoids possible de-synchronization errors (flambda reflecting the addition of dust while fnu does
   not, for example). If arrays are passed into a method, they will not be altered and the arrays
   which are returned will be allocated new memory.
+ Whichever of flambda and fnu was set last is the authoritative one: setting flambda sets fnu to None,
+  and setting fnu (e.g. setSED with fnu only, setFlatSED or multiplyFluxNorm) marks flambda as out of
+  date, so that it is recalculated from fnu (once) when it is next used. In the same way, fnu is
+  calculated from flambda (once) when it is next used. Arrays of a Sed should be replaced (or changed
+  with the in_place methods below) rather than modified element by element, so that this bookkeeping
+  stays correct; this includes the copy of a Sed resampled onto the grid of a BandpassDict, which is
+  kept until wavelen, flambda or fnu is set again.
+ The exception is the in_place mode of setSED, flambdaTofnu, fnuToflambda, redshiftSED, addCCMDust
+  and multiplyFluxNorm. With in_place=True these methods write their results into the existing arrays
+  (of self, or the arrays passed in) using numpy's out= arguments, so that a loop which reuses one Sed
+  object for many objects does not allocate any memory. Read-only arrays of self (e.g. the arrays of
+  cached SEDs) are copied once before they are changed. The results are identical to those of the
+  default mode.
  Another general philosophy for Sed.py is use separate methods for items which only need to be generated once
   for several objects (such as the dust A_x, b_x arrays). This allows the user to optimize their code for
   faster operation, depending on what their requirements are (see example_SedBandpass_star.py and
@@ -76,8 +89,10 @@ if the wavelength range and grid is the same for each SED (calculate a_x/b_x wit
   renormalizeSED  -- intended for rescaling SEDS to a common flambda or fnu level.
   writeSED -- keep a file record of your SED.
   setPhiArray -- given a list of bandpasses, sets up the 2-d phiArray (for manyMagCalc) and dlambda value.
+  setupPhiSupport -- given a 2-d phiArray, finds the range of wavelengths over which each phi is non-zero.
   manyMagCalc -- given 2-d phiArray and dlambda, this will return an array of magnitudes (in the same
-order as the bandpasses) of this SED in each of those bandpasses.
+order as the bandpasses) of this SED in each of those bandpasses.  If the support of each phi is
+also given, each bandpass is only integrated over the wavelengths where its phi is non-zero.
 
 """
 
@@ -91,30 +106,194 @@ import warnings
 import numpy
 import sys
 import time
-import scipy.interpolate as interpolate
-import gzip
 import pickle
 import os
+import zlib
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 from .PhysicalParameters import PhysicalParameters
+from .asciiUtils import readAsciiColumns
+from .Resampler import get_resampler
+from .WavelenGrids import intern_wavelen_grid, _global_wavelen_grids
+from .WavelenGrids import _pin_wavelen_grid
 import warnings
 try:
     from lsst.utils import getPackageDir
 except:
     pass
+try:
+    from lsst.sims.utils.CodeUtilities import sims_clean_up
+except:
+    sims_clean_up = None
 
-__all__ = ["Sed", "cache_LSST_seds", "read_close_Kurucz"]
+__all__ = ["Sed", "SedCacheError", "SedLRUCache", "SharedSedCacheHandle", "cache_LSST_seds",
+           "verify_LSST_sed_cache", "cache_resampled_seds", "get_misc_sed_cache",
+           "publish_LSST_sed_cache", "attach_LSST_sed_cache", "release_LSST_sed_cache",
+           "get_ccm_ab_cache", "set_flux_dtype", "get_flux_dtype", "read_close_Kurucz"]
 
 
 _global_lsst_sed_cache = None
 
-# a cache for ASCII files read-in by the user
-_global_misc_sed_cache = None
+# the name of the shared memory segment _global_lsst_sed_cache was
+# loaded from (see attach_LSST_sed_cache), if any
+_global_lsst_sed_cache_segment = None
+
+# the sub-libraries and wavelength window (sub_dirs, wavelen_min, wavelen_max)
+# which cache_LSST_seds loaded into _global_lsst_sed_cache; None means
+# all of sims_sed_library at full resolution
+_global_lsst_sed_cache_selection = None
+
+# the sub-directories of sims_sed_library which contain SEDs
+_lsst_sed_sub_dirs = ['agnSED', 'flatSED', 'ssmSED', 'starSED', 'galaxySED']
 
 
 class SedCacheError(Exception):
     pass
 
 
+class SedLRUCache(object):
+    """
+    A least-recently-used cache of (wavelen, flambda) pairs with a bounded size in bytes.
+
+    Whenever adding an SED would push the total size of the cached arrays over
+    maxBytes, the SEDs that were used least recently are evicted until it fits.
+    An SED larger than maxBytes is never cached.  The numbers of hits, misses
+    and evictions are recorded so that the size of the cache can be tuned.
+
+    The cache can safely be shared between threads.
+    """
+
+    def __init__(self, maxBytes=512*1024*1024):
+        """
+        @param [in] maxBytes is the maximum total size (in bytes) of the
+        arrays held by the cache (defaults to 512 MB)
+        """
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._max_bytes = maxBytes
+        self._n_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, name):
+        return name in self._data
+
+    def get(self, name):
+        """
+        Return the (wavelen, flambda) pair stored under name, or None if
+        there is not one.  A successful lookup marks the SED as the most
+        recently used one.
+        """
+        with self._lock:
+            value = self._data.pop(name, None)
+            if value is None:
+                self._misses += 1
+                return None
+            self._data[name] = value
+            self._hits += 1
+            return value
+
+    def __setitem__(self, name, value):
+        n_bytes = value[0].nbytes + value[1].nbytes
+        with self._lock:
+            if name in self._data:
+                old_value = self._data.pop(name)
+                self._n_bytes -= old_value[0].nbytes + old_value[1].nbytes
+            if n_bytes > self._max_bytes:
+                return
+            self._data[name] = value
+            self._n_bytes += n_bytes
+            self._evict()
+
+    def _evict(self):
+        """
+        Drop the least recently used SEDs until the cache fits within maxBytes
+        """
+        with self._lock:
+            while self._n_bytes > self._max_bytes and len(self._data) > 0:
+                name = next(iter(self._data))
+                value = self._data.pop(name)
+                self._n_bytes -= value[0].nbytes + value[1].nbytes
+                self._evictions += 1
+
+    def clear(self):
+        """
+        Remove every SED from the cache.  The hit/miss/eviction counters are not reset.
+        """
+        with self._lock:
+            self._data.clear()
+            self._n_bytes = 0
+
+    @property
+    def maxBytes(self):
+        """
+        The maximum total size (in bytes) of the arrays held by the cache.
+        Lowering it evicts SEDs immediately.
+        """
+        return self._max_bytes
+
+    @maxBytes.setter
+    def maxBytes(self, value):
+        with self._lock:
+            self._max_bytes = value
+            self._evict()
+
+    @property
+    def nBytes(self):
+        """
+        The total size (in bytes) of the arrays currently held by the cache
+        """
+        return self._n_bytes
+
+    @property
+    def hits(self):
+        """
+        The number of lookups that found their SED in the cache
+        """
+        return self._hits
+
+    @property
+    def misses(self):
+        """
+        The number of lookups that did not find their SED in the cache
+        """
+        return self._misses
+
+    @property
+    def evictions(self):
+        """
+        The number of SEDs that have been dropped to stay within maxBytes
+        """
+        return self._evictions
+
+
+# a cache for ASCII files read-in by the user
+_global_misc_sed_cache = SedLRUCache()
+
+if sims_clean_up is not None:
+    sims_clean_up.targets.append(_global_misc_sed_cache)
+
+
+def get_misc_sed_cache():
+    """
+    Return the SedLRUCache holding SEDs that Sed.readSED_flambda() has read
+    from ASCII files (i.e. SEDs that are not in the cache of LSST SEDs
+    created by cache_LSST_seds()).  Use it to change the size of the cache
+    (maxBytes), inspect its hit/miss/eviction counters, or clear() it.
+    """
+    return _global_misc_sed_cache
+
+
 class sed_unpickler(pickle.Unpickler):
 
     _allowed_obj = (("numpy", "ndarray"),
@@ -146,11 +325,27 @@ class sed_unpickler(pickle.Unpickler):
             raise RuntimeError("sed_unpickler cannot handle module %s" % module)
 
 
+def verify_LSST_sed_cache():
+    """
+    Run the full check of the loaded cache of LSST SEDs against sims_sed_library:
+    every SED file in the library must be in the cache, and SEDs loaded from the
+    cache must be identical to the same SEDs read from their ASCII files.
+
+    This walks the whole library and parses several files, so it is not run
+    by cache_LSST_seds unless it is called with verify=True.
+
+    Raises a SedCacheError if the cache fails the check.
+    """
+    _validate_sed_cache()
+    _validate_sed_manifest()
+    _compare_cached_versus_uncached()
+
+
 def _validate_sed_cache():
     """
-    Verifies that the pickled SED cache exists, is a dict, and contains
-    an entry for every SED in starSED/ and galaxySED.  Does nothing if so,
-    raises a RuntimeError if false.
+    Verifies that the SED cache exists, is a dict, and contains
+    an entry for every SED in sims_sed_library.  Does nothing if so,
+    raises a SedCacheError if false.
 
     We are doing this here so that sims_sed_library does not have to depend
     on any lsst testing software (in which case, users would have to get
@@ -167,7 +362,9 @@ def _validate_sed_cache():
         raise SedCacheError("_global_lsst_sed_cache is a %s; not a dict"
                             % str(type(_global_lsst_sed_cache)))
     sed_dir = getPackageDir('sims_sed_library')
-    sub_dir_list = ['galaxySED', 'starSED']
+    sub_dir_list = _lsst_sed_sub_dirs
+    if _global_lsst_sed_cache_selection is not None and _global_lsst_sed_cache_selection[0] is not None:
+        sub_dir_list = _global_lsst_sed_cache_selection[0]
     file_ct = 0
     for sub_dir in sub_dir_list:
         tree = os.walk(os.path.join(sed_dir, sub_dir))
@@ -184,208 +381,1623 @@ def _validate_sed_cache():
     if file_ct == 0:
         raise SedCacheError("There were not files in _global_lsst_sed_cache")
 
-    return
+    return
+
+
+def _validate_sed_manifest():
+    """
+    Verify that none of the files in sims_sed_library has been removed or
+    changed since the SED cache was made (see _sed_library_files_changed).
+    Raises a SedCacheError if one has.
+    """
+    sed_dir = getPackageDir('sims_sed_library')
+    sed_cache_dir = os.path.join(sed_dir, 'lsst_sed_cache_dir')
+    sed_cache_name = 'lsst_sed_cache_%d.dat' % sys.version_info.major
+    if _sed_library_files_changed(sed_cache_dir, sed_cache_name, sed_dir):
+        raise SedCacheError("A file in %s has changed since the cache of LSST SEDs "
+                            "was made; re-run sims_photUtils.cache_LSST_seds(verify=True) "
+                            "to update the cache" % sed_dir)
+
+
+def _compare_cached_versus_uncached():
+    """
+    Verify that loading an SED from the cache gives identical
+    results to loading the same SED from ASCII (cropped to the
+    wavelength window the cache was loaded with, if any)
+    """
+    sed_dir = getPackageDir('sims_sed_library')
+    kurucz_dir = os.path.join(sed_dir, 'starSED', 'kurucz')
+
+    dtype = numpy.dtype([('wavelen', float), ('flambda', float)])
+
+    # prefer Kurucz SEDs, but only compare SEDs which were actually loaded
+    sed_name_list = sorted(_global_lsst_sed_cache.keys())
+    kurucz_name_list = [name for name in sed_name_list
+                        if name.startswith(kurucz_dir + os.sep)]
+    if len(kurucz_name_list) > 0:
+        sed_name_list = kurucz_name_list
+
+    wavelen_min = None
+    wavelen_max = None
+    if _global_lsst_sed_cache_selection is not None:
+        wavelen_min, wavelen_max = _global_lsst_sed_cache_selection[1:]
+
+    msg = ('An SED loaded from the memory-mapped cache is not '
+           'identical to the same SED loaded from ASCII; '
+           'it is possible that the cache was incorrectly '
+           'created in sims_sed_library\n\n'
+           'Try removing the cache files (the .dat file, whose name should have '
+           'been printed to stdout above, and its _index.npz file) '
+           'and re-running sims_photUtils.cache_LSST_seds()')
+    for full_name in sed_name_list[:5]:
+        from_np = numpy.genfromtxt(full_name, dtype=dtype)
+        wavelen, flambda = _crop_sed_to_window(from_np['wavelen'], from_np['flambda'],
+                                               wavelen_min, wavelen_max)
+        ss_cache = Sed()
+        ss_cache.readSED_flambda(full_name)
+        ss_uncache = Sed(wavelen=wavelen,
+                         flambda=flambda,
+                         name=full_name)
+
+        if not ss_cache == ss_uncache:
+            raise SedCacheError(msg)
+
+
+def _read_only_view(arr):
+    """
+    Return a read-only view of the numpy array arr (which shares arr's memory)
+    """
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+# the dtype in which containers of many flux arrays (SedBatch, the phi
+# arrays of BandpassDict and the cache of resampled SEDs) store them
+# when they are not given a dtype (see set_flux_dtype)
+_global_flux_dtype = numpy.dtype(numpy.float64)
+
+
+def _check_flux_dtype(dtype):
+    """
+    Return dtype as a numpy.dtype, raising a ValueError unless it is float32
+    or float64.  If dtype is None, the dtype set by set_flux_dtype is returned.
+    """
+    if dtype is None:
+        return _global_flux_dtype
+    dtype = numpy.dtype(dtype)
+    if dtype not in (numpy.dtype(numpy.float32), numpy.dtype(numpy.float64)):
+        raise ValueError("Flux arrays can only be stored as float32 or float64, not %s" % str(dtype))
+    return dtype
+
+
+def set_flux_dtype(dtype):
+    """
+    Set the dtype in which SedBatch, BandpassDict (its phi array) and
+    cache_resampled_seds store flux densities by default.
+
+    Storing them as float32 halves their memory and the memory bandwidth
+    of the magnitude calculations; the integrals over wavelength are still
+    accumulated in float64, so magnitudes change by less than 1e-5 (see
+    tests/testFluxPrecision.py).  Wavelength grids are always float64.
+
+    Parameters
+    ----------
+    dtype is numpy.float32 or numpy.float64 (the default)
+    """
+    global _global_flux_dtype
+    _global_flux_dtype = _check_flux_dtype(dtype)
+
+
+def get_flux_dtype():
+    """
+    Return the dtype set by set_flux_dtype
+    """
+    return _global_flux_dtype
+
+
+def _sed_cache_index_name(cache_name):
+    """
+    Return the name of the index file that goes with the SED cache
+    data file cache_name
+    """
+    return os.path.splitext(cache_name)[0] + '_index.npz'
+
+
+def _write_sed_cache(cache_dir, cache_name, sed_iterator, dtype=float, manifest=None,
+                     stamp_root=None):
+    """
+    Write SEDs to the columnar on-disk cache format.
+
+    The data file cache_name is a flat binary array of numbers.  Each SED
+    is stored as its wavelen array immediately followed by its flambda
+    array.  A separate index file (see _sed_cache_index_name) records the
+    name, offset (in elements, not bytes) and length of each SED, so that
+    the data file can be memory-mapped by _load_sed_cache without being
+    parsed.
+
+    Parameters
+    ----------
+    cache_dir is the directory where the cache will be written
+
+    cache_name is the name of the data file to be written
+
+    sed_iterator yields (name, wavelen, flambda) tuples
+
+    dtype is the numpy dtype in which to store the SEDs (default float64)
+
+    manifest is an optional dict mapping each name to the (size, mtime, checksum)
+    of the file the SED was read from.  It is read after sed_iterator has been
+    exhausted, so the iterator may fill it in as it goes.  It is stored in the
+    index so that later calls to _generate_sed_cache only re-read files that changed.
+
+    stamp_root is an optional directory relative to which the names are file
+    paths.  If it is given, the modification times of the directories containing
+    those files, a checksum of the size and modification time of every file
+    (those missing from manifest are looked up with os.stat) and the version of
+    the library (see _sed_library_version) are stored in the index
+    (see _sed_library_changed and _sed_library_files_changed).
+
+    The index also records whether the wavelen array of each SED is sorted
+    (see _crop_sed_to_window), which SEDs share the same wavelen array (so
+    that _load_sed_cache can intern each distinct grid once), the number of
+    SEDs and a checksum of the index itself, which are verified by
+    _load_sed_cache.
+
+    Returns
+    -------
+    The number of SEDs written
+    """
+    dtype = numpy.dtype(dtype)
+    data_name = os.path.join(cache_dir, cache_name)
+    index_name = os.path.join(cache_dir, _sed_cache_index_name(cache_name))
+
+    name_list = []
+    offset_list = []
+    length_list = []
+    sorted_list = []
+    grid_id_list = []
+    grid_ids = {}
+    offset = 0
+
+    # write to temporary files and then move them into place so that
+    # other processes never see a partially written cache
+    with open(data_name + '.tmp', 'wb') as file_handle:
+        for name, wavelen, flambda in sed_iterator:
+            wavelen = numpy.asarray(wavelen, dtype=dtype)
+            wavelen.tofile(file_handle)
+            numpy.asarray(flambda, dtype=dtype).tofile(file_handle)
+            name_list.append(name)
+            offset_list.append(offset)
+            length_list.append(len(wavelen))
+            sorted_list.append(bool(numpy.all(numpy.diff(wavelen) >= 0)))
+            grid_key = hashlib.md5(numpy.ascontiguousarray(wavelen).tobytes()).hexdigest()
+            grid_id_list.append(grid_ids.setdefault(grid_key, len(grid_ids)))
+            offset += 2*len(wavelen)
+
+    if manifest is None:
+        manifest = {}
+    no_entry = (-1, -1.0, -1)
+    if stamp_root is not None:
+        manifest = dict(manifest)
+        for name in name_list:
+            if name not in manifest:
+                try:
+                    stat = os.stat(os.path.join(stamp_root, name))
+                    manifest[name] = (stat.st_size, stat.st_mtime, -1)
+                except OSError:
+                    # (a file which has since been removed; the cache will be stale)
+                    pass
+
+    index = {'names': numpy.array(name_list, dtype=str),
+             'offsets': numpy.array(offset_list, dtype=numpy.int64),
+             'lengths': numpy.array(length_list, dtype=numpy.int64),
+             'sorted': numpy.array(sorted_list, dtype=bool),
+             'grid_ids': numpy.array(grid_id_list, dtype=numpy.int64),
+             'sizes': numpy.array([manifest.get(name, no_entry)[0] for name in name_list],
+                                  dtype=numpy.int64),
+             'mtimes': numpy.array([manifest.get(name, no_entry)[1] for name in name_list],
+                                   dtype=float),
+             'checksums': numpy.array([manifest.get(name, no_entry)[2] for name in name_list],
+                                      dtype=numpy.int64)}
+    index['n_seds'] = numpy.array(len(name_list))
+    index['index_checksum'] = numpy.array(_sed_cache_index_checksum(index))
+    if stamp_root is not None:
+        stamp_dirs = _sed_library_dirs(name_list)
+        index['stamp_dirs'] = numpy.array(stamp_dirs, dtype=str)
+        index['stamp_mtimes'] = _sed_library_stamp(stamp_root, stamp_dirs)
+        index['manifest_checksum'] = numpy.array(_sed_manifest_checksum(index['sizes'],
+                                                                        index['mtimes']))
+        index['library_version'] = numpy.array(_sed_library_version())
+
+    with open(index_name + '.tmp', 'wb') as file_handle:
+        numpy.savez(file_handle, dtype=numpy.array(dtype.str), **index)
+
+    os.rename(data_name + '.tmp', data_name)
+    os.rename(index_name + '.tmp', index_name)
+
+    return len(name_list)
+
+
+def _sed_cache_index_checksum(index):
+    """
+    Return a checksum of the names, offsets, lengths, file checksums and
+    (if present) sortedness flags and grid ids in the dict of index arrays
+    index (see _write_sed_cache)
+    """
+    checksum = zlib.crc32('\n'.join(index['names']).encode('utf-8'))
+    for key in ('offsets', 'lengths', 'checksums', 'sorted', 'grid_ids'):
+        if key in index:
+            checksum = zlib.crc32(numpy.ascontiguousarray(index[key], dtype=numpy.int64).tobytes(),
+                                  checksum)
+    return checksum & 0xffffffff
+
+
+def _sed_manifest_checksum(sizes, mtimes):
+    """
+    Return a checksum of the arrays of the sizes and modification times
+    of the files an SED cache was made from
+    """
+    checksum = zlib.crc32(numpy.ascontiguousarray(sizes, dtype=numpy.int64).tobytes())
+    checksum = zlib.crc32(numpy.ascontiguousarray(mtimes, dtype=float).tobytes(), checksum)
+    return checksum & 0xffffffff
+
+
+def _sed_library_version():
+    """
+    Return the version of sims_sed_library which is set up (as recorded by eups
+    in the environment), or an empty string if it is not known
+    """
+    return os.environ.get('SETUP_SIMS_SED_LIBRARY', '')
+
+
+def _sed_library_dirs(name_list):
+    """
+    Return the sorted list of every directory containing (or containing a
+    directory which contains) the files in name_list (relative paths)
+    """
+    dir_set = set()
+    for name in name_list:
+        dir_name = os.path.dirname(name)
+        while dir_name not in dir_set and dir_name != '':
+            dir_set.add(dir_name)
+            dir_name = os.path.dirname(dir_name)
+    return sorted(dir_set)
+
+
+def _sed_library_stamp(root_dir, dir_list):
+    """
+    Return an array of the modification times of the directories in
+    dir_list (relative to root_dir); -1 for directories which do not exist.
+    A directory's modification time changes whenever a file is added to,
+    removed from or renamed in it.
+    """
+    stamp = -1.0*numpy.ones(len(dir_list), dtype=float)
+    for ix, dir_name in enumerate(dir_list):
+        try:
+            stamp[ix] = os.stat(os.path.join(root_dir, dir_name)).st_mtime
+        except OSError:
+            pass
+    return stamp
+
+
+def _sed_library_changed(cache_dir, cache_name, root_dir):
+    """
+    Return True if the library in root_dir which the SED cache cache_dir/cache_name
+    was generated from has changed since (or if the cache did not record it):
+
+    - the version of the library (see _sed_library_version) is different
+
+    - a file was added to, removed from or renamed in one of its directories
+      (the modification times of the directories have changed)
+
+    This costs one stat per directory; the files themselves are not looked at.
+    A file which was overwritten in place is only found by the (opt-in)
+    _sed_library_files_changed.
+    """
+    index_name = os.path.join(cache_dir, _sed_cache_index_name(cache_name))
+    try:
+        with numpy.load(index_name) as index:
+            if 'stamp_dirs' not in index.files or 'manifest_checksum' not in index.files:
+                return True
+            stamp_dirs = [str(name) for name in index['stamp_dirs']]
+            stamp_mtimes = index['stamp_mtimes']
+            library_version = str(index['library_version'])
+    except Exception:
+        return True
+    if library_version != _sed_library_version():
+        return True
+    return not numpy.array_equal(stamp_mtimes, _sed_library_stamp(root_dir, stamp_dirs))
+
+
+def _sed_library_files_changed(cache_dir, cache_name, root_dir):
+    """
+    Return True if a file in the library in root_dir which the SED cache
+    cache_dir/cache_name was generated from has been removed or changed since
+    (the checksum of the sizes and modification times of the files stored in
+    the index is different), or if the cache did not record the checksum.
+
+    This costs one stat per file, so it is only run by verify_LSST_sed_cache
+    (and cache_LSST_seds with verify=True).
+    """
+    index_name = os.path.join(cache_dir, _sed_cache_index_name(cache_name))
+    try:
+        with numpy.load(index_name) as index:
+            if 'manifest_checksum' not in index.files:
+                return True
+            names = [str(name) for name in index['names']]
+            manifest_checksum = int(index['manifest_checksum'])
+    except Exception:
+        return True
+
+    sizes = -1*numpy.ones(len(names), dtype=numpy.int64)
+    mtimes = -1.0*numpy.ones(len(names), dtype=float)
+    for ix, name in enumerate(names):
+        try:
+            stat = os.stat(os.path.join(root_dir, name))
+        except OSError:
+            return True
+        sizes[ix] = stat.st_size
+        mtimes[ix] = stat.st_mtime
+    return _sed_manifest_checksum(sizes, mtimes) != manifest_checksum
+
+
+def _read_sed_cache_index(cache_dir, cache_name):
+    """
+    Read the index of an SED cache written by _write_sed_cache.
+
+    Parameters
+    ----------
+    cache_dir is the directory containing the cache
+
+    cache_name is the name of the data file
+
+    Returns
+    -------
+    A dict mapping each name in the cache to a tuple
+    (offset, length, size, mtime, checksum, is_sorted, grid_id) and the dtype
+    of the data file.  size, mtime and checksum describe the file the SED was
+    read from and are -1 if they were not recorded.  is_sorted records whether
+    the wavelen array of the SED is in increasing order; SEDs with the same
+    grid_id have identical wavelen arrays.  Both are None in caches which did
+    not record them.
+
+    Raises a SedCacheError if the number of SEDs or the checksum recorded
+    in the index do not match its contents.
+    """
+    index_name = os.path.join(cache_dir, _sed_cache_index_name(cache_name))
+
+    with numpy.load(index_name) as index:
+        name_arr = index['names']
+        offset_arr = index['offsets']
+        length_arr = index['lengths']
+        if 'sizes' in index.files:
+            size_arr = index['sizes']
+            mtime_arr = index['mtimes']
+            checksum_arr = index['checksums']
+        else:
+            size_arr = -1*numpy.ones(len(name_arr), dtype=numpy.int64)
+            mtime_arr = -1.0*numpy.ones(len(name_arr), dtype=float)
+            checksum_arr = -1*numpy.ones(len(name_arr), dtype=numpy.int64)
+        if 'sorted' in index.files:
+            sorted_arr = [bool(is_sorted) for is_sorted in index['sorted']]
+        else:
+            sorted_arr = [None]*len(name_arr)
+        if 'grid_ids' in index.files:
+            grid_id_arr = [int(grid_id) for grid_id in index['grid_ids']]
+        else:
+            grid_id_arr = [None]*len(name_arr)
+        dtype = numpy.dtype(str(index['dtype']))
+        if 'index_checksum' in index.files:
+            if int(index['n_seds']) != len(name_arr):
+                raise SedCacheError("The index of %s lists %d SEDs; expected %d"
+                                    % (cache_name, len(name_arr), int(index['n_seds'])))
+            checksum_index = {'names': name_arr, 'offsets': offset_arr,
+                              'lengths': length_arr, 'checksums': checksum_arr}
+            for key in ('sorted', 'grid_ids'):
+                if key in index.files:
+                    checksum_index[key] = index[key]
+            checksum = _sed_cache_index_checksum(checksum_index)
+            if checksum != int(index['index_checksum']):
+                raise SedCacheError("The index of %s is corrupt" % cache_name)
+
+    entries = {}
+    for name, offset, length, size, mtime, checksum, is_sorted, grid_id in zip(name_arr, offset_arr,
+                                                                                length_arr, size_arr,
+                                                                                mtime_arr, checksum_arr,
+                                                                                sorted_arr, grid_id_arr):
+        entries[str(name)] = (int(offset), int(length), int(size), float(mtime), int(checksum),
+                              is_sorted, grid_id)
+
+    return entries, dtype
+
+
+def _normalize_sed_sub_dirs(sub_dirs):
+    """
+    Return the list of sub-library names sub_dirs (paths relative to
+    sims_sed_library, e.g. 'starSED/kurucz') in the form used for the
+    names stored in the LSST SED cache.  Raises a ValueError for a
+    path which is not inside the library.
+    """
+    sub_dir_list = []
+    for sub_dir in sub_dirs:
+        norm_dir = os.path.normpath(sub_dir.replace('/', os.sep)).strip(os.sep)
+        if os.path.isabs(sub_dir) or norm_dir in ('', os.curdir) or norm_dir.split(os.sep)[0] == os.pardir:
+            raise ValueError("%s is not a sub-directory of sims_sed_library" % sub_dir)
+        sub_dir_list.append(norm_dir)
+    return sub_dir_list
+
+
+def _sed_name_in_sub_dirs(name, sub_dir_list):
+    """
+    Return True if the relative SED name is inside one of the
+    (normalized) sub-directories in sub_dir_list
+    """
+    for sub_dir in sub_dir_list:
+        if name.startswith(sub_dir + os.sep):
+            return True
+    return False
+
+
+def _crop_sed_to_window(wavelen, flambda, wavelen_min, wavelen_max, is_sorted=None):
+    """
+    Return (wavelen, flambda) restricted to wavelen_min <= wavelen <= wavelen_max
+    (either limit may be None).
+
+    SEDs are stored in order of increasing wavelength, so the window is found
+    by binary search and the returned arrays are views of the inputs; only
+    the handful of pages the search touches are read from a memory-mapped
+    cache.  SEDs which are not sorted fall back to a boolean mask (a copy).
+
+    is_sorted records whether wavelen is in increasing order (as stored in
+    the index of the SED cache).  If it is None, wavelen is checked, which
+    reads the whole array.
+    """
+    window = _sed_window(wavelen, wavelen_min, wavelen_max, is_sorted=is_sorted)
+    return wavelen[window], flambda[window]
+
+
+def _sed_window(wavelen, wavelen_min, wavelen_max, is_sorted=None):
+    """
+    Return the index (a slice or, if wavelen is not sorted, a boolean mask)
+    which restricts arrays sampled on wavelen to the window
+    wavelen_min <= wavelen <= wavelen_max (see _crop_sed_to_window)
+    """
+    if wavelen_min is None and wavelen_max is None:
+        return slice(None)
+    if len(wavelen) == 0:
+        return slice(None)
+    if wavelen_min is None:
+        wavelen_min = -numpy.inf
+    if wavelen_max is None:
+        wavelen_max = numpy.inf
+
+    if is_sorted is None:
+        is_sorted = numpy.all(numpy.diff(wavelen) >= 0)
+    if not is_sorted:
+        return numpy.logical_and(wavelen >= wavelen_min, wavelen <= wavelen_max)
+
+    i_min = numpy.searchsorted(wavelen, wavelen_min, side='left')
+    i_max = numpy.searchsorted(wavelen, wavelen_max, side='right')
+    return slice(i_min, i_max)
+
+
+def _load_sed_cache(cache_dir, cache_name, root_dir=None, sub_dirs=None,
+                    wavelen_min=None, wavelen_max=None):
+    """
+    Memory-map an SED cache written by _write_sed_cache.
+
+    No SED data is read from disk here; the returned arrays are views
+    into the memory-mapped data file, so pages are only read (and are
+    shared between processes by the operating system) when an SED is
+    actually used.
+
+    Parameters
+    ----------
+    cache_dir is the directory containing the cache
+
+    cache_name is the name of the data file
+
+    root_dir is an optional directory to be prepended to the names stored
+    in the cache (the LSST SED cache stores names relative to sims_sed_library)
+
+    sub_dirs is an optional list of sub-directories (relative to the names
+    stored in the cache, e.g. 'starSED/kurucz'); if given, only SEDs
+    inside them are loaded
+
+    wavelen_min and wavelen_max optionally restrict each SED to the
+    wavelength window (in nm) between them.  The cropped arrays are still
+    views into the memory-mapped file.
+
+    If the index records which SEDs share a wavelength grid, each distinct
+    (cropped) grid is interned once, here (see WavelenGrids.py), and every SED
+    on it gets the canonical array as its wavelen; only the wavelen of one SED
+    per grid is read.  The flambda arrays are views into the memory-mapped file.
+
+    Returns
+    -------
+    A dict of (wavelen, flambda) tuples keyed to the full file name of
+    each SED
+
+    Raises a SedCacheError if the index is inconsistent with itself or
+    with the size of the data file.
+    """
+    entries, dtype = _read_sed_cache_index(cache_dir, cache_name)
+
+    n_elements = 0
+    for offset, length in (entry[:2] for entry in entries.values()):
+        n_elements = max(n_elements, offset+2*length)
+    data_size = os.stat(os.path.join(cache_dir, cache_name)).st_size
+    if data_size < n_elements*dtype.itemsize:
+        raise SedCacheError("The data file %s is %d bytes; the index requires %d"
+                            % (cache_name, data_size, n_elements*dtype.itemsize))
+
+    if sub_dirs is not None:
+        sub_dir_list = _normalize_sed_sub_dirs(sub_dirs)
+        name_list = [name for name in entries if _sed_name_in_sub_dirs(name, sub_dir_list)]
+    else:
+        name_list = list(entries.keys())
+
+    cache = {}
+    if len(name_list) == 0:
+        return cache
+
+    data = numpy.memmap(os.path.join(cache_dir, cache_name), dtype=dtype, mode='r').view(numpy.ndarray)
+    # the canonical (cropped) wavelen array and the window of each grid, keyed on its id
+    grids = {}
+    for name in name_list:
+        offset, length = entries[name][:2]
+        is_sorted, grid_id = entries[name][5:7]
+        if root_dir is not None:
+            full_name = os.path.join(root_dir, name)
+        else:
+            full_name = name
+        wavelen = data[offset:offset+length]
+        flambda = data[offset+length:offset+2*length]
+        if grid_id is None:
+            cache[full_name] = _crop_sed_to_window(wavelen, flambda, wavelen_min, wavelen_max,
+                                                   is_sorted=is_sorted)
+            continue
+        if grid_id not in grids:
+            window = _sed_window(wavelen, wavelen_min, wavelen_max, is_sorted=is_sorted)
+            grids[grid_id] = (_pin_wavelen_grid(wavelen[window]), window)
+        canonical, window = grids[grid_id]
+        cache[full_name] = (canonical, flambda[window])
+
+    return cache
+
+
+def _convert_legacy_sed_cache(cache_dir, legacy_name, cache_name, sed_root):
+    """
+    Convert a pickled SED cache (the format used before the columnar
+    cache was introduced) into the columnar format, so that users do not
+    have to regenerate the cache from sims_sed_library.
+
+    Parameters
+    ----------
+    cache_dir is the directory containing the caches
+
+    legacy_name is the name of the pickled cache
+
+    cache_name is the name of the columnar data file to be written
+
+    sed_root is the sims_sed_library directory that the pickled cache was made from
+    """
+    with open(os.path.join(cache_dir, legacy_name), 'rb') as input_file:
+        legacy_cache = sed_unpickler(input_file).load()
+
+    _write_sed_cache(cache_dir, cache_name,
+                     ((os.path.relpath(name, sed_root), legacy_cache[name][0], legacy_cache[name][1])
+                      for name in sorted(legacy_cache)),
+                     stamp_root=sed_root)
+
+
+def _sed_file_checksum(file_name):
+    """
+    Return the CRC32 checksum of the contents of file_name
+    """
+    checksum = 0
+    with open(file_name, 'rb') as file_handle:
+        while True:
+            chunk = file_handle.read(1 << 20)
+            if not chunk:
+                break
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum & 0xffffffff
+
+
+def _parse_sed_file(full_name):
+    """
+    Read one SED file for _generate_sed_cache.  This is a module-level
+    function so that it can be run in a multiprocessing.Pool.
+
+    Returns (full_name, wavelen, flambda, checksum), with wavelen and
+    flambda set to None if the file could not be parsed.
+    """
+    try:
+        wavelen, flambda = readAsciiColumns(full_name)
+    except:
+        return full_name, None, None, None
+    return full_name, wavelen, flambda, _sed_file_checksum(full_name)
+
+
+def _list_sed_files(sed_root, sub_dir_list):
+    """
+    Return the full names of all of the gzipped SED files in the
+    sub-directories sub_dir_list of sed_root
+    """
+    file_name_list = []
+    for sub_dir in sub_dir_list:
+        dir_tree = os.walk(os.path.join(sed_root, sub_dir))
+        for sub_tree in dir_tree:
+            dir_name = sub_tree[0]
+            file_name_list += [os.path.join(dir_name, name)
+                               for name in sub_tree[2] if name.endswith('.gz')]
+    return file_name_list
+
+
+def _generate_sed_cache(cache_dir, cache_name, n_processes=None, sub_dirs=None,
+                        wavelen_min=None, wavelen_max=None, sed_root=None, library_sub_dirs=None):
+    """
+    Read all of the SEDs from sims_sed_library and store them in
+    the columnar cache format (see _write_sed_cache) in cache_dir
+    (sims_sed_library/lsst_sed_cache_dir/ for the LSST SED cache)
+
+    The cache is generated incrementally: the index of any existing cache
+    records the size, modification time and checksum of every file it was
+    made from (keyed by the path relative to sims_sed_library).  Files whose
+    size and modification time (or, failing that, checksum) are unchanged
+    are copied from the existing cache; only new or changed files are parsed,
+    using a multiprocessing.Pool.
+
+    Parameters
+    ----------
+    cache_dir is the directory where the cache will be created
+    cache_name is the name of the cache to be created
+    n_processes is the number of processes used to parse SED files
+    (defaults to multiprocessing.cpu_count())
+    sub_dirs, wavelen_min and wavelen_max select the SEDs which are
+    returned (see _load_sed_cache); the cache itself covers the whole library
+    sed_root is the root directory of the library (defaults to sims_sed_library)
+    library_sub_dirs is the list of sub-directories of sed_root whose gzipped
+    SED files are cached (defaults to all of the SED directories in sims_sed_library)
+
+    Returns
+    -------
+    The dict of SEDs (keyed to their full file name)
+    """
+    if sed_root is None:
+        sed_root = getPackageDir('sims_sed_library')
+    if library_sub_dirs is None:
+        library_sub_dirs = _lsst_sed_sub_dirs
+
+    file_name_list = _list_sed_files(sed_root, library_sub_dirs)
+
+    old_entries = {}
+    old_data = None
+    if (os.path.exists(os.path.join(cache_dir, cache_name)) and
+            os.path.exists(os.path.join(cache_dir, _sed_cache_index_name(cache_name)))):
+        try:
+            old_entries, old_dtype = _read_sed_cache_index(cache_dir, cache_name)
+            if len(old_entries) > 0:
+                old_data = numpy.memmap(os.path.join(cache_dir, cache_name),
+                                        dtype=old_dtype, mode='r').view(numpy.ndarray)
+        except:
+            old_entries = {}
+            old_data = None
+
+    # decide which files can be copied from the existing cache
+    manifest = {}
+    reuse_dict = {}
+    parse_list = []
+    for full_name in file_name_list:
+        rel_name = os.path.relpath(full_name, sed_root)
+        stat = os.stat(full_name)
+        if rel_name in old_entries and old_data is not None:
+            offset, length, size, mtime, checksum = old_entries[rel_name][:5]
+            if size == stat.st_size and mtime == stat.st_mtime:
+                reuse_dict[full_name] = (offset, length)
+                manifest[rel_name] = (size, mtime, checksum)
+                continue
+            if size == stat.st_size and checksum == _sed_file_checksum(full_name):
+                reuse_dict[full_name] = (offset, length)
+                manifest[rel_name] = (size, stat.st_mtime, checksum)
+                continue
+        manifest[rel_name] = (stat.st_size, stat.st_mtime, None)
+        parse_list.append(full_name)
+
+    total_files = len(parse_list)
+
+    t_start = time.time()
+    if len(reuse_dict) > 0:
+        print("Re-using %d unchanged SEDs from the existing cache." % len(reuse_dict))
+    if total_files > 0:
+        print("Parsing %d SED files.  This could take a while." % total_files)
+        print("Note: not all SED files are the same size. ")
+        print("Do not expect the loading rate to be uniform.\n")
+
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+
+    def sed_iterator():
+        for full_name in file_name_list:
+            if full_name in reuse_dict:
+                offset, length = reuse_dict[full_name]
+                yield (os.path.relpath(full_name, sed_root),
+                       old_data[offset:offset+length],
+                       old_data[offset+length:offset+2*length])
+
+        if total_files == 0:
+            return
+
+        if n_processes > 1:
+            pool = multiprocessing.Pool(n_processes)
+            result_iterator = pool.imap(_parse_sed_file, parse_list, chunksize=8)
+        else:
+            pool = None
+            result_iterator = (_parse_sed_file(full_name) for full_name in parse_list)
+
+        try:
+            ct = 0
+            for full_name, wavelen, flambda, checksum in result_iterator:
+                ct += 1
+                if ct % max(1, total_files//20) == 0:
+                    if ct > total_files//20:
+                        sys.stdout.write('\r')
+                    sys.stdout.write('loaded %d of %d files in about %.2f seconds'
+                                     % (ct, total_files, time.time()-t_start))
+                    sys.stdout.flush()
+                rel_name = os.path.relpath(full_name, sed_root)
+                if wavelen is None:
+                    manifest.pop(rel_name)
+                    continue
+                manifest[rel_name] = manifest[rel_name][:2] + (checksum,)
+                yield rel_name, wavelen, flambda
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    _write_sed_cache(cache_dir, cache_name, sed_iterator(), manifest=manifest,
+                     stamp_root=sed_root)
+    del old_data
+
+    print('\n')
+
+    print('LSST SED cache saved to:\n')
+    print('%s' % os.path.join(cache_dir, cache_name))
+
+    # record the specific sims_sed_library directory being cached so that
+    # the cache will be updated if sims_sed_library gets updated
+    with open(os.path.join(cache_dir, "cache_version_%d.txt" % sys.version_info.major), "w") as file_handle:
+        file_handle.write("%s %s" % (sed_root, cache_name))
+
+    return _load_sed_cache(cache_dir, cache_name, root_dir=sed_root, sub_dirs=sub_dirs,
+                           wavelen_min=wavelen_min, wavelen_max=wavelen_max)
+
+
+def cache_LSST_seds(wavelen_min=None, wavelen_max=None, n_processes=None, verify=False,
+                    sub_dirs=None):
+    """
+    Read all of the SEDs in sims_sed_library into a flat binary data file
+    (plus an index of where each SED lives in that file), stored in
+    sims_sed_library/lsst_sed_cache_dir/ for future use.
+
+    After the file has initially been created, the next time you run this script,
+    it will just memory-map the data file with numpy.memmap.  SEDs are then
+    read from the operating system's page cache as they are used, and the
+    pages are shared between every process that has loaded the cache.
+
+    Once the cache is loaded, Sed.readSED_flambda() will be able to read any
+    LSST-shipped SED directly from memory, rather than using I/O to read it
+    from an ASCII file stored on disk.
+
+    Note: the cache will take up about 1.5GB on disk.  Generating it from
+    scratch parses every file in sims_sed_library (about 14 minutes on a single
+    core; the files are parsed in parallel over n_processes processes).
+    When sims_sed_library is updated, only the new or changed files are parsed;
+    everything else is copied from the existing cache.  Loading the cache only
+    requires reading the index, which takes well under a second.  If a cache in
+    the older pickled format is found, it will be converted to the new format
+    rather than regenerated.
+
+    Whether sims_sed_library has changed is decided from the manifest stored
+    with the cache: the version of sims_sed_library and the modification times
+    of the directories it was made from (which change when files are added or
+    removed).  This takes one stat per directory, rather than a walk over the
+    library or a stat of every file.  The number of SEDs and a checksum of the
+    index are also stored, to detect a corrupt index.  A checksum of the size
+    and modification time of every file is stored as well; it catches files
+    overwritten in place, but costs one stat per file, so it is only checked
+    (along with the full check of the cache against the library; see
+    verify_LSST_sed_cache) if verify is True.
+
+    Parameters (optional)
+    ---------------------
+    wavelen_min a float
+
+    wavelen_max a float
+
+    if either of these are not None, then every SED in the cache will be
+    truncated to only include the wavelength range (in nm) between
+    wavelen_min and wavelen_max.  The truncation is done while the cache
+    is loaded; the truncated SEDs are still views into the memory-mapped file.
+
+    n_processes an int
+
+    the number of processes used to parse SED files if the cache has to be
+    generated or updated (defaults to multiprocessing.cpu_count())
+
+    verify a boolean
+
+    if True, run verify_LSST_sed_cache on the loaded cache (default False)
+
+    sub_dirs a list of strings
+
+    the sub-libraries of sims_sed_library to load, as paths relative to
+    sims_sed_library (e.g. ['starSED/kurucz', 'galaxySED']).  If None (the
+    default) every SED is loaded.  SEDs outside these sub-libraries are
+    read from their ASCII files as if there were no cache.  The cache on
+    disk always covers the whole library.
+    """
+
+    global _global_lsst_sed_cache
+    global _global_lsst_sed_cache_segment
+    global _global_lsst_sed_cache_selection
+    _global_lsst_sed_cache_segment = None
+    if sub_dirs is not None:
+        sub_dirs = _normalize_sed_sub_dirs(sub_dirs)
+    _global_lsst_sed_cache_selection = (sub_dirs, wavelen_min, wavelen_max)
+    try:
+        sed_cache_dir = os.path.join(getPackageDir('sims_sed_library'), 'lsst_sed_cache_dir')
+        sed_cache_name = os.path.join('lsst_sed_cache_%d.dat' % sys.version_info.major)
+        legacy_cache_name = os.path.join('lsst_sed_cache_%d.p' % sys.version_info.major)
+        sed_dir = getPackageDir('sims_sed_library')
+
+    except:
+        print("You did not install sims_photUtils with the full LSST simulations "
+              "stack. You cannot generate and load the cache of LSST SEDs")
+        return
+
+    if not os.path.exists(sed_cache_dir):
+        os.mkdir(sed_cache_dir)
+
+    must_generate = False
+    can_convert = False
+    if not os.path.exists(os.path.join(sed_cache_dir, sed_cache_name)):
+        must_generate = True
+    if not os.path.exists(os.path.join(sed_cache_dir, _sed_cache_index_name(sed_cache_name))):
+        must_generate = True
+    if not os.path.exists(os.path.join(sed_cache_dir, "cache_version_%d.txt" % sys.version_info.major)):
+        must_generate = True
+    else:
+        with open(os.path.join(sed_cache_dir, "cache_version_%d.txt" % sys.version_info.major), "r") as input_file:
+            lines = input_file.readlines()
+            if len(lines) != 1:
+                must_generate = True
+            else:
+                info = lines[0].split()
+                if len(info) != 2:
+                    must_generate = True
+                elif info[0] != sed_dir:
+                    must_generate = True
+                elif info[1] != sed_cache_name:
+                    must_generate = True
+                    if (info[1] == legacy_cache_name and
+                            os.path.exists(os.path.join(sed_cache_dir, legacy_cache_name))):
+                        can_convert = True
+
+    if must_generate and can_convert:
+        print("\nConverting pickled cache of LSST SEDs in:\n%s" % os.path.join(sed_cache_dir, legacy_cache_name))
+        _convert_legacy_sed_cache(sed_cache_dir, legacy_cache_name, sed_cache_name, sed_dir)
+        with open(os.path.join(sed_cache_dir, "cache_version_%d.txt" % sys.version_info.major), "w") as file_handle:
+            file_handle.write("%s %s" % (sed_dir, sed_cache_name))
+        must_generate = False
+
+    if not must_generate and _sed_library_changed(sed_cache_dir, sed_cache_name, sed_dir):
+        print("\nsims_sed_library has changed since the cache of LSST SEDs was made")
+        must_generate = True
+
+    if not must_generate and verify and _sed_library_files_changed(sed_cache_dir, sed_cache_name,
+                                                                   sed_dir):
+        print("\nA file in sims_sed_library has changed since the cache of LSST SEDs was made")
+        must_generate = True
+
+    if not must_generate:
+        print("\nOpening cache of LSST SEDs in:\n%s" % os.path.join(sed_cache_dir, sed_cache_name))
+        try:
+            _global_lsst_sed_cache = _load_sed_cache(sed_cache_dir, sed_cache_name, root_dir=sed_dir,
+                                                     sub_dirs=sub_dirs, wavelen_min=wavelen_min,
+                                                     wavelen_max=wavelen_max)
+        except SedCacheError as ee:
+            print(str(ee))
+            must_generate = True
+
+    if must_generate:
+        print("\nCreating cache of LSST SEDs in:\n%s" % os.path.join(sed_cache_dir, sed_cache_name))
+        cache = _generate_sed_cache(sed_cache_dir, sed_cache_name, n_processes=n_processes,
+                                    sub_dirs=sub_dirs, wavelen_min=wavelen_min,
+                                    wavelen_max=wavelen_max)
+        _global_lsst_sed_cache = cache
+
+    # If requested, run the full check of the cache against sims_sed_library.
+    # If it fails, _global_lsst_sed_cache will be set to 'None' and the code will
+    # continue running.
+    if verify:
+        try:
+            verify_LSST_sed_cache()
+        except SedCacheError as ee:
+            print(str(ee))
+            print("Cannot use cache of LSST SEDs")
+            _global_lsst_sed_cache = None
+
+    return
+
+
+class SharedSedCacheHandle(object):
+    """
+    A small, picklable description of a cache of LSST SEDs which has been
+    published in shared memory with publish_LSST_sed_cache.  Pass it to
+    attach_LSST_sed_cache in worker processes.
+    """
+
+    def __init__(self, segmentName, names, offsets, lengths, gridIds=None):
+        self._segment_name = segmentName
+        self._names = names
+        self._offsets = offsets
+        self._lengths = lengths
+        # SEDs with the same grid id share the same wavelen array
+        self._grid_ids = gridIds
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def segmentName(self):
+        """
+        The name of the shared memory segment holding the SEDs
+        """
+        return self._segment_name
+
+    @property
+    def nElements(self):
+        """
+        The number of floats in the shared memory segment
+        """
+        return int(2*self._lengths.sum())
+
+
+# the shared memory segments this process is attached to, and the names
+# of those segments which this process created
+_global_shared_sed_segments = {}
+_global_published_sed_segments = set()
+
+
+def _open_shared_segment(segment_name):
+    """
+    Attach to an existing shared memory segment without registering it with
+    this process's resource tracker (where that is possible); the segment
+    belongs to the process which published it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=segment_name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=segment_name)
+
+
+def publish_LSST_sed_cache():
+    """
+    Copy the currently loaded cache of LSST SEDs (see cache_LSST_seds) into
+    a multiprocessing.shared_memory segment, so that worker processes can
+    read every SED without holding a private copy of the cache.
+
+    The cache in this process is replaced by read-only views of the
+    shared segment.  Pass the returned handle to attach_LSST_sed_cache in
+    each worker, e.g.
+
+        handle = publish_LSST_sed_cache()
+        pool = multiprocessing.Pool(n_workers, initializer=attach_LSST_sed_cache,
+                                    initargs=(handle,))
+
+    and call release_LSST_sed_cache(handle) in this process when all of
+    the workers are finished.
+
+    Returns
+    -------
+    A SharedSedCacheHandle
+    """
+    if shared_memory is None:
+        raise RuntimeError("publish_LSST_sed_cache requires multiprocessing.shared_memory "
+                           "(python 3.8 or later)")
+    if _global_lsst_sed_cache is None:
+        raise RuntimeError("There is no cache of LSST SEDs to publish; "
+                           "call cache_LSST_seds() first")
+
+    names = numpy.array(list(_global_lsst_sed_cache.keys()), dtype=str)
+    lengths = numpy.array([len(_global_lsst_sed_cache[name][0]) for name in names],
+                          dtype=numpy.int64)
+    # SEDs on the same interned grid hold the same wavelen array
+    grid_ids = {}
+    grid_id_arr = numpy.array([grid_ids.setdefault(id(_global_lsst_sed_cache[name][0]), len(grid_ids))
+                               for name in names], dtype=numpy.int64)
+    offsets = numpy.zeros(len(lengths), dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum(2*lengths)[:-1]
+    n_elements = int(2*lengths.sum())
+
+    segment = shared_memory.SharedMemory(create=True,
+                                         size=max(1, n_elements*numpy.dtype(float).itemsize))
+    data = numpy.ndarray((n_elements,), dtype=float, buffer=segment.buf)
+    for name, offset, length in zip(names, offsets, lengths):
+        wavelen, flambda = _global_lsst_sed_cache[name]
+        data[offset:offset+length] = wavelen
+        data[offset+length:offset+2*length] = flambda
+    del data
+
+    _global_shared_sed_segments[segment.name] = segment
+    _global_published_sed_segments.add(segment.name)
+    handle = SharedSedCacheHandle(segment.name, names, offsets, lengths, gridIds=grid_id_arr)
+    attach_LSST_sed_cache(handle)
+    return handle
+
+
+def attach_LSST_sed_cache(handle):
+    """
+    Load the cache of LSST SEDs published in shared memory by
+    publish_LSST_sed_cache.  Sed.readSED_flambda (and read_close_Kurucz)
+    will then read SEDs directly from the shared segment; nothing is copied.
+
+    Parameters
+    ----------
+    handle is the SharedSedCacheHandle returned by publish_LSST_sed_cache
+    """
+    global _global_lsst_sed_cache
+    global _global_lsst_sed_cache_segment
+
+    if shared_memory is None:
+        raise RuntimeError("attach_LSST_sed_cache requires multiprocessing.shared_memory "
+                           "(python 3.8 or later)")
+
+    segment = _global_shared_sed_segments.get(handle.segmentName)
+    if segment is None:
+        segment = _open_shared_segment(handle.segmentName)
+        _global_shared_sed_segments[handle.segmentName] = segment
+
+    data = _read_only_view(numpy.ndarray((handle.nElements,), dtype=float, buffer=segment.buf))
+    grid_id_arr = handle._grid_ids
+    if grid_id_arr is None:
+        grid_id_arr = -1*numpy.ones(len(handle._names), dtype=numpy.int64)
+    # the grids are interned once, as in _load_sed_cache
+    grids = {}
+    cache = {}
+    for name, offset, length, grid_id in zip(handle._names, handle._offsets, handle._lengths,
+                                             grid_id_arr):
+        wavelen = data[offset:offset+length]
+        if grid_id >= 0:
+            if grid_id not in grids:
+                grids[grid_id] = _pin_wavelen_grid(wavelen)
+            wavelen = grids[grid_id]
+        cache[str(name)] = (wavelen, data[offset+length:offset+2*length])
+    _global_lsst_sed_cache = cache
+    _global_lsst_sed_cache_segment = handle.segmentName
+
+
+def release_LSST_sed_cache(handle):
+    """
+    Detach this process from the cache of LSST SEDs published by
+    publish_LSST_sed_cache and, if this is the process which published it,
+    free the shared memory segment.
+
+    Parameters
+    ----------
+    handle is the SharedSedCacheHandle returned by publish_LSST_sed_cache
+    """
+    global _global_lsst_sed_cache
+    global _global_lsst_sed_cache_segment
+
+    segment = _global_shared_sed_segments.pop(handle.segmentName, None)
+    if segment is None:
+        return
+
+    if _global_lsst_sed_cache_segment == handle.segmentName:
+        _global_lsst_sed_cache = None
+        _global_lsst_sed_cache_segment = None
+
+    try:
+        segment.close()
+    except BufferError:
+        # Seds still refer to the segment; it will be unmapped
+        # when this process exits
+        pass
+
+    if handle.segmentName in _global_published_sed_segments:
+        _global_published_sed_segments.discard(handle.segmentName)
+        segment.unlink()
+
+
+class _ResampledSedCache(object):
+    """
+    Templates from one or more SED libraries, resampled onto a single
+    wavelength grid, with fnu already calculated (see cache_resampled_seds).
+    """
+
+    def __init__(self, wavelen):
+        self._wavelen = intern_wavelen_grid(wavelen)
+        self._stores = {}
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def addStore(self, root_dir, names, flambda, fnu, imsim_mag):
+        """
+        Add a library of resampled templates to the cache.
+
+        @param [in] root_dir is the directory relative to which names are given
+
+        @param [in] names is an array of the template file names
+
+        @param [in] flambda is a 2-D array; flambda[i] is template names[i]
+        resampled onto this cache's wavelength grid
+
+        @param [in] fnu is the corresponding 2-D array of fnu
 
+        @param [in] imsim_mag is an array of the magnitude of each template in
+        the imsim bandpass, calculated on the template's own wavelength grid
+        """
+        self._stores[root_dir] = (flambda, fnu, imsim_mag)
+        for ix, name in enumerate(names):
+            self._rows[os.path.join(root_dir, str(name))] = (root_dir, ix)
 
-def _compare_cached_versus_uncached():
-    """
-    Verify that loading an SED from the pickled cache give identical
-    results to loading the same SED from ASCII
-    """
-    sed_dir = os.path.join(getPackageDir('sims_sed_library'),
-                           'starSED', 'kurucz')
+    def matchesGrid(self, wavelen_match):
+        """
+        Return True if wavelen_match is this cache's wavelength grid
+        (to the tolerance used by Sed._needResample)
+        """
+        if wavelen_match is self._wavelen:
+            return True
+        if numpy.shape(wavelen_match) != self._wavelen.shape:
+            return False
+        return not numpy.any(abs(wavelen_match-self._wavelen) > 1e-10)
 
-    dtype = numpy.dtype([('wavelen', float), ('flambda', float)])
+    def get(self, file_name):
+        """
+        Return (wavelen, flambda, fnu, imsim_mag) for the template in file_name
+        (as read-only arrays) or None if the template is not in the cache.
+        """
+        if file_name in self._rows:
+            root_dir, ix = self._rows[file_name]
+        elif file_name + '.gz' in self._rows:
+            root_dir, ix = self._rows[file_name + '.gz']
+        else:
+            return None
+        flambda, fnu, imsim_mag = self._stores[root_dir]
+        return self._wavelen, flambda[ix], fnu[ix], imsim_mag[ix]
 
-    sed_name_list = os.listdir(sed_dir)
-    msg = ('An SED loaded from the pickled cache is not '
-           'identical to the same SED loaded from ASCII; '
-           'it is possible that the pickled cache was incorrectly '
-           'created in sims_sed_library\n\n'
-           'Try removing the cache file (the name should hav been printed '
-           'to stdout above) and re-running sims_photUtils.cache_LSST_seds()')
-    for ix in range(5):
-        full_name = os.path.join(sed_dir, sed_name_list[ix])
-        from_np = numpy.genfromtxt(full_name, dtype=dtype)
-        ss_cache = Sed()
-        ss_cache.readSED_flambda(full_name)
-        ss_uncache = Sed(wavelen=from_np['wavelen'],
-                         flambda=from_np['flambda'],
-                         name=full_name)
+    @property
+    def wavelen(self):
+        """
+        The wavelength grid of this cache
+        """
+        return self._wavelen
 
-        if not ss_cache == ss_uncache:
-            raise SedCacheError(msg)
 
+_global_resampled_sed_caches = {}
+if sims_clean_up is not None:
+    sims_clean_up.targets.append(_global_resampled_sed_caches)
 
-def _generate_sed_cache(cache_dir, cache_name):
+
+def _find_resampled_sed_cache(wavelen_match):
+    """
+    Return the _ResampledSedCache whose wavelength grid is wavelen_match,
+    or None if no templates have been cached on that grid.
     """
-    Read all of the SEDs from sims_sed_library into a dict.
-    Pickle the dict and store it in
-    sims_photUtils/cacheDir/lsst_sed_cache.p
+    for cache in _global_resampled_sed_caches.values():
+        if cache.matchesGrid(wavelen_match):
+            return cache
+    return None
 
-    Parameters
-    ----------
-    cache_dir is the directory where the cache will be created
-    cache_name is the name of the cache to be created
 
-    Returns
-    -------
-    The dict of SEDs (keyed to their full file name)
+def _get_resampled_source(sedobj, wavelen_match):
     """
-    sed_root = getPackageDir('sims_sed_library')
-    dtype = numpy.dtype([('wavelen', float), ('flambda', float)])
+    If sedobj still contains exactly the template it read with readSED_flambda
+    and that template has been cached on the grid wavelen_match, return
+    (wavelen, flambda, fnu, imsim_mag) from the cache.  Otherwise, return None.
+    """
+    source = getattr(sedobj, '_source_file', None)
+    if source is None or sedobj.wavelen is not source[1] or sedobj.flambda is not source[2]:
+        return None
+    cache = _find_resampled_sed_cache(wavelen_match)
+    if cache is None:
+        return None
+    return cache.get(source[0])
 
-    sub_dir_list = ['agnSED', 'flatSED', 'ssmSED', 'starSED', 'galaxySED']
 
-    cache = {}
+def _wavelen_grid_hash(wavelen):
+    """
+    Return a hex string identifying the wavelength grid wavelen
+    """
+    # interned grids were hashed when they were interned
+    fingerprint = _global_wavelen_grids.fingerprint(wavelen)
+    if fingerprint is not None:
+        return fingerprint.hash
+    return hashlib.md5(numpy.ascontiguousarray(wavelen, dtype=float).tobytes()).hexdigest()[:16]
 
-    total_files = 0
-    for sub_dir in sub_dir_list:
-        dir_tree = os.walk(os.path.join(sed_root, sub_dir))
-        for sub_tree in dir_tree:
-            total_files += len([name for name in sub_tree[2] if name.endswith('.gz')])
 
-    t_start = time.time()
-    print("This could take about 15 minutes.")
-    print("Note: not all SED files are the same size. ")
-    print("Do not expect the loading rate to be uniform.\n")
+def _generate_resampled_sed_cache(wavelen_match, file_name_list, sed_root, cache_dir, cache_name,
+                                  dtype=float):
+    """
+    Resample every SED in file_name_list onto wavelen_match, calculate fnu
+    and write the results (as dtype) to cache_dir (see cache_resampled_seds).
+    """
+    from .SedUtils import _getImsimMag
+
+    n_wavelen = len(wavelen_match)
+    flambda_name = os.path.join(cache_dir, cache_name + '_flambda.npy')
+    fnu_name = os.path.join(cache_dir, cache_name + '_fnu.npy')
+    flambda_out = numpy.lib.format.open_memmap(flambda_name + '.tmp', mode='w+', dtype=dtype,
+                                               shape=(len(file_name_list), n_wavelen))
+    fnu_out = numpy.lib.format.open_memmap(fnu_name + '.tmp', mode='w+', dtype=dtype,
+                                           shape=(len(file_name_list), n_wavelen))
+
+    names = []
+    sizes = []
+    mtimes = []
+    valid = []
+    imsim_mag = []
+    for ix, full_name in enumerate(file_name_list):
+        stat = os.stat(full_name)
+        names.append(os.path.relpath(full_name, sed_root))
+        sizes.append(stat.st_size)
+        mtimes.append(stat.st_mtime)
 
-    for sub_dir in sub_dir_list:
-        dir_tree = os.walk(os.path.join(sed_root, sub_dir))
-        for sub_tree in dir_tree:
-            dir_name = sub_tree[0]
-            file_list = sub_tree[2]
+        cached_source = None
+        if _global_lsst_sed_cache is not None:
+            cached_source = _global_lsst_sed_cache.get(full_name)
+        if cached_source is None:
+            cached_source = _parse_sed_file(full_name)[1:3]
+            if cached_source[0] is None:
+                # this file could not be read; it is recorded (so that the
+                # cache stays valid) but will never be returned
+                valid.append(False)
+                imsim_mag.append(numpy.NaN)
+                continue
+        valid.append(True)
 
-            for file_name in file_list:
-                if file_name.endswith('.gz'):
-                    try:
-                        full_name = os.path.join(dir_name, file_name)
-                        data = numpy.genfromtxt(full_name, dtype=dtype)
-                        cache[full_name] = (data['wavelen'], data['flambda'])
-                        if len(cache) % (total_files/20) == 0:
-                            if len(cache) > total_files/20:
-                                sys.stdout.write('\r')
-                            sys.stdout.write('loaded %d of %d files in about %.2f seconds'
-                                             % (len(cache), total_files, time.time()-t_start))
-                            sys.stdout.flush()
-                    except:
-                        pass
+        ss = Sed(wavelen=cached_source[0], flambda=cached_source[1])
+        try:
+            imsim_mag.append(_getImsimMag(ss))
+        except RuntimeError:
+            # this template cannot be normalized in the imsim bandpass
+            imsim_mag.append(numpy.NaN)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            ss.resampleSED(wavelen_match=wavelen_match)
+        ss.flambdaTofnu()
+
+        flambda_out[ix] = ss.flambda
+        fnu_out[ix] = ss.fnu
+
+    flambda_out.flush()
+    fnu_out.flush()
+    del flambda_out
+    del fnu_out
+
+    os.rename(flambda_name + '.tmp', flambda_name)
+    os.rename(fnu_name + '.tmp', fnu_name)
+
+    index_name = os.path.join(cache_dir, cache_name + '_index.npz')
+    with open(index_name + '.tmp', 'wb') as file_handle:
+        numpy.savez(file_handle,
+                    wavelen=numpy.asarray(wavelen_match, dtype=float),
+                    names=numpy.array(names, dtype=str),
+                    sizes=numpy.array(sizes, dtype=numpy.int64),
+                    mtimes=numpy.array(mtimes, dtype=float),
+                    valid=numpy.array(valid, dtype=bool),
+                    imsim_mag=numpy.array(imsim_mag, dtype=float))
+    os.rename(index_name + '.tmp', index_name)
+
+
+def _load_resampled_sed_cache(file_name_list, sed_root, cache_dir, cache_name):
+    """
+    Memory-map the resampled SEDs in cache_dir/cache_name*.
 
-    print('\n')
+    Returns (wavelen, names, flambda, fnu, imsim_mag) for the templates which
+    could be read when the cache was generated, or None if the cache
+    does not exist or was not made from exactly the files in file_name_list
+    (as they currently are on disk).
+    """
+    index_name = os.path.join(cache_dir, cache_name + '_index.npz')
+    flambda_name = os.path.join(cache_dir, cache_name + '_flambda.npy')
+    fnu_name = os.path.join(cache_dir, cache_name + '_fnu.npy')
+    for name in (index_name, flambda_name, fnu_name):
+        if not os.path.exists(name):
+            return None
+
+    with numpy.load(index_name) as index:
+        wavelen = index['wavelen']
+        names = index['names']
+        sizes = index['sizes']
+        mtimes = index['mtimes']
+        valid = index['valid']
+        imsim_mag = index['imsim_mag']
+
+    if len(names) != len(file_name_list):
+        return None
+    manifest = dict(zip([str(nn) for nn in names], zip(sizes, mtimes)))
+    for full_name in file_name_list:
+        rel_name = os.path.relpath(full_name, sed_root)
+        if rel_name not in manifest:
+            return None
+        stat = os.stat(full_name)
+        if manifest[rel_name] != (stat.st_size, stat.st_mtime):
+            return None
+
+    flambda = numpy.load(flambda_name, mmap_mode='r').view(numpy.ndarray)
+    fnu = numpy.load(fnu_name, mmap_mode='r').view(numpy.ndarray)
+    valid_dexes = numpy.where(valid)[0]
+    if len(valid_dexes) < len(valid):
+        # the rows of templates which could not be read are never used
+        names = names[valid_dexes]
+        imsim_mag = imsim_mag[valid_dexes]
+        flambda = flambda[valid_dexes]
+        fnu = fnu[valid_dexes]
+    return wavelen, names, flambda, fnu, _read_only_view(imsim_mag)
+
+
+def cache_resampled_seds(wavelen_match, sed_dir=None, sub_dir_list=None, cache_dir=None, dtype=None):
+    """
+    Cache a library of SEDs resampled onto the wavelength grid wavelen_match
+    (e.g. BandpassDict.wavelenMatch), with fnu already calculated.
+
+    The first time this is run for a given (library, wavelength grid) pair,
+    every SED in the library is read, resampled and converted to fnu, and the
+    results are written to cache_dir.  Thereafter, the results are just
+    memory-mapped.  The cache is regenerated if any file in the library is
+    added, removed or modified.
+
+    Once the cache is loaded, SedList (constructed with wavelenMatch=wavelen_match
+    and the default imsim normalization) will take SEDs which are not redshifted
+    and have no internal dust directly from it, and BandpassDict.magListForSed
+    and fluxListForSed will use it for SEDs which were read with readSED_flambda
+    and not subsequently altered.  Neither has to resample the SED or
+    convert it to fnu.
 
-    with open(os.path.join(cache_dir, cache_name), "wb") as file_handle:
-        pickle.dump(cache, file_handle)
+    Parameters
+    ----------
+    wavelen_match is a numpy array; the wavelength grid (in nm)
 
-    print('LSST SED cache saved to:\n')
-    print('%s' % os.path.join(cache_dir, cache_name))
+    sed_dir is the root directory of the SED library (defaults to sims_sed_library)
 
-    # record the specific sims_sed_library directory being cached so that
-    # a new cache will be generated if sims_sed_library gets updated
-    with open(os.path.join(cache_dir, "cache_version_%d.txt" % sys.version_info.major), "w") as file_handle:
-        file_handle.write("%s %s" % (sed_root, cache_name))
+    sub_dir_list is the list of sub-directories of sed_dir whose gzipped SED
+    files are cached (defaults to all of the SED directories in sims_sed_library)
 
-    return cache
+    cache_dir is the directory in which the cache is stored (defaults to
+    sed_dir/lsst_sed_cache_dir)
 
+    dtype is the dtype in which flambda and fnu are stored (float32 or float64;
+    defaults to the dtype set by set_flux_dtype).  Caches of either dtype can
+    exist side by side; the one loaded last is used.
 
-def cache_LSST_seds(wavelen_min=None, wavelen_max=None):
+    Returns
+    -------
+    The number of SEDs in the cache
     """
-    Read all of the SEDs in sims_sed_library into a dict.  Pickle the dict
-    and store it in sims_photUtils/cacheDir/lsst_sed_cache.p for future use.
+    if sed_dir is None:
+        sed_dir = getPackageDir('sims_sed_library')
+    if sub_dir_list is None:
+        sub_dir_list = _lsst_sed_sub_dirs
+    if cache_dir is None:
+        cache_dir = os.path.join(sed_dir, 'lsst_sed_cache_dir')
+    if not os.path.exists(cache_dir):
+        os.mkdir(cache_dir)
 
-    After the file has initially been created, the next time you run this script,
-    it will just use pickle to load the dict.
+    wavelen_match = numpy.asarray(wavelen_match, dtype=float)
+    grid_hash = _wavelen_grid_hash(wavelen_match)
+    library_hash = hashlib.md5(("%s %s" % (os.path.abspath(sed_dir),
+                                           ' '.join(sorted(sub_dir_list)))).encode()).hexdigest()[:16]
+    cache_name = 'resampled_sed_cache_%s_%s' % (library_hash, grid_hash)
+    dtype = _check_flux_dtype(dtype)
+    if dtype != numpy.dtype(numpy.float64):
+        cache_name += '_%s' % dtype.name
 
-    Once the dict is loaded, Sed.readSED_flambda() will be able to read any
-    LSST-shipped SED directly from memory, rather than using I/O to read it
-    from an ASCII file stored on disk.
+    file_name_list = sorted(_list_sed_files(sed_dir, sub_dir_list))
 
-    Note: the dict of cached SEDs will take up about 5GB on disk.  Once loaded,
-    the cache will take up about 1.5GB of memory.  The cache takes about 14 minutes
-    to generate and about 51 seconds to load on a 2014 Mac Book Pro.
+    loaded = _load_resampled_sed_cache(file_name_list, sed_dir, cache_dir, cache_name)
+    if loaded is None:
+        print("\nCreating cache of resampled SEDs in:\n%s" % os.path.join(cache_dir, cache_name))
+        _generate_resampled_sed_cache(wavelen_match, file_name_list, sed_dir, cache_dir, cache_name,
+                                      dtype=dtype)
+        loaded = _load_resampled_sed_cache(file_name_list, sed_dir, cache_dir, cache_name)
 
-    Parameters (optional)
-    ---------------------
-    wavelen_min a float
+    wavelen, names, flambda, fnu, imsim_mag = loaded
 
-    wavelen_max a float
+    if grid_hash not in _global_resampled_sed_caches:
+        _global_resampled_sed_caches[grid_hash] = _ResampledSedCache(wavelen)
+    _global_resampled_sed_caches[grid_hash].addStore(sed_dir, names, flambda, fnu, imsim_mag)
 
-    if either of these are not None, then every SED in the cache will be
-    truncated to only include the wavelength range (in nm) between
-    wavelen_min and wavelen_max
-    """
+    return len(names)
 
-    global _global_lsst_sed_cache
-    try:
-        sed_cache_dir = os.path.join(getPackageDir('sims_sed_library'), 'lsst_sed_cache_dir')
-        sed_cache_name = os.path.join('lsst_sed_cache_%d.p' % sys.version_info.major)
-        sed_dir = getPackageDir('sims_sed_library')
 
-    except:
-        print("You did not install sims_photUtils with the full LSST simulations "
-              "stack. You cannot generate and load the cache of LSST SEDs")
-        return
+def _sed_flambda_is_cached(filename):
+    """
+    Return True if _read_sed_flambda can take the SED in filename from
+    one of the caches without reading the file.
+    """
+    if filename.endswith('.gz'):
+        unzipped_filename = filename[:-3]
+    else:
+        unzipped_filename = filename
+    if _global_lsst_sed_cache is not None:
+        if unzipped_filename in _global_lsst_sed_cache or unzipped_filename + '.gz' in _global_lsst_sed_cache:
+            return True
+    return unzipped_filename in _global_misc_sed_cache
 
-    if not os.path.exists(sed_cache_dir):
-        os.mkdir(sed_cache_dir)
 
-    must_generate = False
-    if not os.path.exists(os.path.join(sed_cache_dir, sed_cache_name)):
-        must_generate = True
-    if not os.path.exists(os.path.join(sed_cache_dir, "cache_version_%d.txt" % sys.version_info.major)):
-        must_generate = True
+def _read_sed_flambda(filename):
+    """
+    Return (file name, wavelen, flambda) for the SED in filename, taken from
+    the cache of LSST SEDs or the cache of other SEDs if possible.  Otherwise
+    the file is read and added to the cache of other SEDs.  wavelen and flambda
+    are read-only arrays (see Sed.readSED_flambda).
+    """
+    # Try to open data file.
+    # ASSUME that if filename ends with '.gz' that the file is gzipped. Otherwise, regular file.
+    if filename.endswith('.gz'):
+        gzipped_filename = filename
+        unzipped_filename = filename[:-3]
     else:
-        with open(os.path.join(sed_cache_dir, "cache_version_%d.txt" % sys.version_info.major), "r") as input_file:
-            lines = input_file.readlines()
-            if len(lines) != 1:
-                must_generate = True
-            else:
-                info = lines[0].split()
-                if len(info) != 2:
-                    must_generate = True
-                elif info[0] != sed_dir:
-                    must_generate = True
-                elif info[1] != sed_cache_name:
-                    must_generate = True
+        gzipped_filename = filename + '.gz'
+        unzipped_filename = filename
+
+    cached_source = None
+    if _global_lsst_sed_cache is not None:
+        if gzipped_filename in _global_lsst_sed_cache:
+            cached_source = _global_lsst_sed_cache[gzipped_filename]
+        elif unzipped_filename in _global_lsst_sed_cache:
+            cached_source = _global_lsst_sed_cache[unzipped_filename]
+
+    if cached_source is None:
+        cached_source = _global_misc_sed_cache.get(unzipped_filename)
+
+    if cached_source is not None:
+        # the grids of both caches were interned when they were filled
+        # (see _load_sed_cache and WavelenGrids.py), so the wavelen array
+        # is shared as it is
+        sourcewavelen = cached_source[0]
+        sourceflambda = _read_only_view(cached_source[1])
+
+    if cached_source is None:
+        # Read source SED from file - lambda, flambda should be first two columns in the file.
+        # lambda should be in nm and flambda should be in ergs/cm2/s/nm
+        try:
+            sourcewavelen, sourceflambda = readAsciiColumns(gzipped_filename)
+        except Exception as err:
+            # see
+            # http://stackoverflow.com/questions/
+            # 9157210/how-do-i-raise-the-same-exception-with-a-custom-message-in-python
+            new_args = [str(err.args[0]) + \
+                        "\n\nError reading sed file %s; " % filename \
+                        + "it may not exist."]
+            for aa in err.args[1:]:
+                new_args.append(aa)
+            err.args = tuple(new_args)
+            raise
 
-    if must_generate:
-        print("\nCreating cache of LSST SEDs in:\n%s" % os.path.join(sed_cache_dir, sed_cache_name))
-        cache = _generate_sed_cache(sed_cache_dir, sed_cache_name)
-        _global_lsst_sed_cache = cache
-    else:
-        print("\nOpening cache of LSST SEDs in:\n%s" % os.path.join(sed_cache_dir, sed_cache_name))
-        with open(os.path.join(sed_cache_dir, sed_cache_name), 'rb') as input_file:
-            _global_lsst_sed_cache = sed_unpickler(input_file).load()
+        # the cache and this Sed share the same read-only arrays; templates
+        # sampled on the same grid share the same wavelen array
+        sourcewavelen = intern_wavelen_grid(sourcewavelen)
+        sourceflambda = _read_only_view(sourceflambda)
 
-    # Now that we have generated/loaded the cache, we must run tests
-    # to make sure that the cache is correctly constructed.  If these
-    # fail, _global_lsst_sed_cache will be set to 'None' and the code will
-    # continue running.
-    try:
-        _validate_sed_cache()
-        _compare_cached_versus_uncached()
-    except SedCacheError as ee:
-        print(ee.message)
-        print("Cannot use cache of LSST SEDs")
-        _global_lsst_sed_cache = None
-        pass
+        _global_misc_sed_cache[unzipped_filename] = (sourcewavelen, sourceflambda)
 
-    if wavelen_min is not None or wavelen_max is not None:
-        if wavelen_min is None:
-            wavelen_min = 0.0
-        if wavelen_max is None:
-            wavelen_max = numpy.inf
+    return (unzipped_filename, sourcewavelen, sourceflambda)
 
-        new_cache = {}
-        list_of_sed_names = list(_global_lsst_sed_cache.keys())
-        for file_name in list_of_sed_names:
-            wav, fl = _global_lsst_sed_cache.pop(file_name)
-            valid_dexes = numpy.where(numpy.logical_and(wav >= wavelen_min,
-                                                        wav <= wavelen_max))
-            new_cache[file_name] = (wav[valid_dexes], fl[valid_dexes])
 
-        _global_lsst_sed_cache = new_cache
+# a memo of the CCM dust coefficients (a_x, b_x) keyed to a fingerprint
+# of the wavelength grid they were calculated on
+_global_ccm_ab_cache = SedLRUCache(maxBytes=64*1024*1024)
+
+if sims_clean_up is not None:
+    sims_clean_up.targets.append(_global_ccm_ab_cache)
+
+
+def get_ccm_ab_cache():
+    """
+    Return the SedLRUCache holding the CCM dust coefficients (a_x, b_x)
+    calculated by Sed.setupCCMab, keyed to a fingerprint of each
+    wavelength grid.  Its maxBytes can be changed to tune its size.
+    """
+    return _global_ccm_ab_cache
 
-    return
+
+def _calc_ccm_ab(wavelen):
+    """
+    Calculate a(x) and b(x) for the CCM dust model (x=1/wavelen) on the
+    wavelength grid wavelen (in nm).  See Sed.setupCCMab.
+    """
+    # This extinction law taken from Cardelli, Clayton and Mathis ApJ 1989.
+    # The general form is A_l / A(V) = a(x) + b(x)/R_V  (where x=1/lambda in microns),
+    # then different values for a(x) and b(x) depending on wavelength regime.
+    # Also, the extinction is parametrized as R_v = A_v / E(B-V).
+    # Magnitudes of extinction (A_l) translates to flux by a_l = -2.5log(f_red / f_nonred).
+    a_x = numpy.zeros(len(wavelen), dtype='float')
+    b_x = numpy.zeros(len(wavelen), dtype='float')
+    # Convert wavelength to x (in inverse microns).
+    x = numpy.empty(len(wavelen), dtype=float)
+    nm_to_micron = 1/1000.0
+    x = 1.0 / (wavelen * nm_to_micron)
+    # Dust in infrared 0.3 /mu < x < 1.1 /mu (inverse microns).
+    condition = (x >= 0.3) & (x <= 1.1)
+    if len(a_x[condition]) > 0:
+        y = x[condition]
+        a_x[condition] = 0.574 * y**1.61
+        b_x[condition] = -0.527 * y**1.61
+    # Dust in optical/NIR 1.1 /mu < x < 3.3 /mu region.
+    condition = (x >= 1.1) & (x <= 3.3)
+    if len(a_x[condition]) > 0:
+        y = x[condition] - 1.82
+        a_x[condition] = 1 + 0.104*y - 0.609*y**2 + 0.701*y**3 + 1.137*y**4
+        a_x[condition] = a_x[condition] - 1.718*y**5 - 0.827*y**6 + 1.647*y**7 - 0.505*y**8
+        b_x[condition] = 1.952*y + 2.908*y**2 - 3.989*y**3 - 7.985*y**4
+        b_x[condition] = b_x[condition] + 11.102*y**5 + 5.491*y**6 - 10.805*y**7 + 3.347*y**8
+    # Dust in ultraviolet and UV (if needed for high-z) 3.3 /mu< x< 8 /mu.
+    condition = (x >= 3.3) & (x < 5.9)
+    if len(a_x[condition]) > 0:
+        y = x[condition]
+        a_x[condition] = 1.752 - 0.316*y - 0.104/((y-4.67)**2 + 0.341)
+        b_x[condition] = -3.090 + 1.825*y + 1.206/((y-4.62)**2 + 0.263)
+    condition = (x > 5.9) & (x < 8)
+    if len(a_x[condition]) > 0:
+        y = x[condition]
+        Fa_x = numpy.empty(len(a_x[condition]), dtype=float)
+        Fb_x = numpy.empty(len(a_x[condition]), dtype=float)
+        Fa_x = -0.04473*(y-5.9)**2 - 0.009779*(y-5.9)**3
+        Fb_x = 0.2130*(y-5.9)**2 + 0.1207*(y-5.9)**3
+        a_x[condition] = 1.752 - 0.316*y - 0.104/((y-4.67)**2 + 0.341) + Fa_x
+        b_x[condition] = -3.090 + 1.825*y + 1.206/((y-4.62)**2 + 0.263) + Fb_x
+    # Dust in far UV (if needed for high-z) 8 /mu < x < 10 /mu region.
+    condition = (x >= 8) & (x <= 11.)
+    if len(a_x[condition]) > 0:
+        y = x[condition]-8.0
+        a_x[condition] = -1.073 - 0.628*(y) + 0.137*(y)**2 - 0.070*(y)**3
+        b_x[condition] = 13.670 + 4.257*(y) - 0.420*(y)**2 + 0.374*(y)**3
+    return a_x, b_x
+
+
+def _ccm_ab(wavelen):
+    """
+    Return read-only arrays of a(x) and b(x) for the CCM dust model on the
+    wavelength grid wavelen, calculating them only if this grid has not
+    been seen before.
+    """
+    key = _wavelen_grid_hash(wavelen)
+    value = _global_ccm_ab_cache.get(key)
+    if value is None:
+        a_x, b_x = _calc_ccm_ab(wavelen)
+        value = (_read_only_view(a_x), _read_only_view(b_x))
+        _global_ccm_ab_cache[key] = value
+    return value
+
+
+def _ccm_dust(a_x, b_x, A_v, R_v):
+    """
+    Return the (n_seds x n_wavelen) array of the factors by which CCM dust
+    with the extinctions A_v and ratios R_v (1-D arrays with one value per SED)
+    multiplies flambda, i.e. 10**(-0.4*A_lambda) for every SED at once.
+
+    The arithmetic is done in the same order as Sed.addCCMDust, so that the
+    results are identical to adding the dust to each SED in turn.
+    """
+    A_v = numpy.asarray(A_v, dtype=float)
+    R_v = numpy.asarray(R_v, dtype=float)
+    if numpy.all(R_v == R_v[0]):
+        A_lambda = (a_x + b_x / R_v[0])[numpy.newaxis, :] * A_v[:, numpy.newaxis]
+    else:
+        A_lambda = (a_x[numpy.newaxis, :] + b_x[numpy.newaxis, :] / R_v[:, numpy.newaxis]) * \
+                   A_v[:, numpy.newaxis]
+    A_lambda *= -0.4
+    return numpy.power(10.0, A_lambda, out=A_lambda)
 
 
 class Sed(object):
@@ -396,13 +2008,20 @@ class Sed(object):
 
         Note that this does *not* regrid flambda and leaves fnu undefined.
         """
-        self.fnu = None
-        self.wavelen = None
-        self.flambda = None
+        self._fnu = None
+        self._wavelen = None
+        self._flambda = None
+        # a copy of self resampled onto a BandpassDict grid and the arrays
+        # it was made from (see _resampledCopy)
+        self._resampled = None
         # self.zp = -8.9  # default units, Jansky.
         self.zp = -2.5*numpy.log10(3631)
         self.name = name
         self.badval = badval
+        # (file name, wavelen, flambda) as read by readSED_flambda
+        self._source_file = None
+        # a buffer reused by the in_place mode of the transformation methods
+        self._spare = None
 
         self._physParams = PhysicalParameters()
 
@@ -413,6 +2032,95 @@ class Sed(object):
             self.setSED(wavelen, flambda=flambda, fnu=fnu, name=name)
         return
 
+    @property
+    def wavelen(self):
+        """
+        The wavelength grid (nm)
+        """
+        return self._wavelen
+
+    @wavelen.setter
+    def wavelen(self, value):
+        self._wavelen = value
+        self._resampled = None
+
+    @property
+    def flambda(self):
+        """
+        The flux density in ergs/cm^2/s/nm.  If fnu was set more recently
+        than flambda, flambda is calculated from fnu (and kept).
+        """
+        if self._flambda is None and self._fnu is not None and self._wavelen is not None:
+            self._flambda = self.fnuToflambda(self._wavelen, self._fnu)[1]
+        return self._flambda
+
+    @flambda.setter
+    def flambda(self, value):
+        self._flambda = value
+        self._fnu = None
+        self._resampled = None
+
+    @property
+    def fnu(self):
+        """
+        The flux density in Jansky.  If flambda was set more recently
+        than fnu, fnu is calculated from flambda (and kept).
+        """
+        if self._fnu is None and self._flambda is not None and self._wavelen is not None:
+            self._fnu = self.flambdaTofnu(self._wavelen, self._flambda)[1]
+        return self._fnu
+
+    @fnu.setter
+    def fnu(self, value):
+        # a new fnu makes flambda out of date (unless fnu is only being discarded)
+        if value is not None:
+            self._flambda = None
+            self._resampled = None
+        self._fnu = value
+
+    def _setFluxes(self, wavelen, flambda, fnu):
+        """
+        Set wavelen, flambda and fnu at once (without copying them).  The caller
+        guarantees that flambda and fnu describe the same SED.
+        """
+        self.wavelen = wavelen
+        self._flambda = flambda
+        self._fnu = fnu
+        self._resampled = None
+        self._source_file = None
+
+    def _resampledCopy(self, wavelen_match):
+        """
+        Return a Sed containing self resampled onto wavelen_match, with fnu calculated.
+
+        The copy is kept until self is changed (the setters of wavelen, flambda
+        and fnu and the in_place methods discard it), so that calculating
+        magnitudes of the same Sed on the same grid again (e.g. with several
+        BandpassDicts) neither resamples it nor converts flambda to fnu again.
+        The arrays of the copy are read-only.
+        """
+        if self._resampled is not None:
+            resampled, source = self._resampled
+            # the copy is only valid for the arrays it was made from
+            if (source[0] is self._wavelen and source[1] is self._flambda and source[2] is self._fnu and
+                    (resampled.wavelen is wavelen_match or
+                     numpy.array_equal(resampled.wavelen, wavelen_match))):
+                return resampled
+        resampled = Sed()
+        cached = _get_resampled_source(self, wavelen_match)
+        if cached is not None:
+            resampled._setFluxes(*cached[:3])
+        else:
+            resampled.setSED(self.wavelen, flambda=self.flambda)
+            resampled.resampleSED(force=True, wavelen_match=wavelen_match)
+            resampled.flambdaTofnu()
+            # the (internal) copy shares the canonical array of its grid (see WavelenGrids.py)
+            resampled._setFluxes(intern_wavelen_grid(wavelen_match),
+                                 _read_only_view(resampled.flambda),
+                                 _read_only_view(resampled.fnu))
+        self._resampled = (resampled, (self._wavelen, self._flambda, self._fnu))
+        return resampled
+
     def __eq__(self, other):
         if self.name != other.name:
             return False
@@ -424,13 +2132,14 @@ class Sed(object):
         else:
             if not numpy.isnan(other.badval):
                 return False
-        if self.fnu is not None and other.fnu is None:
+        # (compare the fnu that has been calculated, without calculating it)
+        if self._fnu is not None and other._fnu is None:
             return False
-        if self.fnu is None and other.fnu is not None:
+        if self._fnu is None and other._fnu is not None:
             return False
-        if self.fnu is not None:
+        if self._fnu is not None:
             try:
-                numpy.testing.assert_array_equal(self.fnu, other.fnu)
+                numpy.testing.assert_array_equal(self._fnu, other._fnu)
             except:
                 return False
 
@@ -461,16 +2170,28 @@ class Sed(object):
 
     # Methods for getters and setters.
 
-    def setSED(self, wavelen, flambda=None, fnu=None, name='FromArray'):
+    def setSED(self, wavelen, flambda=None, fnu=None, name='FromArray', in_place=False):
         """
         Populate wavelen/flambda fields in sed by giving lambda/flambda or lambda/fnu array.
 
         If flambda present, this overrides fnu. Method sets fnu=None unless only fnu is given.
         Sets wavelen/flambda or wavelen/flambda/fnu over wavelength array given.
+
+        If in_place is True and flambda is given, the data are copied into the existing
+        wavelen/flambda arrays of self when those are writeable and of the same length
+        (no memory is allocated); otherwise new copies are made.
         """
         # Check wavelen array for type matches.
         if isinstance(wavelen, numpy.ndarray) is False:
             raise ValueError("Wavelength must be a numpy array")
+        if in_place and flambda is not None and self._haveBuffers(len(wavelen)):
+            if (isinstance(flambda, numpy.ndarray) is False) or (len(flambda) != len(wavelen)):
+                raise ValueError("Flambda must be a numpy array of same length as Wavelen.")
+            numpy.copyto(self.wavelen, wavelen)
+            numpy.copyto(self.flambda, flambda)
+            self._releaseFnu()
+            self.name = name
+            return
         # Wavelen type ok - make new copy of data for self.
         self.wavelen = numpy.copy(wavelen)
         self.flambda = None
@@ -488,8 +2209,8 @@ class Sed(object):
                 raise ValueError("Both fnu and flambda are 'None', cannot set the SED.")
             elif (isinstance(fnu, numpy.ndarray) is False) or (len(fnu) != len(self.wavelen)):
                 raise ValueError("(No Flambda) - Fnu must be numpy array of same length as Wavelen.")
-            # Convert fnu to flambda.
-            self.wavelen, self.flambda = self.fnuToflambda(wavelen, fnu)
+            # Keep fnu; flambda is calculated from it when it is needed.
+            self.fnu = numpy.copy(fnu)
         self.name = name
         return
 
@@ -510,7 +2231,6 @@ class Sed(object):
 
         self.wavelen = numpy.arange(wavelen_min, wavelen_max+wavelen_step, wavelen_step, dtype='float')
         self.fnu = numpy.ones(len(self.wavelen), dtype='float') * 3631  # jansky
-        self.fnuToflambda()
         self.name = name
         return
 
@@ -519,72 +2239,26 @@ class Sed(object):
         Read a file containing [lambda Flambda] (lambda in nm) (Flambda erg/cm^2/s/nm).
 
         Does not resample wavelen/flambda onto grid; leave fnu=None.
-        """
-        global _global_lsst_sed_cache
-        global _global_misc_sed_cache
-
-        # Try to open data file.
-        # ASSUME that if filename ends with '.gz' that the file is gzipped. Otherwise, regular file.
-        if filename.endswith('.gz'):
-            gzipped_filename = filename
-            unzipped_filename = filename[:-3]
-        else:
-            gzipped_filename = filename + '.gz'
-            unzipped_filename = filename
-
-        cached_source = None
-        if _global_lsst_sed_cache is not None:
-            if gzipped_filename in _global_lsst_sed_cache:
-                cached_source = _global_lsst_sed_cache[gzipped_filename]
-            elif unzipped_filename in _global_lsst_sed_cache:
-                cached_source = _global_lsst_sed_cache[unzipped_filename]
 
-        if cached_source is None and _global_misc_sed_cache is not None:
-            if gzipped_filename in _global_misc_sed_cache:
-                cached_source = _global_misc_sed_cache[gzipped_filename]
-            if unzipped_filename in _global_misc_sed_cache:
-                cached_source = _global_misc_sed_cache[unzipped_filename]
-
-        if cached_source is not None:
-            sourcewavelen = numpy.copy(cached_source[0])
-            sourceflambda = numpy.copy(cached_source[1])
+        SEDs are cached after they are read, and self.wavelen/flambda are read-only
+        views of the cached arrays (no copy is made).  The methods that change an SED
+        (redshiftSED, addCCMDust, multiplyFluxNorm, resampleSED, ...) always replace
+        wavelen/flambda with newly allocated arrays, so the cache is never altered.
+        To modify the arrays in place, first replace them with a copy (e.g. from getSED_flambda).
+        """
+        self._setSourceSED(_read_sed_flambda(filename), filename if name is None else name)
+        return
 
-        if cached_source is None:
-            # Read source SED from file - lambda, flambda should be first two columns in the file.
-            # lambda should be in nm and flambda should be in ergs/cm2/s/nm
-            dtype = numpy.dtype([('wavelen', float), ('flambda', float)])
-            try:
-                data = numpy.genfromtxt(gzipped_filename, dtype=dtype)
-            except IOError:
-                try:
-                    data = numpy.genfromtxt(unzipped_filename, dtype=dtype)
-                except Exception as err:
-                    # see
-                    # http://stackoverflow.com/questions/
-                    # 9157210/how-do-i-raise-the-same-exception-with-a-custom-message-in-python
-                    new_args = [err.args[0] + \
-                                "\n\nError reading sed file %s; " % filename \
-                                + "it may not exist."]
-                    for aa in err.args[1:]:
-                        new_args.append(aa)
-                    err.args = tuple(new_args)
-                    raise
-
-            sourcewavelen = data['wavelen']
-            sourceflambda = data['flambda']
-
-            if _global_misc_sed_cache is None:
-                _global_misc_sed_cache = {}
-            _global_misc_sed_cache[filename] = (numpy.copy(sourcewavelen),
-                                                numpy.copy(sourceflambda))
-
-        self.wavelen = sourcewavelen
-        self.flambda = sourceflambda
+    def _setSourceSED(self, source, name):
+        """
+        Set wavelen/flambda to the (file name, wavelen, flambda) triple source
+        returned by _read_sed_flambda (see readSED_flambda)
+        """
+        self.wavelen = source[1]
+        self.flambda = source[2]
         self.fnu = None
-        if name is None:
-            self.name = filename
-        else:
-            self.name = name
+        self._source_file = source
+        self.name = name
         return
 
     def readSED_fnu(self, filename, name=None):
@@ -593,35 +2267,13 @@ class Sed(object):
 
         Does not resample wavelen/fnu/flambda onto a grid; leaves fnu set.
         """
-        # Try to open the data file.
-        try:
-            if filename.endswith('.gz'):
-                f = gzip.open(filename, 'r')
-            else:
-                f = open(filename, 'r')
-        # if the above fails, look for the file with and without the gz
-        except IOError:
-            try:
-                if filename.endswith(".gz"):
-                    f = open(filename[:-3], 'r')
-                else:
-                    f = gzip.open(filename+".gz", 'r')
-            except IOError:
-                raise IOError("The throughput file %s does not exist" % (filename))
         # Read source SED from file - lambda, fnu should be first two columns in the file.
         # lambda should be in nm and fnu should be in Jansky.
-        sourcewavelen = []
-        sourcefnu = []
-        for line in f:
-            if line.startswith("#"):
-                continue
-            values = line.split()
-            sourcewavelen.append(float(values[0]))
-            sourcefnu.append(float(values[1]))
-        f.close()
-        # Convert to numpy arrays.
-        sourcewavelen = numpy.array(sourcewavelen)
-        sourcefnu = numpy.array(sourcefnu)
+        # If the file does not exist, look for it with and without the gz.
+        try:
+            sourcewavelen, sourcefnu = readAsciiColumns(filename)
+        except IOError:
+            raise IOError("The throughput file %s does not exist" % (filename))
         # Convert fnu to flambda
         self.fnuToflambda(sourcewavelen, sourcefnu)
         if name is None:
@@ -644,14 +2296,7 @@ class Sed(object):
         Return copy of wavelen/fnu, without altering self.
         """
         wavelen = numpy.copy(self.wavelen)
-        # Check if fnu currently set.
-        if self.fnu is not None:
-            # Get new memory copy of fnu.
-            fnu = numpy.copy(self.fnu)
-        else:
-            # Fnu was not set .. grab copy fnu without changing self.
-            wavelen, fnu = self.flambdaTofnu(self.wavelen, self.flambda)
-            # Now wavelen/fnu (new mem) are gridded evenly, but self.wavelen/flambda/fnu remain unchanged.
+        fnu = numpy.copy(self.fnu)
         return wavelen, fnu
 
     # Methods that update or change self.
@@ -705,6 +2350,55 @@ class Sed(object):
                 raise ValueError("Must pass equal length wavelen/flux arrays.")
         return update_self
 
+    def _haveBuffers(self, length):
+        """
+        Return True if self.wavelen and self.flambda are writeable arrays of
+        the given length (which setSED can overwrite when in_place is True)
+        """
+        for arr in (self._wavelen, self._flambda):
+            if arr is None or len(arr) != length or not arr.flags.writeable:
+                return False
+        return True
+
+    def _writeable(self, arr):
+        """
+        Return arr if it can be changed in place, otherwise a writeable copy of it
+        (e.g. of the read-only arrays of cached SEDs).  Used by the in_place mode.
+        """
+        if arr.flags.writeable:
+            return arr
+        return numpy.copy(arr)
+
+    def _releaseFnu(self):
+        """
+        Set self.fnu to None, keeping its memory for reuse by the in_place mode.
+        Also forgets the template self was read from (see _get_resampled_source),
+        as its arrays are about to be changed.
+        """
+        if self._fnu is not None and self._fnu.flags.writeable:
+            self._spare = self._fnu
+        self._fnu = None
+        self._resampled = None
+        self._source_file = None
+
+    def _spareBuffer(self, length):
+        """
+        Return a float array of the given length whose contents may be overwritten
+        (the memory of a discarded fnu, if there is one of the right length).
+        Return it with _keepBuffer when done with it.
+        """
+        spare = self._spare
+        self._spare = None
+        if spare is None or len(spare) != length or spare.dtype != numpy.float64:
+            spare = numpy.empty(length, dtype=float)
+        return spare
+
+    def _keepBuffer(self, buffer):
+        """
+        Keep buffer (from _spareBuffer) for reuse by the in_place mode
+        """
+        self._spare = buffer
+
     def _needResample(self, wavelen_match=None, wavelen=None,
                       wavelen_min=None, wavelen_max=None, wavelen_step=None):
         """
@@ -715,7 +2409,10 @@ class Sed(object):
             wavelen = self.wavelen
         # Check if wavelength arrays are equal, if wavelen_match passed.
         if wavelen_match is not None:
-            if numpy.shape(wavelen_match) != numpy.shape(wavelen):
+            if wavelen_match is wavelen:
+                # e.g. the same interned grid (see WavelenGrids.py)
+                need_regrid = False
+            elif numpy.shape(wavelen_match) != numpy.shape(wavelen):
                 need_regrid = True
             else:
                 # check the elements to see if any vary
@@ -774,14 +2471,13 @@ class Sed(object):
                               + ' (%.2f to %.2f)' % (wavelen_grid.min(), wavelen_grid.max())
                               + 'and sed %s (%.2f to %.2f)' % (self.name, wavelen.min(), wavelen.max()))
             # Do the interpolation of wavelen/flux onto grid. (type/len failures will die here).
-            if wavelen[0] > wavelen_grid[0] or wavelen[-1] < wavelen_grid[-1]:
-                f = interpolate.interp1d(wavelen, flux, bounds_error=False, fill_value=numpy.NaN)
-                flux_grid = f(wavelen_grid)
-            else:
-                flux_grid = numpy.interp(wavelen_grid, wavelen, flux)
+            # The interpolation weights are cached for each pair of grids (see Resampler.py);
+            # points outside of wavelen are set to NaN.
+            flux_grid = get_resampler(wavelen, wavelen_grid).resample(flux)
 
             # Update self values if necessary.
             if update_self:
+                # (a writeable copy of the grid, which self may change in place)
                 self.wavelen = wavelen_grid
                 self.flambda = flux_grid
                 return
@@ -792,12 +2488,15 @@ class Sed(object):
                 return
             return wavelen, flux
 
-    def flambdaTofnu(self, wavelen=None, flambda=None):
+    def flambdaTofnu(self, wavelen=None, flambda=None, in_place=False):
         """
         Convert flambda into fnu.
 
         This routine assumes that flambda is in ergs/cm^s/s/nm and produces fnu in Jansky.
         Can act on self or user can provide wavelen/flambda and get back wavelen/fnu.
+
+        If in_place is True, fnu is written into memory which is already allocated:
+        a discarded fnu array of self, or (if arrays are passed) the flambda array passed in.
         """
         # Change Flamda to Fnu by multiplying Flambda * lambda^2 = Fv
         # Fv dv = Fl dl .. Fv = Fl dl / dv = Fl dl / (dl*c/l/l) = Fl*l*l/c
@@ -806,27 +2505,40 @@ class Sed(object):
         if update_self:
             wavelen = self.wavelen
             flambda = self.flambda
+            if in_place:
+                self._releaseFnu()
             self.fnu = None
         # Now on with the calculation.
         # Calculate fnu.
-        fnu = flambda * wavelen * wavelen * self._physParams.nm2m / self._physParams.lightspeed
-        fnu = fnu * self._physParams.ergsetc2jansky
+        if in_place:
+            fnu = self._spareBuffer(len(wavelen)) if update_self else flambda
+            numpy.multiply(flambda, wavelen, out=fnu)
+            numpy.multiply(fnu, wavelen, out=fnu)
+            numpy.multiply(fnu, self._physParams.nm2m, out=fnu)
+            numpy.divide(fnu, self._physParams.lightspeed, out=fnu)
+            numpy.multiply(fnu, self._physParams.ergsetc2jansky, out=fnu)
+        else:
+            fnu = flambda * wavelen * wavelen * self._physParams.nm2m / self._physParams.lightspeed
+            fnu = fnu * self._physParams.ergsetc2jansky
         # If are using/updating self, then *all* wavelen/flambda/fnu will be gridded.
         # This is so wavelen/fnu AND wavelen/flambda can be kept in sync.
         if update_self:
-            self.wavelen = wavelen
-            self.flambda = flambda
-            self.fnu = fnu
+            # (flambda is unchanged, so this does not make it out of date)
+            self._fnu = fnu
             return
         # Return wavelen, fnu, unless updating self (then does not return).
         return wavelen, fnu
 
-    def fnuToflambda(self, wavelen=None, fnu=None):
+    def fnuToflambda(self, wavelen=None, fnu=None, in_place=False):
         """
         Convert fnu into flambda.
 
         Assumes fnu in units of Jansky and flambda in ergs/cm^s/s/nm.
         Can act on self or user can give wavelen/fnu and get wavelen/flambda returned.
+
+        If in_place is True, flambda is written into memory which is already allocated:
+        the flambda array of self (if it is writeable and of the right length), or
+        (if arrays are passed) the fnu array passed in.
         """
         # Fv dv = Fl dl .. Fv = Fl dl / dv = Fl dl / (dl*c/l/l) = Fl*l*l/c
         # Is method acting on self or passed arrays?
@@ -836,28 +2548,64 @@ class Sed(object):
             fnu = self.fnu
         # On with the calculation.
         # Calculate flambda.
-        flambda = fnu / wavelen / wavelen * self._physParams.lightspeed / self._physParams.nm2m
-        flambda = flambda / self._physParams.ergsetc2jansky
+        if in_place:
+            if not update_self:
+                flambda = fnu
+            elif self._haveBuffers(len(wavelen)):
+                flambda = self.flambda
+                self._source_file = None
+            else:
+                flambda = numpy.empty(len(wavelen), dtype=float)
+            numpy.divide(fnu, wavelen, out=flambda)
+            numpy.divide(flambda, wavelen, out=flambda)
+            numpy.multiply(flambda, self._physParams.lightspeed, out=flambda)
+            numpy.divide(flambda, self._physParams.nm2m, out=flambda)
+            numpy.divide(flambda, self._physParams.ergsetc2jansky, out=flambda)
+        else:
+            flambda = fnu / wavelen / wavelen * self._physParams.lightspeed / self._physParams.nm2m
+            flambda = flambda / self._physParams.ergsetc2jansky
         # If updating self, then *all of wavelen/fnu/flambda will be updated.
         # This is so wavelen/fnu AND wavelen/flambda can be kept in sync.
         if update_self:
-            self.wavelen = wavelen
-            self.flambda = flambda
-            self.fnu = fnu
+            # (fnu is unchanged, so it is still valid)
+            self._flambda = flambda
             return
         # Return wavelen/flambda.
         return wavelen, flambda
 
     # methods to alter the sed
 
-    def redshiftSED(self, redshift, dimming=False, wavelen=None, flambda=None):
+    def redshiftSED(self, redshift, dimming=False, wavelen=None, flambda=None, in_place=False):
         """
         Redshift an SED, optionally adding cosmological dimming.
 
         Pass wavelen/flambda or redshift/update self.wavelen/flambda (unsets fnu).
+
+        If in_place is True, wavelen and flambda (of self, or the arrays passed in)
+        are changed in place.
         """
         # Updating self or passed arrays?
         update_self = self._checkUseSelf(wavelen, flambda)
+        if in_place:
+            if update_self:
+                self._releaseFnu()
+                self.wavelen = self._writeable(self.wavelen)
+                if dimming:
+                    self.flambda = self._writeable(self.flambda)
+                wavelen = self.wavelen
+                flambda = self.flambda
+            if redshift < 0:
+                numpy.divide(wavelen, 1.0-redshift, out=wavelen)
+            else:
+                numpy.multiply(wavelen, 1.0+redshift, out=wavelen)
+            if dimming:
+                if redshift < 0:
+                    numpy.multiply(flambda, 1.0-redshift, out=flambda)
+                else:
+                    numpy.divide(flambda, 1.0+redshift, out=flambda)
+            if update_self:
+                return
+            return wavelen, flambda
         if update_self:
             wavelen = self.wavelen
             flambda = self.flambda
@@ -892,62 +2640,22 @@ class Sed(object):
 
         If wavelen not specified, calculates a and b on the own object's wavelength grid.
         Returns a(x) and b(x) can be common to many seds, wavelen is the same.
+
+        The results are memoized for each wavelength grid (see get_ccm_ab_cache),
+        so the returned arrays are read-only.
         """
-        # This extinction law taken from Cardelli, Clayton and Mathis ApJ 1989.
-        # The general form is A_l / A(V) = a(x) + b(x)/R_V  (where x=1/lambda in microns),
-        # then different values for a(x) and b(x) depending on wavelength regime.
-        # Also, the extinction is parametrized as R_v = A_v / E(B-V).
-        # Magnitudes of extinction (A_l) translates to flux by a_l = -2.5log(f_red / f_nonred).
         if wavelen is None:
-            wavelen = numpy.copy(self.wavelen)
-        a_x = numpy.zeros(len(wavelen), dtype='float')
-        b_x = numpy.zeros(len(wavelen), dtype='float')
-        # Convert wavelength to x (in inverse microns).
-        x = numpy.empty(len(wavelen), dtype=float)
-        nm_to_micron = 1/1000.0
-        x = 1.0 / (wavelen * nm_to_micron)
-        # Dust in infrared 0.3 /mu < x < 1.1 /mu (inverse microns).
-        condition = (x >= 0.3) & (x <= 1.1)
-        if len(a_x[condition]) > 0:
-            y = x[condition]
-            a_x[condition] = 0.574 * y**1.61
-            b_x[condition] = -0.527 * y**1.61
-        # Dust in optical/NIR 1.1 /mu < x < 3.3 /mu region.
-        condition = (x >= 1.1) & (x <= 3.3)
-        if len(a_x[condition]) > 0:
-            y = x[condition] - 1.82
-            a_x[condition] = 1 + 0.104*y - 0.609*y**2 + 0.701*y**3 + 1.137*y**4
-            a_x[condition] = a_x[condition] - 1.718*y**5 - 0.827*y**6 + 1.647*y**7 - 0.505*y**8
-            b_x[condition] = 1.952*y + 2.908*y**2 - 3.989*y**3 - 7.985*y**4
-            b_x[condition] = b_x[condition] + 11.102*y**5 + 5.491*y**6 - 10.805*y**7 + 3.347*y**8
-        # Dust in ultraviolet and UV (if needed for high-z) 3.3 /mu< x< 8 /mu.
-        condition = (x >= 3.3) & (x < 5.9)
-        if len(a_x[condition]) > 0:
-            y = x[condition]
-            a_x[condition] = 1.752 - 0.316*y - 0.104/((y-4.67)**2 + 0.341)
-            b_x[condition] = -3.090 + 1.825*y + 1.206/((y-4.62)**2 + 0.263)
-        condition = (x > 5.9) & (x < 8)
-        if len(a_x[condition]) > 0:
-            y = x[condition]
-            Fa_x = numpy.empty(len(a_x[condition]), dtype=float)
-            Fb_x = numpy.empty(len(a_x[condition]), dtype=float)
-            Fa_x = -0.04473*(y-5.9)**2 - 0.009779*(y-5.9)**3
-            Fb_x = 0.2130*(y-5.9)**2 + 0.1207*(y-5.9)**3
-            a_x[condition] = 1.752 - 0.316*y - 0.104/((y-4.67)**2 + 0.341) + Fa_x
-            b_x[condition] = -3.090 + 1.825*y + 1.206/((y-4.62)**2 + 0.263) + Fb_x
-        # Dust in far UV (if needed for high-z) 8 /mu < x < 10 /mu region.
-        condition = (x >= 8) & (x <= 11.)
-        if len(a_x[condition]) > 0:
-            y = x[condition]-8.0
-            a_x[condition] = -1.073 - 0.628*(y) + 0.137*(y)**2 - 0.070*(y)**3
-            b_x[condition] = 13.670 + 4.257*(y) - 0.420*(y)**2 + 0.374*(y)**3
-        return a_x, b_x
-
-    def addCCMDust(self, a_x, b_x, A_v=None, ebv=None, R_v=3.1, wavelen=None, flambda=None):
+            wavelen = self.wavelen
+        return _ccm_ab(wavelen)
+
+    def addCCMDust(self, a_x, b_x, A_v=None, ebv=None, R_v=3.1, wavelen=None, flambda=None,
+                   in_place=False):
         """
         Add CCM dust model extinction to the SED, modifying flambda and fnu.
 
         Specify any two of A_V, E(B-V) or R_V (=3.1 default).
+
+        If in_place is True, flambda (of self, or the array passed in) is changed in place.
         """
         # The extinction law taken from Cardelli, Clayton and Mathis ApJ 1989.
         # The general form is A_l / A(V) = a(x) + b(x)/R_V  (where x=1/lambda in microns).
@@ -957,7 +2665,13 @@ class Sed(object):
         #
         # Figure out if updating self or passed arrays.
         update_self = self._checkUseSelf(wavelen, flambda)
-        if update_self:
+        if in_place:
+            if update_self:
+                self._releaseFnu()
+                self.flambda = self._writeable(self.flambda)
+                wavelen = self.wavelen
+                flambda = self.flambda
+        elif update_self:
             wavelen = self.wavelen
             flambda = self.flambda
             self.fnu = None
@@ -981,6 +2695,19 @@ class Sed(object):
             elif A_v is None:
                 A_v = R_v * ebv
         # R_v and A_v values are specified or calculated.
+        if in_place:
+            # the same operations, in a reused buffer
+            dust = self._spareBuffer(len(wavelen))
+            numpy.divide(b_x, R_v, out=dust)
+            numpy.add(a_x, dust, out=dust)
+            numpy.multiply(dust, A_v, out=dust)
+            numpy.multiply(dust, -0.4, out=dust)
+            numpy.power(10.0, dust, out=dust)
+            numpy.multiply(flambda, dust, out=flambda)
+            self._keepBuffer(dust)
+            if update_self:
+                return
+            return wavelen, flambda
         A_lambda = numpy.empty(len(wavelen), dtype=float)
         dust = numpy.empty(len(wavelen), dtype=float)
         A_lambda = (a_x + b_x / R_v) * A_v
@@ -1057,10 +2784,6 @@ class Sed(object):
         use_self = self._checkUseSelf(wavelen, fnu)
         # Use self values if desired, otherwise use values passed to function.
         if use_self:
-            # Calculate fnu if required.
-            if self.fnu is None:
-                # If fnu not present, calculate. (does not regrid).
-                self.flambdaTofnu()
             wavelen = self.wavelen
             fnu = self.fnu
         # Make sure wavelen/fnu are on the same wavelength grid as bandpass.
@@ -1109,9 +2832,6 @@ class Sed(object):
         use_self = self._checkUseSelf(wavelen, fnu)
         # Use self values if desired, otherwise use values passed to function.
         if use_self:
-            # Calculate fnu if required.
-            if self.fnu is None:
-                self.flambdaTofnu()
             wavelen = self.wavelen
             fnu = self.fnu
         # Continue with magnitude calculation.
@@ -1144,9 +2864,6 @@ class Sed(object):
         use_self = self._checkUseSelf(wavelen, fnu)
         # Use self values if desired, otherwise use values passed to function.
         if use_self:
-            # Calculate fnu if required.
-            if self.fnu is None:
-                self.flambdaTofnu()
             wavelen = self.wavelen
             fnu = self.fnu
         # Go on with magnitude calculation.
@@ -1168,9 +2885,6 @@ class Sed(object):
         """
         use_self = self._checkUseSelf(wavelen, fnu)
         if use_self:
-            # Check possibility that fnu is not calculated yet.
-            if self.fnu is None:
-                self.flambdaTofnu()
             wavelen = self.wavelen
             fnu = self.fnu
         # Fluxnorm gets applied to f_nu (fluxnorm * SED(f_nu) * PHI = mag - 8.9 (AB zeropoint).
@@ -1183,20 +2897,33 @@ class Sed(object):
         fluxnorm = numpy.power(10, (-0.4*dmag))
         return fluxnorm
 
-    def multiplyFluxNorm(self, fluxNorm, wavelen=None, fnu=None):
+    def multiplyFluxNorm(self, fluxNorm, wavelen=None, fnu=None, in_place=False):
         """
         Multiply wavelen/fnu (or self.wavelen/fnu) by fluxnorm.
 
         Returns wavelen/fnu arrays (or updates self).
         Note that multiplyFluxNorm does not regrid self.wavelen/flambda/fnu at all.
+
+        If in_place is True, fnu and flambda (of self), or the fnu array passed in,
+        are changed in place.
         """
         # Note that fluxNorm is intended to be applied to f_nu,
         # so that fluxnorm*fnu*phi = mag (expected magnitude).
         update_self = self._checkUseSelf(wavelen, fnu)
+        if in_place:
+            if not update_self:
+                numpy.multiply(fnu, fluxNorm, out=fnu)
+                return wavelen, fnu
+            if self._fnu is None:
+                self.flambdaTofnu(in_place=True)
+            else:
+                self._fnu = self._writeable(self._fnu)
+                self._resampled = None
+                self._source_file = None
+            numpy.multiply(self._fnu, fluxNorm, out=self._fnu)
+            self.fnuToflambda(in_place=True)
+            return
         if update_self:
-            # Make sure fnu is defined.
-            if self.fnu is None:
-                self.flambdaTofnu()
             wavelen = self.wavelen
             fnu = self.fnu
         else:
@@ -1208,9 +2935,8 @@ class Sed(object):
         # Update self.
         if update_self:
             self.wavelen = wavelen
+            # flambda is recalculated from the new fnu when it is needed
             self.fnu = fnu
-            # Update flambda as well.
-            self.fnuToflambda()
             return
         # Else return new wavelen/fnu pairs.
         return wavelen, fnu
@@ -1276,8 +3002,6 @@ class Sed(object):
             update_self = self._checkUseSelf(wavelen, fnu)
             if update_self:
                 wavelen = self.wavelen
-                if self.fnu is None:
-                    self.flambdaTofnu()
                 fnu = self.fnu
             else:
                 # Make a copy of the input data.
@@ -1311,9 +3035,7 @@ class Sed(object):
             fnu = fnu * konst
             wavelen, flambda = self.fnutoflambda(wavelen, fnu)
         if update_self:
-            self.wavelen = wavelen
-            self.flambda = flambda
-            self.fnu = fnu
+            self._setFluxes(wavelen, flambda, fnu)
             return
         new_sed = Sed(wavelen=wavelen, flambda=flambda)
         return new_sed
@@ -1381,7 +3103,28 @@ class Sed(object):
             i = i + 1
         return phiarray, wavelen_step
 
-    def manyFluxCalc(self, phiarray, wavelen_step, observedBandpassInd=None):
+    def setupPhiSupport(self, phiarray):
+        """
+        Find the support of each row of a 2-d phi array (see setupPhiArray).
+
+        Each filter is only non-zero over a small part of the wavelength grid of
+        phiarray; passing the support to manyFluxCalc/manyMagCalc restricts each
+        integral to it.
+
+        Returns a tuple of (first, last+1) index pairs, one per row of phiarray,
+        such that phiarray[i] is zero outside of phiarray[i][first:last+1]
+        ((0, 0) for a row which is zero everywhere).
+        """
+        support = []
+        for phi in phiarray:
+            nonzero = numpy.flatnonzero(phi)
+            if len(nonzero) == 0:
+                support.append((0, 0))
+            else:
+                support.append((int(nonzero[0]), int(nonzero[-1])+1))
+        return tuple(support)
+
+    def manyFluxCalc(self, phiarray, wavelen_step, observedBandpassInd=None, phiSupport=None):
         """
         Calculate fluxes of a single sed for which fnu has been evaluated in a
         set of bandpasses for which phiarray has been set up to have the same
@@ -1403,6 +3146,13 @@ class Sed(object):
             list of indices of phiarray corresponding to observed bandpasses,
             if None, the original phiarray is returned
 
+        phiSupport: tuple of (first, last+1) index pairs, optional, defaults to None
+            the support of each row of phiarray (see setupPhiSupport).  If given,
+            each flux is only integrated over the support of its phi.  If fnu
+            is not finite everywhere (e.g. it is NaN where a resampled Sed does
+            not cover the grid), it is integrated over the whole grid, so that
+            the fluxes are NaN just as they are without phiSupport.
+
 
         Returns
         -------
@@ -1410,9 +3160,8 @@ class Sed(object):
         values in units of ergs/cm^2/sec
 
         .. note: Sed.manyFluxCalc `assumes` phiArray has the same wavelenghth
-        grid as the Sed and that `sed.fnu` has been calculated for the sed,
-        perhaps using `sed.flambdaTofnu()`. This requires calling
-        `sed.setupPhiArray()` first. These assumptions are to avoid error
+        grid as the Sed (fnu is calculated from flambda if it has not been
+        already). This requires calling `sed.setupPhiArray()` first. These assumptions are to avoid error
         checking within this function (for speed), but could lead to errors if
         method is used incorrectly.
 
@@ -1422,13 +3171,25 @@ class Sed(object):
         http://www.lsst.org/scientists/scibook
         """
 
+        # fnu and phiarray may be stored as float32 (see set_flux_dtype);
+        # the integral is always accumulated in float64
+        fnu = numpy.asarray(self.fnu, dtype=float)
+        if phiSupport is not None and numpy.isfinite(fnu).all():
+            if observedBandpassInd is None:
+                observedBandpassInd = range(len(phiarray))
+            flux = numpy.empty(len(observedBandpassInd), dtype='float')
+            for i, ix in enumerate(observedBandpassInd):
+                first, last = phiSupport[ix]
+                flux[i] = numpy.dot(phiarray[ix, first:last], fnu[first:last])
+            flux *= wavelen_step
+            return flux
         if observedBandpassInd is not None:
             phiarray = phiarray[observedBandpassInd]
         flux = numpy.empty(len(phiarray), dtype='float')
-        flux = numpy.sum(phiarray*self.fnu, axis=1)*wavelen_step
+        flux = numpy.sum(phiarray*fnu, axis=1)*wavelen_step
         return flux
 
-    def manyMagCalc(self, phiarray, wavelen_step, observedBandpassInd=None):
+    def manyMagCalc(self, phiarray, wavelen_step, observedBandpassInd=None, phiSupport=None):
         """
         Calculate many magnitudes for many bandpasses using a single sed.
 
@@ -1452,8 +3213,11 @@ class Sed(object):
             list of indices of phiarray corresponding to observed bandpasses,
             if None, the original phiarray is returned
 
+        phiSupport: tuple of (first, last+1) index pairs, optional, defaults to None
+            the support of each row of phiarray (see manyFluxCalc)
+
         """
-        fluxes = self.manyFluxCalc(phiarray, wavelen_step, observedBandpassInd)
+        fluxes = self.manyFluxCalc(phiarray, wavelen_step, observedBandpassInd, phiSupport=phiSupport)
         mags = -2.5*numpy.log10(fluxes) - self.zp
         return mags
 
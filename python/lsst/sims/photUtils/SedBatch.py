@@ -0,0 +1,530 @@
+"""
+SedBatch -
+
+A container for many SEDs sampled on one shared wavelength grid.  The flux
+densities are stored as 2-D numpy arrays (one row per SED), so that the
+transformations Sed applies to one object at a time (redshifting, dust,
+normalization, flambda/fnu conversion and magnitude calculation) can be applied
+to every SED in the batch with a handful of array operations.
+
+As in Sed.py, methods update the arrays of the batch itself and never modify
+arrays in place: every transformation allocates new arrays, so a batch can be
+built on read-only (e.g. cached) data.  Any change to flambda sets fnu to None.
+
+flambda and fnu can be stored as float32 (see Sed.set_flux_dtype), halving the
+memory of a batch; the integrals over wavelength are accumulated in float64.
+"""
+
+from builtins import object
+from builtins import range
+import numpy
+from .PhysicalParameters import PhysicalParameters
+from .Sed import Sed, _ccm_ab, _ccm_dust, _check_flux_dtype
+from .Resampler import get_resampler
+from .WavelenGrids import intern_wavelen_grid
+
+__all__ = ["SedBatch"]
+
+
+def _interp_rows(wavelen, flux, wavelen_match, scale=None):
+    """
+    Linearly interpolate every row of flux onto wavelen_match.
+
+    @param [in] wavelen is the (increasing) 1-D wavelength grid on which flux is sampled
+
+    @param [in] flux is a 2-D array; each row is sampled on wavelen
+
+    @param [in] wavelen_match is the 1-D wavelength grid to interpolate onto
+
+    @param [in] scale is an optional 1-D array with one value per row of flux.
+    If given, row i is taken to be sampled on wavelen*scale[i] (i.e. the
+    interpolation is evaluated at wavelen_match/scale[i] on wavelen).
+
+    @param [out] a 2-D array of shape (len(flux), len(wavelen_match)).
+    Points outside of the range covered by a row are set to NaN
+    (as in Sed.resampleSED).
+    """
+    if scale is None:
+        # every row is evaluated at the same points, so the (cached)
+        # interpolation weights of Sed.resampleSED apply to the whole stack
+        return get_resampler(wavelen, wavelen_match).resample(flux)
+
+    rows = numpy.arange(flux.shape[0])[:, numpy.newaxis]
+    x = wavelen_match[numpy.newaxis, :]/scale[:, numpy.newaxis]
+
+    if flux.shape[0] == 1:
+        # a single spectrum (e.g. one template at many redshifts): numpy.interp
+        # evaluates every point in one pass (and is what Sed.resampleSED uses)
+        return numpy.interp(x, wavelen, flux[0], left=numpy.NaN, right=numpy.NaN)
+
+    i_lo = numpy.clip(numpy.searchsorted(wavelen, x, side='right')-1, 0, len(wavelen)-2)
+    d_wavelen = wavelen[i_lo+1] - wavelen[i_lo]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        weight = numpy.where(d_wavelen > 0.0, (x - wavelen[i_lo])/d_wavelen, 0.0)
+
+    flux_lo = flux[rows, i_lo]
+    flux_grid = flux_lo + (flux[rows, i_lo+1] - flux_lo)*weight
+    outside = numpy.logical_or(x < wavelen[0], x > wavelen[-1])
+    if outside.any():
+        flux_grid[numpy.broadcast_to(outside, flux_grid.shape)] = numpy.NaN
+    return flux_grid
+
+
+def _redshift_scale(redshift):
+    """
+    Return the factor by which redshift (a float or an array) stretches
+    wavelengths; negative redshifts are blueshifts, as in Sed.redshiftSED.
+    Cosmological dimming divides flambda by the same factor.
+    """
+    redshift = numpy.asarray(redshift, dtype=float)
+    return numpy.where(redshift < 0, 1.0/(1.0-numpy.minimum(redshift, 0.0)), 1.0+redshift)
+
+
+def _per_row(value, n_rows, name):
+    """
+    Return value (a scalar or a sequence with one entry per row) as a 1-D
+    float array of length n_rows.  Raises a ValueError for the wrong length.
+    """
+    value = numpy.asarray(value, dtype=float)
+    if value.ndim == 0:
+        return numpy.repeat(value, n_rows)
+    if value.shape != (n_rows,):
+        raise ValueError("%s has shape %s; the SedBatch has %d SEDs"
+                         % (name, str(value.shape), n_rows))
+    return value
+
+
+# the number of rows of a float32 array converted to float64
+# at a time while integrating over wavelength
+_float64_block_rows = 64
+
+
+def _dot_float64(flux, matrix):
+    """
+    Return numpy.dot(flux, matrix) for a 2-D array flux, accumulated in float64.
+
+    If flux is float32, it is converted to float64 a few rows at a time, so
+    that only the (small) matrix and one block of rows are ever held as float64.
+    """
+    matrix = numpy.asarray(matrix, dtype=float)
+    if flux.dtype == numpy.float64:
+        return flux.dot(matrix)
+    result = numpy.empty((flux.shape[0],) + matrix.shape[1:], dtype=float)
+    for i_start in range(0, flux.shape[0], _float64_block_rows):
+        block = flux[i_start:i_start+_float64_block_rows]
+        result[i_start:i_start+len(block)] = block.astype(float).dot(matrix)
+    return result
+
+
+class SedBatch(object):
+    """
+    This class stores many SEDs on a single wavelength grid as 2-D arrays:
+
+    wavelen is the 1-D wavelength grid in nm (shared by every SED)
+
+    flambda is an (n_seds x n_wavelen) array in ergs/cm^2/s/nm
+
+    fnu is an (n_seds x n_wavelen) array in Jansky (or None if it has not
+    been calculated since flambda last changed)
+
+    names is a list with the name of each SED
+
+    dtype is the dtype (float32 or float64) in which flambda and fnu are stored
+
+    Use SedBatch.fromSedList to build a batch from Sed objects (or a SedList),
+    and BandpassDict.magListForSedBatch/fluxListForSedBatch to calculate the
+    magnitudes/fluxes of every SED in every bandpass with one matrix product.
+    """
+
+    def __init__(self, wavelen, flambda=None, fnu=None, names=None, badval=numpy.NaN, dtype=None):
+        """
+        @param [in] wavelen is the 1-D wavelength grid in nm
+
+        @param [in] flambda is a 2-D array of flambda (one row per SED)
+
+        @param [in] fnu is a 2-D array of fnu (one row per SED).  Only one of
+        flambda and fnu needs to be specified; if both are, they must agree.
+
+        @param [in] names is an optional list of the names of the SEDs
+
+        @param [in] badval is the value returned for undefined magnitudes
+
+        @param [in] dtype is the dtype (float32 or float64) in which flambda
+        and fnu are stored.  Defaults to the dtype set by set_flux_dtype.
+        """
+        if flambda is None and fnu is None:
+            raise ValueError("SedBatch requires flambda or fnu")
+
+        self.dtype = _check_flux_dtype(dtype)
+
+        self._physParams = PhysicalParameters()
+        self.zp = -2.5*numpy.log10(3631)
+        self.badval = badval
+
+        if numpy.ndim(wavelen) != 1:
+            raise ValueError("SedBatch requires a 1-D wavelength grid")
+        self.wavelen = intern_wavelen_grid(wavelen)
+
+        self.flambda = None
+        self.fnu = None
+        if flambda is not None:
+            self.flambda = self._checkFluxShape(flambda, 'flambda')
+        if fnu is not None:
+            self.fnu = self._checkFluxShape(fnu, 'fnu')
+        if self.flambda is None:
+            self.fnuToflambda()
+
+        if names is None:
+            names = ['FromArray']*len(self)
+        elif len(names) != len(self):
+            raise ValueError("You passed %d names for %d SEDs" % (len(names), len(self)))
+        self.names = list(names)
+
+    @property
+    def flambda(self):
+        """
+        The 2-D array of flambda (one row per SED), stored as self.dtype
+        """
+        return self._flambda
+
+    @flambda.setter
+    def flambda(self, value):
+        self._flambda = None if value is None else numpy.asarray(value, dtype=self.dtype)
+
+    @property
+    def fnu(self):
+        """
+        The 2-D array of fnu (one row per SED), stored as self.dtype
+        """
+        return self._fnu
+
+    @fnu.setter
+    def fnu(self, value):
+        self._fnu = None if value is None else numpy.asarray(value, dtype=self.dtype)
+
+    def _checkFluxShape(self, flux, name):
+        """
+        Return flux as a 2-D float array, checking that it matches self.wavelen
+        """
+        flux = numpy.asarray(flux, dtype=self.dtype)
+        if flux.ndim == 1:
+            flux = flux[numpy.newaxis, :]
+        if flux.ndim != 2 or flux.shape[1] != len(self.wavelen):
+            raise ValueError("%s has shape %s; expected (n_seds, %d)"
+                             % (name, str(flux.shape), len(self.wavelen)))
+        if self.flambda is not None and flux.shape[0] != self.flambda.shape[0]:
+            raise ValueError("flambda and fnu contain different numbers of SEDs")
+        return flux
+
+    @classmethod
+    def fromSedList(cls, sedList, wavelen_match=None, dtype=None):
+        """
+        Build a SedBatch from a list of Sed objects (or a SedList).
+
+        @param [in] sedList is a list of Seds (or a SedList)
+
+        @param [in] wavelen_match is the wavelength grid of the batch.  If None,
+        the wavelength grid of the first Sed is used.  Seds on other grids are
+        resampled onto it (the Seds themselves are unchanged).
+
+        @param [in] dtype is the dtype in which the batch stores flambda and fnu
+        (see __init__)
+
+        @param [out] a SedBatch
+        """
+        if len(sedList) == 0:
+            raise ValueError("Cannot build a SedBatch from an empty list of Seds")
+
+        if wavelen_match is None:
+            wavelen_match = sedList[0].wavelen
+        wavelen_match = numpy.asarray(wavelen_match, dtype=float)
+
+        flambda = numpy.empty((len(sedList), len(wavelen_match)), dtype=_check_flux_dtype(dtype))
+        names = []
+        have_fnu = True
+        for ix, sedobj in enumerate(sedList):
+            names.append(sedobj.name)
+            if sedobj._needResample(wavelen_match=wavelen_match):
+                have_fnu = False
+                flambda[ix] = sedobj.resampleSED(sedobj.wavelen, sedobj.flambda,
+                                                 wavelen_match=wavelen_match, force=True)[1]
+            else:
+                flambda[ix] = sedobj.flambda
+                have_fnu = have_fnu and sedobj._fnu is not None
+
+        batch = cls(wavelen_match, flambda=flambda, names=names, dtype=dtype)
+
+        # keep fnu if every Sed already had it on this grid
+        if have_fnu:
+            batch.fnu = numpy.array([sedobj.fnu for sedobj in sedList], dtype=batch.dtype)
+
+        return batch
+
+    @classmethod
+    def fromRedshiftGrid(cls, sedobj, redshift, wavelen_match, dimming=False, dtype=None):
+        """
+        Build a SedBatch containing one Sed redshifted to each of an array of
+        redshifts and resampled onto wavelen_match (e.g. BandpassDict.wavelenMatch).
+
+        This is equivalent to calling redshiftSED and then resampleSED on a copy of
+        sedobj for each redshift, but the interpolation for every redshift is done
+        in one vectorized pass over an (n_redshifts x n_wavelen) array.
+
+        @param [in] sedobj is the Sed to redshift (it is not changed)
+
+        @param [in] redshift is an array of redshifts
+
+        @param [in] wavelen_match is the wavelength grid of the output
+
+        @param [in] dimming is a boolean; if True, apply cosmological dimming
+
+        @param [in] dtype is the dtype in which the batch stores flambda and fnu
+        (see __init__)
+
+        @param [out] a SedBatch whose row i is sedobj at redshift[i].  Wavelengths
+        not covered by the redshifted Sed are NaN.
+        """
+        redshift = numpy.atleast_1d(numpy.asarray(redshift, dtype=float))
+        if redshift.ndim != 1:
+            raise ValueError("fromRedshiftGrid requires a 1-D array of redshifts")
+        wavelen_match = numpy.asarray(wavelen_match, dtype=float)
+        scale = _redshift_scale(redshift)
+
+        flambda = _interp_rows(sedobj.wavelen, sedobj.flambda[numpy.newaxis, :],
+                               wavelen_match, scale=scale)
+        if dimming:
+            flambda /= scale[:, numpy.newaxis]
+
+        names = ['%s_Z%.2f' % (sedobj.name, zz) for zz in redshift]
+        return cls(numpy.copy(wavelen_match), flambda=flambda, names=names, badval=sedobj.badval,
+                   dtype=dtype)
+
+    def __len__(self):
+        return self.flambda.shape[0]
+
+    def __getitem__(self, index):
+        """
+        Return the SED in row index as a (newly allocated, float64) Sed
+        """
+        sedobj = Sed(wavelen=numpy.copy(self.wavelen),
+                     flambda=numpy.array(self.flambda[index], dtype=float),
+                     name=self.names[index], badval=self.badval)
+        if self.fnu is not None:
+            sedobj._setFluxes(sedobj.wavelen, sedobj.flambda, numpy.array(self.fnu[index], dtype=float))
+        return sedobj
+
+    def _fnuFactor(self):
+        """
+        Return the array which converts flambda into fnu on self.wavelen
+        """
+        factor = self.wavelen*self.wavelen*self._physParams.nm2m/self._physParams.lightspeed
+        return factor*self._physParams.ergsetc2jansky
+
+    def flambdaTofnu(self):
+        """
+        Calculate fnu (in Jansky) from flambda (in ergs/cm^2/s/nm) for every SED
+        """
+        self.fnu = self.flambda*self._fnuFactor()
+
+    def fnuToflambda(self):
+        """
+        Calculate flambda (in ergs/cm^2/s/nm) from fnu (in Jansky) for every SED
+        """
+        factor = self._physParams.lightspeed/self._physParams.nm2m/(self.wavelen*self.wavelen)
+        factor = factor/self._physParams.ergsetc2jansky
+        self.flambda = self.fnu*factor
+
+    def resampleSED(self, wavelen_match):
+        """
+        Resample every SED onto the wavelength grid wavelen_match (linear
+        interpolation; wavelengths outside the current grid are set to NaN).
+        Sets fnu to None.
+        """
+        wavelen_match = numpy.asarray(wavelen_match, dtype=float)
+        self.flambda = _interp_rows(self.wavelen, self.flambda, wavelen_match)
+        self.wavelen = intern_wavelen_grid(wavelen_match)
+        self.fnu = None
+
+    def redshiftSED(self, redshift, dimming=False, wavelen_match=None):
+        """
+        Redshift the SEDs, optionally adding cosmological dimming.  Sets fnu to None.
+
+        @param [in] redshift is either a single redshift applied to every SED,
+        or an array with one redshift per SED
+
+        @param [in] dimming is a boolean; if True, apply cosmological dimming
+
+        @param [in] wavelen_match is the wavelength grid for the redshifted SEDs.
+
+        A single redshift simply stretches the shared wavelength grid (as
+        Sed.redshiftSED does).  SEDs redshifted by different amounts no longer
+        share a grid, so they are resampled onto wavelen_match (which defaults
+        to the current grid).  If wavelen_match is given with a single redshift,
+        the redshifted SEDs are also resampled onto it.
+        """
+        redshift_arr = numpy.asarray(redshift, dtype=float)
+        if redshift_arr.ndim == 0:
+            scale = float(_redshift_scale(redshift_arr))
+            self.wavelen = intern_wavelen_grid(self.wavelen*scale)
+            if dimming:
+                self.flambda = self.flambda/scale
+            self.fnu = None
+            if wavelen_match is not None:
+                self.resampleSED(wavelen_match)
+            return
+
+        scale = _redshift_scale(_per_row(redshift_arr, len(self), 'redshift'))
+        if wavelen_match is None:
+            wavelen_match = self.wavelen
+        wavelen_match = numpy.asarray(wavelen_match, dtype=float)
+
+        flambda = _interp_rows(self.wavelen, self.flambda, wavelen_match, scale=scale)
+        if dimming:
+            flambda /= scale[:, numpy.newaxis]
+        self.wavelen = intern_wavelen_grid(wavelen_match)
+        self.flambda = flambda
+        self.fnu = None
+
+    def setupCCMab(self):
+        """
+        Calculate a(x) and b(x) for the CCM dust model on the wavelength grid of
+        the batch (see Sed.setupCCMab).  Returns a_x, b_x.
+        """
+        return _ccm_ab(self.wavelen)
+
+    def addCCMDust(self, a_x, b_x, A_v=None, ebv=None, R_v=3.1):
+        """
+        Add CCM dust model extinction to every SED.  Sets fnu to None.
+
+        @param [in] a_x and b_x are the outputs of setupCCMab
+
+        @param [in] A_v, ebv and R_v are each either a single value applied to
+        every SED, or an array with one value per SED.  As in Sed.addCCMDust,
+        specify any two of A_v, E(B-V) or R_v (=3.1 default).
+        """
+        n_rows = len(self)
+        R_v_default = numpy.all(numpy.asarray(R_v) == 3.1)
+        R_v = _per_row(R_v, n_rows, 'R_v')
+        if ebv is not None:
+            ebv = _per_row(ebv, n_rows, 'ebv')
+
+        if A_v is None:
+            if ebv is None:
+                raise ValueError("addCCMDust requires A_v or ebv")
+            A_v = R_v*ebv
+        else:
+            A_v = _per_row(A_v, n_rows, 'A_v')
+            if ebv is not None:
+                calcRv = A_v/ebv
+                if R_v_default:
+                    R_v = calcRv
+                elif numpy.any(calcRv != R_v):
+                    raise ValueError("CCM parametrization expects R_v = A_v / E(B-V);",
+                                     "Please check input values, because values are inconsistent.")
+
+        dust = _ccm_dust(a_x, b_x, A_v, R_v)
+        dust *= self.flambda
+        self.flambda = dust
+        self.fnu = None
+
+    def multiplyFluxNorm(self, fluxNorm):
+        """
+        Multiply flambda and fnu by fluxNorm (either a single value, or an array
+        with one value per SED).  See Sed.multiplyFluxNorm.
+        """
+        fluxNorm = _per_row(fluxNorm, len(self), 'fluxNorm')[:, numpy.newaxis]
+        # fnu is only rescaled if it has already been calculated
+        if self.fnu is not None:
+            self.fnu = self.fnu*fluxNorm
+        self.flambda = self.flambda*fluxNorm
+
+    def _needResample(self, wavelen_match):
+        """
+        Return True if wavelen_match is not the wavelength grid of the batch
+        (to within 1e-10 nm, as in Sed._needResample)
+        """
+        if wavelen_match is self.wavelen:
+            return False
+        if numpy.shape(wavelen_match) != numpy.shape(self.wavelen):
+            return True
+        return bool(numpy.any(numpy.abs(wavelen_match - self.wavelen) > 1e-10))
+
+    def _fnuOnGrid(self, wavelen_match):
+        """
+        Return fnu resampled onto wavelen_match (without changing self)
+        """
+        if self.fnu is None:
+            self.flambdaTofnu()
+        if self._needResample(wavelen_match):
+            return _interp_rows(self.wavelen, self.fnu, wavelen_match)
+        return self.fnu
+
+    def calcFlux(self, bandpass):
+        """
+        Return an array of the flux of every SED in bandpass (see Sed.calcFlux)
+        """
+        if bandpass.phi is None:
+            bandpass.sbTophi()
+        fnu = self._fnuOnGrid(bandpass.wavelen)
+        return _dot_float64(fnu, bandpass.phi)*(bandpass.wavelen[1]-bandpass.wavelen[0])
+
+    def calcMag(self, bandpass):
+        """
+        Return an array of the AB magnitude of every SED in bandpass (see Sed.calcMag).
+        SEDs with no flux in the bandpass get self.badval.
+        """
+        return self.magFromFlux(self.calcFlux(bandpass))
+
+    def calcFluxNorm(self, magmatch, bandpass):
+        """
+        Return an array of the fluxNorm (see Sed.calcFluxNorm) which will give
+        each SED the magnitude magmatch (a single value, or one value per SED)
+        in bandpass.
+        """
+        dmag = _per_row(magmatch, len(self), 'magmatch') - self.calcMag(bandpass)
+        return numpy.power(10, -0.4*dmag)
+
+    def magFromFlux(self, flux):
+        """
+        Convert an array of fluxes into magnitudes; fluxes which are not
+        positive give self.badval.
+        """
+        flux = numpy.asarray(flux, dtype=float)
+        valid = flux > 1e-300
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            mags = -2.5*numpy.log10(flux) - self.zp
+        return numpy.where(valid, mags, self.badval)
+
+    def manyFluxCalc(self, phiarray, wavelen_step, observedBandpassInd=None):
+        """
+        Calculate the flux of every SED in every bandpass of phiarray with one
+        matrix product.  As with Sed.manyFluxCalc, phiarray (see Sed.setupPhiArray)
+        must be on the same wavelength grid as the batch.
+
+        @param [in] phiarray is the 2-D array of bandpass phi values
+
+        @param [in] wavelen_step is the step of the wavelength grid
+
+        @param [in] observedBandpassInd is an optional list of the rows of
+        phiarray to use
+
+        @param [out] an (n_seds x n_bandpasses) array of fluxes
+        """
+        if observedBandpassInd is not None:
+            phiarray = phiarray[observedBandpassInd]
+        if self.fnu is not None:
+            return _dot_float64(self.fnu, phiarray.T)*wavelen_step
+        # fnu is flambda times a function of wavelength; fold that
+        # function into phiarray rather than calculating fnu
+        return _dot_float64(self.flambda, (phiarray*self._fnuFactor()).T)*wavelen_step
+
+    def manyMagCalc(self, phiarray, wavelen_step, observedBandpassInd=None):
+        """
+        Calculate the magnitude of every SED in every bandpass of phiarray with
+        one matrix product (see manyFluxCalc).  SEDs with no flux in a bandpass
+        get self.badval (see magFromFlux).
+
+        @param [out] an (n_seds x n_bandpasses) array of magnitudes
+        """
+        fluxes = self.manyFluxCalc(phiarray, wavelen_step, observedBandpassInd)
+        return self.magFromFlux(fluxes)
@@ -2,11 +2,14 @@ from builtins import zip
 from builtins import object
 import os
 import copy
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy
 from lsst.utils import getPackageDir
 from lsst.sims.utils import defaultSpecMap
 from .Bandpass import Bandpass
-from .Sed import Sed
+from .Sed import Sed, _find_resampled_sed_cache, _read_sed_flambda, _sed_flambda_is_cached
+from .Sed import _ccm_dust
 from lsst.sims.photUtils import getImsimFluxNorm
 
 __all__ = ["SedList"]
@@ -27,6 +30,9 @@ class SedList(object):
     after the constructor has been called.
     """
 
+    # the number of Seds to which applyAv applies dust in one array operation
+    _dust_block_size = 64
+
     def __init__(self, sedNameList, magNormList,
                  normalizingBandpass=None,
                  specMap=defaultSpecMap,
@@ -35,7 +41,8 @@ class SedList(object):
                  redshiftList = None,
                  galacticAvList = None,
                  internalAvList = None,
-                 cosmologicalDimming = True):
+                 cosmologicalDimming = True,
+                 nThreads = None):
 
         """
         @param [in] sedNameList is a list of SED file names.
@@ -70,6 +77,9 @@ class SedList(object):
         dimming (the extray (1+z)^-1 factor in flux) should be applied to spectra
         when they are redshifted (defaults to True)
 
+        @param [in] nThreads is the number of threads used to read Sed files
+        which are not already cached (defaults to the number of CPUs)
+
         Note: once wavelenMatch and cosmologicalDimming have been set in
         the constructor, they cannot be un-set.
 
@@ -84,6 +94,9 @@ class SedList(object):
         self._wavelen_match = copy.deepcopy(wavelenMatch)
         self._file_dir = fileDir
         self._cosmological_dimming = cosmologicalDimming
+        if nThreads is None:
+            nThreads = multiprocessing.cpu_count()
+        self._n_threads = nThreads
 
         self._normalizing_bandpass = normalizingBandpass
 
@@ -185,15 +198,51 @@ class SedList(object):
                 else:
                     self._redshift_list += list(redshiftList)
 
-        temp_sed_list = []
-        for sedName, magNorm in zip(sedNameList, magNormList):
-            sed = Sed()
-
+        # Seds which will not be redshifted or reddened by internal dust can be
+        # taken directly from the cache of resampled SEDs (if the templates
+        # have been cached on self._wavelen_match with cache_resampled_seds)
+        resampled_cache = None
+        if self._wavelen_match is not None and self._normalizing_bandpass is None:
+            resampled_cache = _find_resampled_sed_cache(self._wavelen_match)
+
+        # find the file (or resampled template) behind each Sed first, so that
+        # the unique files which have to be read can be read concurrently
+        file_name_list = []
+        resampled_list = []
+        for ix, sedName in enumerate(sedNameList):
+            file_name = None
+            cached = None
             if sedName != "None":
                 if self._spec_map is not None:
-                    sed.readSED_flambda(os.path.join(self._file_dir, self._spec_map[sedName]))
+                    file_name = os.path.join(self._file_dir, self._spec_map[sedName])
                 else:
-                    sed.readSED_flambda(os.path.join(self._file_dir, sedName))
+                    file_name = os.path.join(self._file_dir, sedName)
+
+                if resampled_cache is not None:
+                    if ((internalAvList is None or internalAvList[ix] is None) and
+                            (redshiftList is None or redshiftList[ix] is None)):
+                        cached = resampled_cache.get(file_name)
+                        if cached is not None and numpy.isnan(cached[3]):
+                            cached = None
+
+            file_name_list.append(file_name)
+            resampled_list.append(cached)
+
+        sources = self._readSedFiles(list(set([file_name for file_name, cached
+                                               in zip(file_name_list, resampled_list)
+                                               if file_name is not None and cached is None])))
+
+        temp_sed_list = []
+        for file_name, cached, magNorm in zip(file_name_list, resampled_list, magNormList):
+            sed = Sed()
+
+            if cached is not None:
+                fNorm = numpy.power(10, (-0.4*(magNorm - cached[3])))
+                sed._setFluxes(cached[0], cached[1]*fNorm, cached[2]*fNorm)
+                sed.name = file_name
+
+            elif file_name is not None:
+                sed._setSourceSED(sources[file_name], file_name)
 
                 if self._normalizing_bandpass is not None:
                     fNorm = sed.calcFluxNorm(magNorm, self._normalizing_bandpass)
@@ -231,6 +280,32 @@ class SedList(object):
 
 
 
+    def _readSedFiles(self, fileNameList):
+        """
+        Read the Sed files in fileNameList.  Files which are not already cached
+        are read concurrently by a pool of self._n_threads threads (most of the
+        time is spent in gzip decompression and I/O, which release the GIL).
+
+        @param [in] fileNameList is a list of unique Sed file names
+
+        @param [out] a dict mapping each file name to the (file name, wavelen, flambda)
+        triple read by _read_sed_flambda
+        """
+        n_to_read = len([name for name in fileNameList if not _sed_flambda_is_cached(name)])
+        n_threads = min(self._n_threads, n_to_read)
+        if n_threads > 1:
+            pool = ThreadPool(n_threads)
+            try:
+                sources = pool.map(_read_sed_flambda, fileNameList)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            sources = [_read_sed_flambda(name) for name in fileNameList]
+
+        return dict(zip(fileNameList, sources))
+
+
     def applyAv(self, sedList, avList, dustWavelen, aCoeffs, bCoeffs):
         """
         Take the array of Sed objects sedList and apply extinction due to dust.
@@ -259,23 +334,52 @@ class SedList(object):
 
         @param [out] bCoeffs as generated/used by this method
 
-        aCoeffs and bCoeffs are re-generated as needed
+        aCoeffs and bCoeffs are re-generated as needed (they are memoized for
+        each wavelength grid by Sed.setupCCMab).  The Seds are grouped by
+        wavelength grid and the dust is applied to each group of Seds in one
+        broadcasted array operation.
         """
 
-        for sedobj, av in zip(sedList, avList):
+        # group the Seds by wavelength grid.  Seds on the same interned grid
+        # (see WavelenGrids.py; e.g. templates read from files, or Seds resampled
+        # onto wavelenMatch) share the same wavelen array, so most grids are
+        # recognized by identity; other arrays are compared with the grids found so far
+        grid_list = []
+        sed_dex_list = []
+        grid_dex_dict = {}
+        for ix, (sedobj, av) in enumerate(zip(sedList, avList)):
             if sedobj.wavelen is not None and av is not None:
-                #setupCCMab only depends on the wavelen array
-                #because this is supposed to be the same for every
-                #SED object in sedList, it is only called once for
-                #each invocation of applyAv
-
-                if dustWavelen is None or len(sedobj.wavelen)!=len(dustWavelen) \
-                or (sedobj.wavelen!=dustWavelen).any():
-                    aCoeffs, bCoeffs = sedobj.setupCCMab()
-                    dustWavelen = sedobj.wavelen
-
-                sedobj.addCCMDust(aCoeffs, bCoeffs, A_v=av)
-
+                grid_id = id(sedobj.wavelen)
+                if grid_id not in grid_dex_dict:
+                    grid_dex_dict[grid_id] = None
+                    for grid_dex, grid in enumerate(grid_list):
+                        if numpy.array_equal(grid, sedobj.wavelen):
+                            grid_dex_dict[grid_id] = grid_dex
+                            break
+                    if grid_dex_dict[grid_id] is None:
+                        grid_dex_dict[grid_id] = len(grid_list)
+                        grid_list.append(sedobj.wavelen)
+                        sed_dex_list.append([])
+                sed_dex_list[grid_dex_dict[grid_id]].append(ix)
+
+        for sed_dexes in sed_dex_list:
+            dustWavelen = sedList[sed_dexes[0]].wavelen
+            aCoeffs, bCoeffs = sedList[sed_dexes[0]].setupCCMab()
+
+            if len(sed_dexes) == 1:
+                sedList[sed_dexes[0]].addCCMDust(aCoeffs, bCoeffs, A_v=avList[sed_dexes[0]])
+                continue
+
+            # the dust is calculated for blocks of Seds small enough to stay in cache
+            av_array = numpy.array([avList[ix] for ix in sed_dexes], dtype=float)
+            for i_start in range(0, len(sed_dexes), self._dust_block_size):
+                block_dexes = sed_dexes[i_start:i_start+self._dust_block_size]
+                dust = _ccm_dust(aCoeffs, bCoeffs, av_array[i_start:i_start+self._dust_block_size],
+                                 numpy.array([3.1]))
+                for row, ix in enumerate(block_dexes):
+                    dust[row] *= sedList[ix].flambda
+                    sedList[ix].flambda = dust[row]
+                    sedList[ix].fnu = None
 
         return dustWavelen, aCoeffs, bCoeffs
 
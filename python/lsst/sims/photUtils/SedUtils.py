@@ -20,6 +20,16 @@ def getImsimFluxNorm(sed, magmatch):
     The factor by which the flux of sed needs to be multiplied to achieve
     the desired magnitude.
     """
+    mag = _getImsimMag(sed)
+    dmag = magmatch - mag
+    return np.power(10, (-0.4*dmag))
+
+
+def _getImsimMag(sed):
+    """
+    Calculate the magnitude of an SED in the imsim bandpass
+    (see getImsimFluxNorm).
+    """
 
     # This method works based on the assumption that the imsim bandpass
     # is a delta function.  If that ever ceases to be true, the unit test
@@ -33,9 +43,6 @@ def getImsimFluxNorm(sed, magmatch):
         non_zero_dex = np.where(bp.sb > 0.0)[0][0]
         getImsimFluxNorm.imsim_wavelen = bp.wavelen[non_zero_dex]
 
-    if sed.fnu is None:
-        sed.flambdaTofnu()
-
     if (getImsimFluxNorm.imsim_wavelen < sed.wavelen.min() or
         getImsimFluxNorm.imsim_wavelen > sed.wavelen.max()):
 
@@ -44,6 +51,4 @@ def getImsimFluxNorm(sed, magmatch):
                            + "The SED does not cover that wavelength\n"
                            + "(Covers %e < lambda %e)" % (sed.wavelen.min(), sed.wavelen.max()))
 
-    mag = -2.5*np.log10(np.interp(getImsimFluxNorm.imsim_wavelen, sed.wavelen, sed.fnu)) - sed.zp
-    dmag = magmatch - mag
-    return np.power(10, (-0.4*dmag))
+    return -2.5*np.log10(np.interp(getImsimFluxNorm.imsim_wavelen, sed.wavelen, sed.fnu)) - sed.zp
@@ -0,0 +1,188 @@
+"""
+WavelenGrids -
+
+A registry of wavelength grids.  Nearly every wavelength array in a simulation
+is a copy of one of a handful of grids (the grid of the bandpasses, the grid
+shared by all Kurucz templates, the grid shared by all BC03 templates, ...).
+intern_wavelen_grid() returns one canonical, read-only array for each distinct
+grid, so that the arrays held by the package itself on the same grid are all
+the same array: the grids of templates read with Sed.readSED_flambda (which are
+read-only anyway), the Bandpasses of a BandpassDict and its wavelenMatch, the
+resampled copies of Seds made by a BandpassDict, SedBatches and Resamplers:
+
+    - the grid is stored once rather than once per object
+
+    - objects on the same interned grid hold the same array, so the checks
+      made before every magnitude calculation (does this Sed need to be
+      resampled onto the grid of this BandpassDict?) succeed with a pointer
+      comparison
+
+Each interned grid has a GridFingerprint (its first and last values, its step
+if it is regular, its length and a hash of its values), which is calculated
+once, when the grid is interned.  wavelen_grid_fingerprint() returns it
+without looking at the values of an interned grid.
+
+Canonical arrays are only handed out where the package owns the array.  The
+wavelen arrays of Seds and Bandpasses which user code resamples (with
+Sed.resampleSED and Bandpass.resampleBandpass, and so Bandpass.setBandpass and
+Bandpass.readThroughput) are private, writeable arrays which may be changed in
+place; they are compared with other grids value by value, as before.
+
+Grids are only kept in the registry while some object refers to them, except
+for the grids of the LSST SED cache (see Sed.cache_LSST_seds), which are
+interned once, when the cache is loaded, and kept for the life of the process
+(or until sims_clean_up is called).
+"""
+
+from builtins import object
+import hashlib
+import threading
+import weakref
+from collections import namedtuple
+import numpy
+try:
+    from lsst.sims.utils.CodeUtilities import sims_clean_up
+except:
+    sims_clean_up = None
+
+__all__ = ["GridFingerprint", "intern_wavelen_grid", "wavelen_grid_fingerprint"]
+
+
+GridFingerprint = namedtuple('GridFingerprint',
+                             ['wavelen_min', 'wavelen_max', 'wavelen_step', 'length', 'hash'])
+GridFingerprint.__doc__ = """
+The identity of a wavelength grid: its first and last values (its minimum and
+maximum if it is sorted), its step (None unless every step is the same),
+its length and a hash of its values.
+"""
+
+
+def _calc_fingerprint(wavelen):
+    """
+    Calculate the GridFingerprint of a 1-D float array
+    """
+    data = numpy.ascontiguousarray(wavelen, dtype=float)
+    grid_hash = hashlib.md5(memoryview(data).cast('B')).hexdigest()[:16]
+    if len(data) == 0:
+        return GridFingerprint(None, None, None, 0, grid_hash)
+    step = None
+    if len(data) > 1:
+        steps = numpy.diff(data)
+        if numpy.all(steps == steps[0]):
+            step = float(steps[0])
+    return GridFingerprint(float(data[0]), float(data[-1]), step, len(data), grid_hash)
+
+
+class _WavelenGridRegistry(object):
+    """
+    The canonical array of each interned grid (keyed on its fingerprint) and the
+    fingerprint of each canonical array (keyed on its id).  Entries are removed
+    when their canonical array is garbage collected; pinned grids are held by
+    the registry itself, so they never are.
+    """
+
+    def __init__(self):
+        self._grids = weakref.WeakValueDictionary()
+        self._fingerprints = {}
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._grids)
+
+    def fingerprint(self, wavelen):
+        """
+        Return the fingerprint of wavelen if wavelen is an interned grid, else None
+        """
+        entry = self._fingerprints.get(id(wavelen))
+        if entry is not None and entry[0]() is wavelen:
+            return entry[1]
+        return None
+
+    def intern(self, wavelen, pin=False):
+        """
+        Return the canonical array equal to wavelen (see intern_wavelen_grid).
+        If pin is True, the registry keeps the canonical array alive.
+        """
+        fingerprint = self.fingerprint(wavelen)
+        if fingerprint is not None:
+            if pin:
+                with self._lock:
+                    self._pinned[fingerprint] = wavelen
+            return wavelen
+        wavelen = numpy.asarray(wavelen, dtype=float)
+        if wavelen.ndim != 1:
+            raise ValueError("Wavelength grids must be 1-D arrays")
+        fingerprint = _calc_fingerprint(wavelen)
+        with self._lock:
+            canonical = self._grids.get(fingerprint)
+            if canonical is None:
+                canonical = numpy.array(wavelen, dtype=float)
+                canonical.flags.writeable = False
+                self._grids[fingerprint] = canonical
+                self._fingerprints[id(canonical)] = (weakref.ref(canonical), fingerprint)
+                weakref.finalize(canonical, self._forget, id(canonical))
+            if pin:
+                self._pinned[fingerprint] = canonical
+        return canonical
+
+    def _forget(self, grid_id):
+        self._fingerprints.pop(grid_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._grids.clear()
+            self._fingerprints.clear()
+            self._pinned.clear()
+
+
+_global_wavelen_grids = _WavelenGridRegistry()
+
+if sims_clean_up is not None:
+    sims_clean_up.targets.append(_global_wavelen_grids)
+
+
+def intern_wavelen_grid(wavelen):
+    """
+    Return the canonical (read-only) array of the wavelength grid wavelen.
+    Equal grids return the same array; the first time a grid is seen,
+    a read-only copy of it becomes the canonical array.
+
+    @param [in] wavelen is a 1-D array of wavelengths (nm)
+
+    @param [out] the canonical numpy array equal to wavelen
+    """
+    return _global_wavelen_grids.intern(wavelen)
+
+
+def _pin_wavelen_grid(wavelen):
+    """
+    Return the canonical array of the wavelength grid wavelen (as
+    intern_wavelen_grid) and keep it in the registry even when nothing
+    else refers to it.  Used for the grids of the LSST SED cache, which
+    are interned once, when the cache is loaded.
+    """
+    return _global_wavelen_grids.intern(wavelen, pin=True)
+
+
+def wavelen_grid_fingerprint(wavelen):
+    """
+    Return the GridFingerprint of the wavelength grid wavelen.  This does not
+    look at the values of wavelen if it was returned by intern_wavelen_grid.
+
+    @param [in] wavelen is a 1-D array of wavelengths (nm)
+
+    @param [out] a GridFingerprint
+    """
+    fingerprint = _global_wavelen_grids.fingerprint(wavelen)
+    if fingerprint is not None:
+        return fingerprint
+    return _calc_fingerprint(wavelen)
+
+
+def _is_interned(wavelen):
+    """
+    Return True if wavelen was returned by intern_wavelen_grid
+    """
+    return _global_wavelen_grids.fingerprint(wavelen) is not None
+
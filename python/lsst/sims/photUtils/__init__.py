@@ -1,8 +1,14 @@
 from .LSSTdefaults import *
 from .PhysicalParameters import *
+from .asciiUtils import *
+from .WavelenGrids import *
+from .Resampler import *
 from .Sed import *
 from .Bandpass import *
 from .SedUtils import *
+from .SedBatch import *
+from .DustMagTable import *
+from .RedshiftFluxTable import *
 from .BandpassDict import *
 from .SedList import *
 from .PhotometricParameters import *
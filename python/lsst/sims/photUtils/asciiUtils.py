@@ -0,0 +1,141 @@
+"""
+asciiUtils - a fast reader for the (optionally gzipped) ASCII column files
+in which SEDs and throughput curves are stored.
+
+The whole file is read and decompressed in one pass, and, for well-formed
+files (every data row has the same number of columns), the text is converted
+to floats in bulk by numpy rather than one value at a time.
+"""
+
+import gzip
+import zlib
+import warnings
+import numpy
+
+__all__ = ["readAsciiColumns"]
+
+
+_comment_characters = ('#', '$', '!')
+
+
+def _read_file_text(filename):
+    """
+    Return the contents of filename (decompressed, if it is gzipped) as a string.
+    """
+    with open(filename, 'rb') as input_file:
+        data = input_file.read()
+    if data[:2] == b'\x1f\x8b':
+        if hasattr(gzip, 'decompress'):
+            # handles files with more than one gzip member
+            data = gzip.decompress(data)
+        else:
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    return data.decode('latin-1')
+
+
+def _count_rows(text, nColumns):
+    """
+    Return the number of rows in text (which must not have leading or
+    trailing whitespace) if every non-blank line contains exactly
+    nColumns values; otherwise return None.
+    """
+    chars = numpy.frombuffer(text.encode('latin-1'), dtype=numpy.uint8)
+    is_space = chars <= 32
+    # the position of the first character of every value but the first
+    starts = numpy.flatnonzero(is_space[:-1] & ~is_space[1:]) + 1
+    # the index of the first value after each newline
+    next_value = numpy.searchsorted(starts, numpy.flatnonzero(chars == 10))
+    if len(next_value) > 0:
+        # consecutive newlines (i.e. blank lines) are followed by the same value
+        next_value = next_value[numpy.append(True, numpy.diff(next_value) > 0)]
+    # the value following the k-th line break must be value number k*nColumns
+    if not numpy.array_equal(next_value, nColumns*numpy.arange(1, len(next_value)+1)-1):
+        return None
+    return len(next_value) + 1
+
+
+def _parse_lines(lines, nColumns):
+    """
+    Slow path for _parse_text: convert the first nColumns values of each
+    line that has at least nColumns values; other lines are skipped.
+    """
+    values = []
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) >= nColumns:
+            values.append([float(tt) for tt in tokens[:nColumns]])
+    return numpy.array(values, dtype=float).reshape(-1, nColumns)
+
+
+def _parse_text(text, nColumns):
+    """
+    Convert the text of a column file to a 2-D array of floats containing its
+    first nColumns columns.
+
+    Lines beginning with '#', '$' or '!' are comments, as is anything following
+    a '#' on a data line.  Lines with fewer than nColumns values are skipped.
+    """
+    # comments are usually confined to a header; strip it off cheaply
+    # before looking for comments anywhere else in the file
+    text = text.lstrip()
+    while text[:1] in _comment_characters:
+        line_end = text.find('\n')
+        text = text[line_end:].lstrip() if line_end >= 0 else ''
+
+    if '#' in text or '$' in text or '!' in text:
+        lines = [line.split('#', 1)[0] for line in text.splitlines()
+                 if line.lstrip()[:1] not in _comment_characters]
+        text = '\n'.join(lines)
+
+    text = text.strip()
+    if len(text) == 0:
+        return numpy.zeros((0, nColumns), dtype=float)
+
+    first_line_end = text.find('\n')
+    n_file_columns = len(text[:first_line_end if first_line_end >= 0 else len(text)].split())
+    n_rows = _count_rows(text, n_file_columns)
+
+    if n_file_columns >= nColumns and n_rows is not None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            values = numpy.fromstring(text, dtype=float, sep=' ')
+        # numpy.fromstring stops at the first value it cannot convert,
+        # so check that everything was converted
+        if len(values) == n_file_columns*n_rows:
+            return values.reshape(n_rows, n_file_columns)[:, :nColumns]
+
+    # the rows do not all have the same number of columns
+    return _parse_lines(text.splitlines(), nColumns)
+
+
+def readAsciiColumns(filename, nColumns=2):
+    """
+    Read the first nColumns columns of an ASCII file of numbers.
+
+    @param [in] filename is the name of the file.  Gzipped files are detected
+    from their contents.  If filename does not exist, the name with '.gz'
+    appended (or removed) is tried instead.
+
+    @param [in] nColumns is the number of columns to read (default 2)
+
+    @param [out] a list of nColumns numpy arrays, one for each column
+
+    Lines beginning with '#', '$' or '!' are treated as comments, as is anything
+    following a '#' on a line.  Lines containing fewer than nColumns values are
+    skipped.  Raises an IOError if neither filename nor its alternate exists.
+    """
+    if filename.endswith('.gz'):
+        alternate_filename = filename[:-3]
+    else:
+        alternate_filename = filename + '.gz'
+
+    try:
+        text = _read_file_text(filename)
+    except IOError:
+        try:
+            text = _read_file_text(alternate_filename)
+        except IOError:
+            raise IOError("%s not found." % filename)
+
+    data = _parse_text(text, nColumns)
+    return [numpy.ascontiguousarray(data[:, ii]) for ii in range(nColumns)]
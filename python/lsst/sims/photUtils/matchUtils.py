@@ -65,7 +65,8 @@ class matchBase(object):
         flux_obs = np.power(10,(objectMags + zp)/(-2.5))
         sedTest.resampleSED(wavelen_match=bandpassDict.wavelenMatch)
         sedTest.flambdaTofnu()
-        flux_model = sedTest.manyFluxCalc(bandpassDict.phiArray, bandpassDict.wavelenStep)
+        flux_model = sedTest.manyFluxCalc(bandpassDict.phiArray, bandpassDict.wavelenStep,
+                                          phiSupport=bandpassDict.phiSupport)
         if filtRange is not None:
             flux_obs = flux_obs[filtRange]
             flux_model = flux_model[filtRange]
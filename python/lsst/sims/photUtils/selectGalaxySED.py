@@ -4,7 +4,7 @@ import os
 import numpy as np
 
 import lsst.utils
-from .Sed import Sed
+from .SedBatch import SedBatch
 from .matchUtils import matchGalaxy
 from .BandpassDict import BandpassDict
 from .EBV import EBVbase as ebv
@@ -201,25 +201,25 @@ class selectGalaxySED(matchGalaxy):
         matchErrors = [None] * len(catRedshifts)
         redshiftIndex = np.argsort(catRedshifts)
 
+        #Find the colors of all model SEDs at every redshift in redshiftRange. Each SED is
+        #redshifted and resampled onto the bandpass grid at every redshift in one vectorized pass.
+        modelColorGrid = np.empty((len(sedList), len(redshiftRange), len(galPhot)-1))
+        for sedNum, galSpec in enumerate(sedList):
+            zBatch = SedBatch.fromRedshiftGrid(galSpec, redshiftRange, galPhot.wavelenMatch)
+            zMags = galPhot.magListForSedBatch(zBatch)
+            modelColorGrid[sedNum] = zMags[:, :-1] - zMags[:, 1:]
+
         numOn = 0
         notMatched = 0
         lastRedshift = -100
         print('Starting Matching. Arranged by redshift value.')
-        for redshift in redshiftRange:
+        for redshiftNum, redshift in enumerate(redshiftRange):
 
             if numRedshifted % 10 == 0:
                 print('%i out of %i redshifts gone through' % (numRedshifted, len(redshiftRange)))
             numRedshifted += 1
 
-            colorSet = []
-            for galSpec in sedList:
-                sedColors = []
-                fileSED = Sed()
-                fileSED.setSED(wavelen = galSpec.wavelen, flambda = galSpec.flambda)
-                fileSED.redshiftSED(redshift)
-                sedColors = self.calcBasicColors([fileSED], galPhot, makeCopy = True)
-                colorSet.append(sedColors)
-            colorSet = np.transpose(colorSet)
+            colorSet = np.transpose(modelColorGrid[:, [redshiftNum], :])
             for currentIndex in redshiftIndex[numOn:]:
                 matchMags = objMags[currentIndex]
                 if lastRedshift < np.round(catRedshifts[currentIndex],dzAcc) <= redshift:
@@ -0,0 +1,90 @@
+import unittest
+import os
+import gzip
+import numpy as np
+
+import lsst.utils.tests
+from lsst.utils import getPackageDir
+from lsst.sims.photUtils import readAsciiColumns
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class ReadAsciiColumnsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scratch_dir = os.path.join(getPackageDir('sims_photUtils'),
+                                        'tests', 'scratchSpace')
+        self.file_name = os.path.join(self.scratch_dir, 'ascii_columns_test.txt')
+        self.data_dir = os.path.join(getPackageDir('sims_photUtils'),
+                                     'tests', 'cartoonSedTestData')
+
+    def tearDown(self):
+        for name in (self.file_name, self.file_name+'.gz'):
+            if os.path.exists(name):
+                os.unlink(name)
+
+    def test_against_genfromtxt(self):
+        """
+        Test that readAsciiColumns gives the same result as numpy.genfromtxt
+        on the gzipped SEDs and un-gzipped throughputs in the test data
+        """
+        file_name_list = [os.path.join(self.data_dir, 'galaxySed', name)
+                          for name in os.listdir(os.path.join(self.data_dir, 'galaxySed'))]
+        file_name_list += [os.path.join(self.data_dir, 'test_bandpass_%s.dat' % bp)
+                           for bp in 'ugriz']
+        for file_name in file_name_list:
+            control = np.genfromtxt(file_name)
+            wavelen, flux = readAsciiColumns(file_name)
+            np.testing.assert_array_equal(wavelen, control[:, 0])
+            np.testing.assert_array_equal(flux, control[:, 1])
+
+    def test_comments_and_ragged_rows(self):
+        """
+        Test that comments, blank lines and rows with too few or too many
+        columns are handled
+        """
+        with open(self.file_name, 'w') as output_file:
+            output_file.write('# a header\n$ another header\n! and another\n')
+            output_file.write('1.0 2.0\n\n   \n3.0 4.0 # inline comment\n')
+            output_file.write('5.0\n6.0 7.0 8.0\n')
+        wavelen, flux = readAsciiColumns(self.file_name)
+        np.testing.assert_array_equal(wavelen, np.array([1.0, 3.0, 6.0]))
+        np.testing.assert_array_equal(flux, np.array([2.0, 4.0, 7.0]))
+
+        wavelen, = readAsciiColumns(self.file_name, nColumns=1)
+        np.testing.assert_array_equal(wavelen, np.array([1.0, 3.0, 5.0, 6.0]))
+
+        with open(self.file_name, 'w') as output_file:
+            output_file.write('1.0 2.0\n3.0 abc\n')
+        with self.assertRaises(ValueError):
+            readAsciiColumns(self.file_name)
+
+    def test_gzip_names(self):
+        """
+        Test that files are found with or without the '.gz' suffix, and
+        that an IOError is raised if they do not exist
+        """
+        wavelen = np.arange(100.0, 200.0, 10.0)
+        flux = np.sqrt(wavelen)
+        with gzip.open(self.file_name+'.gz', 'wt') as output_file:
+            for ww, ff in zip(wavelen, flux):
+                output_file.write('%.17e %.17e\n' % (ww, ff))
+
+        for name in (self.file_name, self.file_name+'.gz'):
+            wavelen_test, flux_test = readAsciiColumns(name)
+            np.testing.assert_array_equal(wavelen_test, wavelen)
+            np.testing.assert_array_equal(flux_test, flux)
+
+        with self.assertRaises(IOError):
+            readAsciiColumns(os.path.join(self.scratch_dir, 'nonsense.txt'))
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
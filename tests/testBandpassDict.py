@@ -3,11 +3,16 @@ from builtins import zip
 from builtins import range
 import unittest
 import os
+import sys
 import copy
+import shutil
+import tempfile
+import warnings
 import numpy as np
 import lsst.utils.tests
 from lsst.utils import getPackageDir
-from lsst.sims.photUtils import Bandpass, Sed, BandpassDict, SedList
+from lsst.sims.photUtils import Bandpass, Sed, BandpassDict, SedList, RedshiftFluxTable
+from lsst.sims.photUtils import getImsimFluxNorm
 
 
 def setup_module(module):
@@ -124,6 +129,73 @@ class BandpassDictTest(unittest.TestCase):
             self.assertAlmostEqual(controlWavelenStep,
                                    testDict.wavelenStep, 10)
 
+    def testPhiSupport(self):
+        """
+        Test that fluxes integrated over the support of each phi are the same
+        as fluxes integrated over the whole wavelength grid
+        """
+        wavelen = np.arange(300.0, 1150.0, 0.5)
+        edges = [(320.0, 400.0), (400.0, 552.0), (552.0, 691.0), (1000.0, 1100.0)]
+        nameList = ['a', 'b', 'c', 'd']
+        bpList = []
+        for wmin, wmax in edges:
+            sb = np.where(np.logical_and(wavelen > wmin, wavelen < wmax), 0.5, 0.0)
+            bpList.append(Bandpass(wavelen=wavelen, sb=sb))
+        testDict = BandpassDict(bpList, nameList)
+
+        for (wmin, wmax), phi, (first, last) in zip(edges, testDict.phiArray, testDict.phiSupport):
+            self.assertGreater(testDict.wavelenMatch[first], wmin)
+            self.assertLessEqual(testDict.wavelenMatch[first-1], wmin)
+            self.assertLess(testDict.wavelenMatch[last-1], wmax)
+            self.assertGreaterEqual(testDict.wavelenMatch[last], wmax)
+            self.assertEqual(np.count_nonzero(phi), last-first)
+        self.assertEqual(Sed().setupPhiSupport(np.zeros((2, 10))), ((0, 0), (0, 0)))
+
+        for sedName in self.sedPossibilities[:5]:
+            ss = Sed()
+            ss.readSED_flambda(os.path.join(self.sedDir, sedName))
+            ss.resampleSED(wavelen_match=testDict.wavelenMatch)
+            ss.flambdaTofnu()
+            control = ss.manyFluxCalc(testDict.phiArray, testDict.wavelenStep)
+            test = ss.manyFluxCalc(testDict.phiArray, testDict.wavelenStep,
+                                   phiSupport=testDict.phiSupport)
+            np.testing.assert_allclose(test, control, rtol=1.0e-12, atol=0.0)
+            np.testing.assert_allclose(testDict.fluxListForSed(ss), control, rtol=1.0e-12, atol=0.0)
+            test = ss.manyFluxCalc(testDict.phiArray, testDict.wavelenStep, observedBandpassInd=[3, 1],
+                                   phiSupport=testDict.phiSupport)
+            np.testing.assert_allclose(test, control[[3, 1]], rtol=1.0e-12, atol=0.0)
+
+            # NaNs in fnu make every flux NaN, even outside of the support of a bandpass
+            ss.fnu = np.copy(ss.fnu)
+            ss.fnu[testDict.phiSupport[2][1]:] = np.NaN
+            test = ss.manyFluxCalc(testDict.phiArray, testDict.wavelenStep,
+                                   phiSupport=testDict.phiSupport)
+            self.assertTrue(np.isnan(test).all())
+
+        # so an Sed which does not cover the wavelength grid gets NaN in every
+        # bandpass, from every method of BandpassDict
+        ss = Sed()
+        ss.readSED_flambda(os.path.join(self.sedDir, self.sedPossibilities[0]))
+        narrowWavelen = np.arange(350.0, 900.0, 0.7)
+        narrow = Sed(wavelen=narrowWavelen, flambda=np.interp(narrowWavelen, ss.wavelen, ss.flambda))
+        nativeDict = BandpassDict(bpList, nameList, nativeGrids=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for bpDict in (testDict, nativeDict):
+                self.assertTrue(np.isnan(bpDict.fluxListForSed(narrow)).all())
+                self.assertTrue(np.isnan(bpDict.magListForSed(narrow)).all())
+                fluxArray = bpDict.fluxListForSedList([narrow, ss, narrow], indices=[0, 2])
+                self.assertTrue(np.isnan(fluxArray[[0, 2]]).all())
+                np.testing.assert_allclose(fluxArray[1][[0, 2]], bpDict.fluxListForSed(ss)[[0, 2]],
+                                           rtol=1.0e-10, atol=0.0)
+                # (narrow covers the grid once it is blueshifted by 10 per cent)
+                fluxArray = bpDict.fluxListForRedshiftedSed(narrow, np.array([0.0, -0.1]))
+                self.assertTrue(np.isnan(fluxArray[0]).all())
+                blueshifted = Sed(wavelen=narrow.wavelen, flambda=narrow.flambda)
+                blueshifted.redshiftSED(-0.1)
+                np.testing.assert_allclose(fluxArray[1], bpDict.fluxListForSed(blueshifted),
+                                           rtol=1.0e-10, atol=0.0)
+
     def testExceptions(self):
         """
         Test that the correct exceptions are thrown by BandpassDict
@@ -544,6 +616,170 @@ class BandpassDictTest(unittest.TestCase):
                 flux = dummySed.calcFlux(bpList[iy])
                 self.assertAlmostEqual(flux/fluxArray[bp][ix], 1.0, 2)
 
+    def testStackedSedList(self):
+        """
+        Test that the fluxes and magnitudes of a SedList, calculated with one
+        matrix product per block of Seds, are those of its Seds calculated one
+        at a time
+        """
+        nBandpasses = 5
+        bpNameList, bpList = self.getListOfBandpasses(nBandpasses)
+        testBpDict = BandpassDict(bpList, bpNameList)
+
+        nSed = 12
+        sedNameList = self.getListOfSedNames(nSed)
+        magNormList = self.rng.random_sample(nSed)*5.0 + 15.0
+        redshiftList = self.rng.random_sample(nSed)*2.0
+        testSedList = SedList(sedNameList, magNormList, redshiftList=redshiftList,
+                              wavelenMatch=testBpDict.wavelenMatch)
+
+        # mix Seds with and without fnu, Seds on other grids and an empty Sed
+        for sedObj in testSedList[:4]:
+            sedObj.flambdaTofnu()
+        for sedObj in testSedList[4:6]:
+            sedObj.resampleSED(wavelen_min=350.0, wavelen_max=1000.0, wavelen_step=0.3)
+        testSedList[6].setSED(testBpDict.wavelenMatch, flambda=np.copy(testSedList[6].flambda))
+        testSedList[6].flambda[-1] = np.NaN
+        testSedList._sed_list[7] = Sed()
+
+        controlFlux = np.array([testBpDict.fluxListForSed(sedObj) for sedObj in testSedList])
+        controlMag = np.array([testBpDict.magListForSed(sedObj) for sedObj in testSedList])
+        self.assertTrue(np.isnan(controlFlux[7]).all())
+
+        # (the module, rather than the class it exports)
+        BandpassDictModule = sys.modules['lsst.sims.photUtils.BandpassDict']
+        self.addCleanup(setattr, BandpassDictModule, '_sed_stack_rows',
+                        BandpassDictModule._sed_stack_rows)
+        for stackRows in (1024, 3):
+            BandpassDictModule._sed_stack_rows = stackRows
+            fluxList = testBpDict.fluxListForSedList(testSedList)
+            np.testing.assert_array_equal(np.isnan(fluxList), np.isnan(controlFlux))
+            np.testing.assert_allclose(fluxList, controlFlux, rtol=1.0e-10, atol=0.0)
+            magList = testBpDict.magListForSedList(testSedList)
+            np.testing.assert_allclose(magList, controlMag, rtol=0.0, atol=1.0e-10)
+            fluxArray = testBpDict.fluxArrayForSedList(testSedList)
+            for ix, bp in enumerate(bpNameList):
+                np.testing.assert_array_equal(fluxArray[bp], fluxList[:, ix])
+
+            fluxList = testBpDict.fluxListForSedList(testSedList, indices=[3, 0])
+            self.assertTrue(np.isnan(fluxList[:, [1, 2, 4]]).all())
+            np.testing.assert_allclose(fluxList[:, [3, 0]], controlFlux[:, [3, 0]],
+                                       rtol=1.0e-10, atol=0.0)
+
+    def testNativeGrids(self):
+        """
+        Test that a BandpassDict created with nativeGrids=True integrates Seds
+        on other grids without resampling them, and gives them the magnitudes
+        of their resampled copies
+        """
+        bpNameList = ['u', 'g', 'r', 'i', 'z']
+        bpList = []
+        for name in bpNameList:
+            bp = Bandpass()
+            bp.readThroughput(os.path.join(self.bandpassDir, 'total_%s.dat' % name))
+            bpList.append(bp)
+        testBpDict = BandpassDict(bpList, bpNameList, nativeGrids=True)
+        resampleBpDict = BandpassDict(bpList, bpNameList)
+
+        sedDir = os.path.join(getPackageDir('sims_photUtils'), 'tests', 'cartoonSedTestData',
+                              'starSed', 'kurucz')
+        sedNameList = sorted(os.listdir(sedDir))
+        for sedName in sedNameList:
+            ss = Sed()
+            ss.readSED_flambda(os.path.join(sedDir, sedName))
+            self.assertTrue(ss._needResample(wavelen_match=testBpDict.wavelenMatch))
+
+            control = Sed(wavelen=ss.wavelen, flambda=ss.flambda)
+            control.resampleSED(wavelen_match=testBpDict.wavelenMatch)
+            control.flambdaTofnu()
+            np.testing.assert_allclose(testBpDict.magListForSed(ss),
+                                       control.manyMagCalc(testBpDict.phiArray, testBpDict.wavelenStep),
+                                       rtol=0.0, atol=1.0e-10)
+            np.testing.assert_allclose(testBpDict.fluxListForSed(ss, indices=[1, 3])[[1, 3]],
+                                       control.manyFluxCalc(testBpDict.phiArray, testBpDict.wavelenStep,
+                                                            observedBandpassInd=[1, 3]),
+                                       rtol=1.0e-10, atol=0.0)
+            # no resampled copy was made
+            self.assertIsNone(ss._resampled)
+
+            # a copy on an equal grid gets the same magnitudes
+            copied = Sed(wavelen=np.copy(ss.wavelen), flambda=np.copy(ss.flambda))
+            np.testing.assert_array_equal(testBpDict.magListForSed(copied), testBpDict.magListForSed(ss))
+
+            # by default, Seds are resampled, and get the same magnitudes to rounding
+            self.assertIsNone(resampleBpDict._nativeGrid(ss))
+            np.testing.assert_allclose(resampleBpDict.magListForSed(ss), testBpDict.magListForSed(ss),
+                                       rtol=0.0, atol=1.0e-10)
+            self.assertIsNotNone(ss._resampled)
+
+        testSedList = SedList([name.replace('.gz', '') for name in sedNameList],
+                              [20.0]*len(sedNameList), specMap=None, fileDir=sedDir)
+        magList = testBpDict.magListForSedList(testSedList)
+        for sedObj, mags in zip(testSedList, magList):
+            control = Sed(wavelen=sedObj.wavelen, flambda=sedObj.flambda)
+            control.resampleSED(wavelen_match=testBpDict.wavelenMatch)
+            control.flambdaTofnu()
+            np.testing.assert_allclose(mags, control.manyMagCalc(testBpDict.phiArray, testBpDict.wavelenStep),
+                                       rtol=0.0, atol=1.0e-10)
+            self.assertIsNone(sedObj._resampled)
+
+        # an Sed which does not cover the grid of the bandpasses gets NaN in
+        # every bandpass, as it would if it were resampled, even though the
+        # second of these top hats lies within it
+        wavelen = np.arange(300.0, 1100.0, 1.0)
+        hatList = []
+        for wmin, wmax in ((400.0, 450.0), (600.0, 700.0), (850.0, 950.0)):
+            sb = np.where(np.logical_and(wavelen >= wmin, wavelen <= wmax), 1.0, 0.0)
+            hatList.append(Bandpass(wavelen=wavelen, sb=sb))
+        hatNames = ['below', 'within', 'straddling']
+        hatBpDict = BandpassDict(hatList, hatNames, nativeGrids=True)
+        narrowWavelen = np.arange(500.0, 900.0, 0.7)
+        narrow = Sed(wavelen=narrowWavelen, flambda=np.ones(len(narrowWavelen)))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            fluxList = hatBpDict.fluxListForSed(narrow)
+            controlFlux = BandpassDict(hatList, hatNames).fluxListForSed(narrow)
+        self.assertTrue(np.isnan(fluxList).all())
+        self.assertTrue(np.isnan(controlFlux).all())
+
+    def testRedshiftedSed(self):
+        """
+        Test that magListForRedshiftedSed and fluxListForRedshiftedSed give the
+        magnitudes and fluxes of redshifted copies of an Sed
+        """
+        bpNameList = ['u', 'g', 'r', 'i', 'z']
+        bpList = []
+        for name in bpNameList:
+            bp = Bandpass()
+            bp.readThroughput(os.path.join(self.bandpassDir, 'total_%s.dat' % name))
+            bpList.append(bp)
+        testBpDict = BandpassDict(bpList, bpNameList)
+
+        sedName = sorted(self.sedPossibilities)[0]
+        ss = Sed()
+        ss.readSED_flambda(os.path.join(self.sedDir, sedName))
+        flambda = np.copy(ss.flambda)
+        redshifts = np.array([0.0, 0.37, 1.5, -0.01, 0.37])
+
+        for dimming in (False, True):
+            magArray = testBpDict.magListForRedshiftedSed(ss, redshifts, dimming=dimming)
+            fluxArray = testBpDict.fluxListForRedshiftedSed(ss, redshifts, dimming=dimming,
+                                                            indices=[1, 3])
+            self.assertEqual(magArray.shape, (len(redshifts), len(bpNameList)))
+            for redshift, mags, fluxes in zip(redshifts, magArray, fluxArray):
+                control = Sed(wavelen=ss.wavelen, flambda=ss.flambda)
+                control.redshiftSED(redshift, dimming=dimming)
+                np.testing.assert_allclose(mags, testBpDict.magListForSed(control),
+                                           rtol=0.0, atol=1.0e-10)
+                np.testing.assert_allclose(fluxes[[1, 3]],
+                                           testBpDict.fluxListForSed(control)[[1, 3]],
+                                           rtol=1.0e-10, atol=0.0)
+                self.assertTrue(np.isnan(fluxes[[0, 2, 4]]).all())
+
+        # the Sed was not changed, and the weights were kept once per redshift
+        np.testing.assert_array_equal(ss.flambda, flambda)
+        self.assertEqual(len(testBpDict._restFrameResamplers), len(set(redshifts)))
+
     def testIndicesOnFlux(self):
         """
         Test that, when you pass a list of indices into the calcFluxList
@@ -743,6 +979,190 @@ class BandpassDictTest(unittest.TestCase):
                                                  control.wavelen, 19)
             np.testing.assert_array_almost_equal(test.sb, control.sb, 19)
 
+    def testBandpassCache(self):
+        """
+        Test that loadBandpassesFromFiles and loadTotalBandpassesFromFiles give
+        the same BandpassDicts when they read them from a cache, and that the
+        cache is not used once a throughput file changes
+        """
+        fileDir = os.path.join(getPackageDir('sims_photUtils'), 'tests', 'cartoonSedTestData')
+        bandpassNames = ['g', 'z', 'i']
+        bandpassRoot = 'test_bandpass_'
+        scratchDir = tempfile.mkdtemp(dir=os.path.join(getPackageDir('sims_photUtils'),
+                                                       'tests', 'scratchSpace'))
+        try:
+            bandpassDir = os.path.join(scratchDir, 'bandpasses')
+            cacheDir = os.path.join(scratchDir, 'cache')
+            os.mkdir(bandpassDir)
+            for name in bandpassNames:
+                shutil.copy(os.path.join(fileDir, bandpassRoot + name + '.dat'), bandpassDir)
+            shutil.copy(os.path.join(fileDir, 'toy_mirror.dat'), bandpassDir)
+            atmo = os.path.join(fileDir, 'toy_atmo.dat')
+
+            control = BandpassDict.loadTotalBandpassesFromFiles(bandpassNames=bandpassNames,
+                                                                bandpassDir=bandpassDir,
+                                                                bandpassRoot=bandpassRoot)
+            controlTotal, controlHardware = BandpassDict.loadBandpassesFromFiles(
+                bandpassNames=bandpassNames, filedir=bandpassDir, bandpassRoot=bandpassRoot,
+                componentList=['toy_mirror.dat'], atmoTransmission=atmo)
+
+            for ix in range(2):
+                # the first pass writes the cache, the second reads it
+                testDict = BandpassDict.loadTotalBandpassesFromFiles(bandpassNames=bandpassNames,
+                                                                     bandpassDir=bandpassDir,
+                                                                     bandpassRoot=bandpassRoot,
+                                                                     cacheDir=cacheDir)
+                testTotal, testHardware = BandpassDict.loadBandpassesFromFiles(
+                    bandpassNames=bandpassNames, filedir=bandpassDir, bandpassRoot=bandpassRoot,
+                    componentList=['toy_mirror.dat'], atmoTransmission=atmo, cacheDir=cacheDir)
+                self.assertEqual(len(os.listdir(cacheDir)), 2)
+
+                for test, ctrl in ((testDict, control), (testTotal, controlTotal),
+                                   (testHardware, controlHardware)):
+                    self.assertEqual(test.keys(), ctrl.keys())
+                    np.testing.assert_array_equal(test.wavelenMatch, ctrl.wavelenMatch)
+                    self.assertEqual(test.wavelenStep, ctrl.wavelenStep)
+                    np.testing.assert_array_equal(test.phiArray, ctrl.phiArray)
+                    for name in bandpassNames:
+                        np.testing.assert_array_equal(test[name].sb, ctrl[name].sb)
+                        self.assertEqual(test[name].bandpassname, ctrl[name].bandpassname)
+
+            # changing a throughput file changes the cache file
+            fileName = os.path.join(bandpassDir, bandpassRoot + 'z.dat')
+            wavelen, sb = np.genfromtxt(fileName, usecols=(0, 1)).T
+            np.savetxt(fileName, np.array([wavelen, 0.5*sb]).T)
+            testDict = BandpassDict.loadTotalBandpassesFromFiles(bandpassNames=bandpassNames,
+                                                                 bandpassDir=bandpassDir,
+                                                                 bandpassRoot=bandpassRoot,
+                                                                 cacheDir=cacheDir)
+            self.assertEqual(len(os.listdir(cacheDir)), 3)
+            np.testing.assert_allclose(testDict['z'].sb, 0.5*control['z'].sb, rtol=1.0e-10, atol=0.0)
+            np.testing.assert_array_equal(testDict['g'].sb, control['g'].sb)
+        finally:
+            shutil.rmtree(scratchDir)
+
+    def testDustMagTable(self):
+        """
+        Test that the changes in magnitude interpolated in a DustMagTable
+        agree with applying dust to the Sed, to within the error reported by
+        the table
+        """
+        nameList, bpList = self.getListOfBandpasses(5)
+        testDict = BandpassDict(bpList, nameList)
+        sedName = self.getListOfSedNames(1)[0]
+        sedObj = Sed()
+        sedObj.readSED_flambda(os.path.join(self.sedDir, sedName))
+        controlMags = np.array(testDict.magListForSed(sedObj))
+
+        rvGrid = np.arange(2.5, 4.6, 0.25)
+        table = testDict.dustMagTableForSed(sedObj, rvGrid=rvGrid)
+        self.assertEqual(table.deltaMag.shape, (len(rvGrid), 101, len(nameList)))
+        self.assertIs(table, testDict.dustMagTableForSed(sedObj, rvGrid=rvGrid))
+        # any Sed with the same contents shares the table
+        sedCopy = Sed(wavelen=sedObj.wavelen, flambda=sedObj.flambda)
+        self.assertIs(table, testDict.dustMagTableForSed(sedCopy, rvGrid=rvGrid))
+        # as do differently normalized copies (the change in magnitude does not
+        # depend on the normalization)
+        for magNorm in (18.3, 24.1):
+            sedCopy = Sed(wavelen=sedObj.wavelen, flambda=sedObj.flambda)
+            sedCopy.multiplyFluxNorm(sedCopy.calcFluxNorm(magNorm, bpList[0]))
+            self.assertIs(table, testDict.dustMagTableForSed(sedCopy, rvGrid=rvGrid))
+        self.assertIsNot(table, testDict.dustMagTableForSed(sedObj))
+
+        avList = self.rng.random_sample(20)*3.0
+        rvList = 2.5 + self.rng.random_sample(20)*2.0
+        avList[0] = 0.0
+        rvList[0] = 3.1
+        deltaMag = testDict.dustMagListForSed(sedObj, avList, rvList, rvGrid=rvGrid)
+        self.assertEqual(deltaMag.shape, (len(avList), len(nameList)))
+        for av, rv, dm in zip(avList, rvList, deltaMag):
+            dustySed = Sed(wavelen=sedObj.wavelen, flambda=sedObj.flambda)
+            dustySed.resampleSED(wavelen_match=testDict.wavelenMatch)
+            a_x, b_x = dustySed.setupCCMab()
+            dustySed.addCCMDust(a_x, b_x, A_v=av, R_v=rv)
+            error = np.abs(np.array(testDict.magListForSed(dustySed)) - controlMags - dm)
+            np.testing.assert_array_less(error, table.maxError + 1.0e-10)
+
+        # at the nodes of the grid the table is exact
+        dustySed = Sed(wavelen=sedObj.wavelen, flambda=sedObj.flambda)
+        dustySed.resampleSED(wavelen_match=testDict.wavelenMatch)
+        a_x, b_x = dustySed.setupCCMab()
+        dustySed.addCCMDust(a_x, b_x, A_v=1.0)
+        np.testing.assert_allclose(testDict.dustMagListForSed(sedObj, 1.0)[0],
+                                   np.array(testDict.magListForSed(dustySed)) - controlMags,
+                                   rtol=0.0, atol=1.0e-10)
+
+        with self.assertRaises(ValueError):
+            testDict.dustMagListForSed(sedObj, 11.0)
+        with self.assertRaises(ValueError):
+            testDict.dustMagListForSed(sedObj, 1.0, R_v=2.5)
+        with self.assertRaises(ValueError):
+            testDict.dustMagListForSed(sedObj, 1.0, R_v=5.0, rvGrid=rvGrid)
+
+    def testRedshiftFluxTable(self):
+        """
+        Test that the fluxes and magnitudes interpolated in a RedshiftFluxTable
+        agree with normalizing, redshifting and integrating the Seds, to within
+        the error reported by the table, and that tables can be written and read
+        """
+        nameList, bpList = self.getListOfBandpasses(5)
+        testDict = BandpassDict(bpList, nameList)
+        sedNameList = sorted(self.sedPossibilities)[:3]
+        sedList = []
+        for sedName in sedNameList:
+            sedObj = Sed()
+            sedObj.readSED_flambda(os.path.join(self.sedDir, sedName))
+            sedList.append(sedObj)
+
+        zGrid = np.arange(0.0, 2.01, 0.05)
+        table = testDict.redshiftFluxTableForSedList(sedList, zGrid=zGrid)
+        self.assertEqual(table.flux.shape, (len(sedList), len(zGrid), len(nameList)))
+        self.assertEqual(table.maxError.shape, (len(sedList), len(nameList)))
+        self.assertEqual(table.sedNames, [sedObj.name for sedObj in sedList])
+        self.assertEqual(table.bandpassNames, nameList)
+
+        # at the nodes of the grid the table is exact
+        for ix, sedObj in enumerate(sedList):
+            np.testing.assert_allclose(table.fluxArray(ix, zGrid),
+                                       testDict.fluxListForRedshiftedSed(sedObj, zGrid, dimming=True),
+                                       rtol=1.0e-10, atol=0.0)
+
+        nObj = 20
+        templateIndex = self.rng.randint(0, len(sedList), nObj)
+        redshifts = self.rng.random_sample(nObj)*2.0
+        magNorms = 20.0 + self.rng.random_sample(nObj)*5.0
+        magArray = table.magArray(templateIndex, redshifts, magNorm=magNorms)
+        self.assertEqual(magArray.shape, (nObj, len(nameList)))
+        for ix, redshift, magNorm, mags in zip(templateIndex, redshifts, magNorms, magArray):
+            control = Sed(wavelen=sedList[ix].wavelen, flambda=sedList[ix].flambda)
+            control.multiplyFluxNorm(getImsimFluxNorm(control, magNorm))
+            control.redshiftSED(redshift, dimming=True)
+            error = np.abs(np.array(testDict.magListForSed(control)) - mags)
+            np.testing.assert_array_less(error, table.maxError[ix] + 1.0e-10)
+
+        with self.assertRaises(ValueError):
+            table.fluxArray(0, 2.5)
+
+        scratchDir = tempfile.mkdtemp(dir=os.path.join(getPackageDir('sims_photUtils'),
+                                                       'tests', 'scratchSpace'))
+        try:
+            fileName = os.path.join(scratchDir, 'redshiftFluxTable.npz')
+            table.writeToFile(fileName)
+            loaded = testDict.loadRedshiftFluxTable(fileName)
+            np.testing.assert_array_equal(loaded.fluxArray(templateIndex, redshifts, magNorm=magNorms),
+                                          table.fluxArray(templateIndex, redshifts, magNorm=magNorms))
+            np.testing.assert_array_equal(loaded.maxError, table.maxError)
+            self.assertEqual(loaded.sedNames, table.sedNames)
+            self.assertTrue(loaded.dimming)
+
+            # a table cannot be loaded for other bandpasses
+            otherDict = BandpassDict(bpList[:-1], nameList[:-1])
+            with self.assertRaises(ValueError):
+                otherDict.loadRedshiftFluxTable(fileName)
+            self.assertIsInstance(RedshiftFluxTable.readFromFile(fileName), RedshiftFluxTable)
+        finally:
+            shutil.rmtree(scratchDir)
+
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
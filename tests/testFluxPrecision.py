@@ -0,0 +1,183 @@
+from __future__ import with_statement
+from builtins import zip
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import lsst.utils.tests
+from lsst.utils import getPackageDir
+
+from lsst.sims.photUtils import Bandpass, BandpassDict, Sed, SedBatch, SedList
+from lsst.sims.photUtils import set_flux_dtype, get_flux_dtype, cache_resampled_seds
+from lsst.sims.photUtils.Sed import _global_resampled_sed_caches
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class FluxPrecisionTest(unittest.TestCase):
+    """
+    Test that storing flux densities and phi arrays as float32 changes
+    magnitudes by much less than a millimagnitude relative to float64
+    """
+
+    # the largest change in magnitude allowed by these tests
+    magTolerance = 1.0e-5
+
+    def setUp(self):
+        self.rng = np.random.RandomState(6512)
+        data_dir = os.path.join(getPackageDir('sims_photUtils'), 'tests', 'cartoonSedTestData')
+        self.sedDir = os.path.join(data_dir, 'galaxySed')
+        self.sedNames = sorted(os.listdir(self.sedDir))
+        self.sedList = []
+        for file_name in self.sedNames:
+            ss = Sed()
+            ss.readSED_flambda(os.path.join(self.sedDir, file_name))
+            self.sedList.append(ss)
+
+        self.bpNameList = ['u', 'g', 'r', 'i', 'z']
+        self.bpList = []
+        for name in self.bpNameList:
+            bp = Bandpass()
+            bp.readThroughput(os.path.join(data_dir, 'test_bandpass_%s.dat' % name))
+            self.bpList.append(bp)
+
+        self.addCleanup(set_flux_dtype, get_flux_dtype())
+
+    def testDtypeSetting(self):
+        """
+        Test that the global setting is used unless a dtype is given, and that
+        only float32 and float64 are allowed
+        """
+        self.assertEqual(get_flux_dtype(), np.float64)
+        set_flux_dtype(np.float32)
+        self.assertEqual(get_flux_dtype(), np.float32)
+        self.assertEqual(BandpassDict(self.bpList, self.bpNameList).phiArray.dtype, np.float32)
+        self.assertEqual(BandpassDict(self.bpList, self.bpNameList, dtype=np.float64).phiArray.dtype,
+                         np.float64)
+        batch = SedBatch.fromSedList(self.sedList)
+        self.assertEqual(batch.flambda.dtype, np.float32)
+        # arrays assigned to the batch are stored in its dtype
+        batch.flambdaTofnu()
+        self.assertEqual(batch.fnu.dtype, np.float32)
+        batch.multiplyFluxNorm(2.0)
+        self.assertEqual(batch.flambda.dtype, np.float32)
+        self.assertEqual(batch[0].flambda.dtype, np.float64)
+
+        set_flux_dtype(np.float64)
+        self.assertEqual(SedBatch.fromSedList(self.sedList).flambda.dtype, np.float64)
+        self.assertEqual(SedBatch.fromSedList(self.sedList, dtype=np.float32).flambda.dtype,
+                         np.float32)
+
+        with self.assertRaises(ValueError):
+            set_flux_dtype(np.float16)
+        with self.assertRaises(ValueError):
+            SedBatch.fromSedList(self.sedList, dtype=int)
+
+    def testBandpassDict(self):
+        """
+        Test the magnitudes of Seds calculated with a float32 phiArray
+        """
+        control = BandpassDict(self.bpList, self.bpNameList, dtype=np.float64)
+        test = BandpassDict(self.bpList, self.bpNameList, dtype=np.float32)
+        self.assertEqual(test.phiArray.nbytes*2, control.phiArray.nbytes)
+
+        for ss in self.sedList:
+            np.testing.assert_allclose(test.magListForSed(ss), control.magListForSed(ss),
+                                       rtol=0.0, atol=self.magTolerance)
+
+        # a float32 fnu is integrated in float64
+        for ss in self.sedList:
+            resampled = Sed(wavelen=ss.wavelen, flambda=ss.flambda)
+            resampled.resampleSED(wavelen_match=test.wavelenMatch)
+            resampled.flambdaTofnu()
+            resampled.fnu = resampled.fnu.astype(np.float32)
+            mags = resampled.manyMagCalc(test.phiArray, test.wavelenStep)
+            self.assertEqual(mags.dtype, np.float64)
+            np.testing.assert_allclose(mags, control.magListForSed(ss), rtol=0.0, atol=self.magTolerance)
+
+    def testSedBatch(self):
+        """
+        Test the magnitudes of a float32 SedBatch after a series of transformations
+        """
+        control = BandpassDict(self.bpList, self.bpNameList, dtype=np.float64)
+        test = BandpassDict(self.bpList, self.bpNameList, dtype=np.float32)
+        wavelen_match = control.wavelenMatch
+        controlBatch = SedBatch.fromSedList(self.sedList, wavelen_match=wavelen_match, dtype=np.float64)
+        testBatch = SedBatch.fromSedList(self.sedList, wavelen_match=wavelen_match, dtype=np.float32)
+        self.assertEqual(testBatch.flambda.nbytes*2, controlBatch.flambda.nbytes)
+
+        n_sed = len(self.sedList)
+        A_v = self.rng.random_sample(n_sed)*0.5
+        fluxNorm = self.rng.random_sample(n_sed)*1.0e-10 + 1.0e-12
+        redshift = self.rng.random_sample(n_sed)*0.3
+        for batch in (controlBatch, testBatch):
+            a_x, b_x = batch.setupCCMab()
+            batch.addCCMDust(a_x, b_x, A_v=A_v)
+            batch.multiplyFluxNorm(fluxNorm)
+            batch.redshiftSED(redshift, dimming=True)
+        self.assertEqual(testBatch.flambda.dtype, np.float32)
+
+        controlMags = control.magListForSedBatch(controlBatch)
+        for bpDict in (control, test):
+            testMags = bpDict.magListForSedBatch(testBatch)
+            np.testing.assert_array_equal(np.isnan(testMags), np.isnan(controlMags))
+            valid = ~np.isnan(controlMags)
+            np.testing.assert_allclose(testMags[valid], controlMags[valid],
+                                       rtol=0.0, atol=self.magTolerance)
+
+        for bp in self.bpList:
+            np.testing.assert_allclose(testBatch.calcMag(bp), controlBatch.calcMag(bp),
+                                       rtol=0.0, atol=self.magTolerance)
+
+        # fnu stored as float32
+        testBatch.flambdaTofnu()
+        np.testing.assert_allclose(test.magListForSedBatch(testBatch), controlMags,
+                                   rtol=0.0, atol=self.magTolerance)
+
+    def testResampledCache(self):
+        """
+        Test the magnitudes of SEDs taken from a float32 cache of resampled SEDs
+        """
+        scratch_dir = tempfile.mkdtemp(dir=os.path.join(getPackageDir('sims_photUtils'),
+                                                        'tests', 'scratchSpace'))
+        sedRoot = os.path.dirname(self.sedDir)
+        bpDict = BandpassDict(self.bpList, self.bpNameList, dtype=np.float32)
+        wavelen_match = bpDict.wavelenMatch
+        nSed = 10
+        sedNameList = [self.sedNames[ii] for ii in self.rng.randint(0, len(self.sedNames), nSed)]
+        magNormList = self.rng.random_sample(nSed)*5.0 + 15.0
+        try:
+            controlMags = bpDict.magListForSedList(SedList(sedNameList, magNormList, specMap=None,
+                                                           fileDir=self.sedDir,
+                                                           wavelenMatch=wavelen_match))
+
+            cache_resampled_seds(wavelen_match, sed_dir=sedRoot, sub_dir_list=['galaxySed'],
+                                 cache_dir=scratch_dir, dtype=np.float32)
+            self.assertTrue(any(name.endswith('float32_flambda.npy') for name in os.listdir(scratch_dir)))
+            testList = SedList(sedNameList, magNormList, specMap=None,
+                               fileDir=self.sedDir, wavelenMatch=wavelen_match)
+            self.assertEqual(testList[0].flambda.dtype, np.float32)
+            testMags = bpDict.magListForSedList(testList)
+            np.testing.assert_allclose(testMags, controlMags, rtol=0.0, atol=self.magTolerance)
+
+            for ss in self.sedList:
+                _global_resampled_sed_caches.clear()
+                controlMags = bpDict.magListForSed(ss)
+                cache_resampled_seds(wavelen_match, sed_dir=sedRoot, sub_dir_list=['galaxySed'],
+                                     cache_dir=scratch_dir, dtype=np.float32)
+                np.testing.assert_allclose(bpDict.magListForSed(ss), controlMags,
+                                           rtol=0.0, atol=self.magTolerance)
+        finally:
+            _global_resampled_sed_caches.clear()
+            shutil.rmtree(scratch_dir)
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
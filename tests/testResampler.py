@@ -0,0 +1,143 @@
+from __future__ import with_statement
+import unittest
+import warnings
+import numpy as np
+import lsst.utils.tests
+
+from lsst.sims.photUtils import Resampler, get_resampler, Sed, Bandpass, SedBatch
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class ResamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(441)
+        self.wavelen = np.sort(self.rng.random_sample(500)*1000.0 + 200.0)
+        self.flux = self.rng.random_sample(500)
+
+    def testAgainstInterp(self):
+        """
+        Test that a Resampler reproduces numpy.interp exactly
+        """
+        wavelen_match = np.arange(self.wavelen[0], self.wavelen[-1], 0.37)
+        wavelen_match = np.append(wavelen_match, self.wavelen[[0, 10, 11, -1]])
+        resampler = Resampler(self.wavelen, wavelen_match)
+        np.testing.assert_array_equal(resampler.resample(self.flux),
+                                      np.interp(wavelen_match, self.wavelen, self.flux))
+
+        # a stack of fluxes is resampled row by row
+        fluxStack = self.rng.random_sample((4, len(self.wavelen)))
+        resampled = resampler.resample(fluxStack)
+        self.assertEqual(resampled.shape, (4, len(wavelen_match)))
+        for flux, row in zip(fluxStack, resampled):
+            np.testing.assert_array_equal(row, np.interp(wavelen_match, self.wavelen, flux))
+
+        with self.assertRaises(ValueError):
+            resampler.resample(self.flux[1:])
+
+    def testFillValue(self):
+        """
+        Test that points outside of the source grid take the fill value
+        """
+        wavelen_match = np.arange(100.0, 1500.0, 1.0)
+        outside = np.logical_or(wavelen_match < self.wavelen[0], wavelen_match > self.wavelen[-1])
+        control = np.interp(wavelen_match, self.wavelen, self.flux)
+
+        resampled = Resampler(self.wavelen, wavelen_match).resample(self.flux)
+        self.assertTrue(np.isnan(resampled[outside]).all())
+        np.testing.assert_array_equal(resampled[~outside], control[~outside])
+
+        resampled = Resampler(self.wavelen, wavelen_match, fill_value=0.0).resample(self.flux)
+        np.testing.assert_array_equal(resampled[outside], 0.0)
+        np.testing.assert_array_equal(resampled[~outside], control[~outside])
+
+    def testUnsorted(self):
+        """
+        Test that the source grid need not be sorted
+        """
+        wavelen_match = np.arange(300.0, 1100.0, 0.5)
+        order = self.rng.permutation(len(self.wavelen))
+        resampled = Resampler(self.wavelen[order], wavelen_match).resample(self.flux[order])
+        np.testing.assert_array_equal(resampled, np.interp(wavelen_match, self.wavelen, self.flux))
+
+    def testFold(self):
+        """
+        Test that weights folded onto the source grid give the same integrals
+        as the resampled fluxes
+        """
+        wavelen_match = np.arange(100.0, 1500.0, 0.5)
+        wavelen_match = np.append(wavelen_match, self.wavelen[[0, 10, -1]])
+        inside = np.logical_and(wavelen_match >= self.wavelen[0], wavelen_match <= self.wavelen[-1])
+        weights = self.rng.random_sample((3, len(wavelen_match)))
+        fluxStack = self.rng.random_sample((4, len(self.wavelen)))
+
+        order = self.rng.permutation(len(self.wavelen))
+        for resampler, fluxes in ((Resampler(self.wavelen, wavelen_match), fluxStack),
+                                  (Resampler(self.wavelen[order], wavelen_match), fluxStack[:, order])):
+            folded = resampler.fold(weights)
+            self.assertEqual(folded.shape, (3, len(self.wavelen)))
+            control = np.dot(resampler.resample(fluxes)[:, inside], weights[:, inside].T)
+            np.testing.assert_allclose(np.dot(fluxes, folded.T), control, rtol=1.0e-12, atol=0.0)
+
+        with self.assertRaises(ValueError):
+            resampler.fold(weights[:, 1:])
+
+    def testCache(self):
+        """
+        Test that get_resampler returns the same Resampler for equal grids
+        """
+        wavelen_match = np.arange(300.0, 1100.0, 0.5)
+        resampler = get_resampler(self.wavelen, wavelen_match)
+        self.assertIs(resampler, get_resampler(np.copy(self.wavelen), np.copy(wavelen_match)))
+        self.assertIsNot(resampler, get_resampler(self.wavelen, wavelen_match, fill_value=0.0))
+
+        # grids with the same length and end points are told apart
+        shifted = np.copy(self.wavelen)
+        shifted[5] = 0.5*(shifted[4] + shifted[5])
+        self.assertIsNot(resampler, get_resampler(shifted, wavelen_match))
+        np.testing.assert_array_equal(get_resampler(shifted, wavelen_match).resample(self.flux),
+                                      np.interp(wavelen_match, shifted, self.flux))
+
+        # the grids held by a Resampler cannot be changed
+        with self.assertRaises(ValueError):
+            resampler.wavelen_match[0] = 2.0
+
+    def testResampleMethods(self):
+        """
+        Test that Sed.resampleSED, Bandpass.resampleBandpass and SedBatch.resampleSED
+        give the interpolated values
+        """
+        wavelen_match = np.arange(100.0, 1500.0, 0.5)
+        inside = np.logical_and(wavelen_match >= self.wavelen[0], wavelen_match <= self.wavelen[-1])
+        control = np.interp(wavelen_match, self.wavelen, self.flux)
+
+        ss = Sed(wavelen=self.wavelen, flambda=self.flux)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            ss.resampleSED(wavelen_match=wavelen_match)
+        np.testing.assert_array_equal(ss.wavelen, wavelen_match)
+        self.assertTrue(np.isnan(ss.flambda[~inside]).all())
+        np.testing.assert_array_equal(ss.flambda[inside], control[inside])
+
+        bp = Bandpass()
+        wavelen, sb = bp.resampleBandpass(wavelen=self.wavelen, sb=self.flux, wavelen_min=100.0,
+                                          wavelen_max=1499.5, wavelen_step=0.5)
+        np.testing.assert_array_equal(wavelen, wavelen_match)
+        np.testing.assert_array_equal(sb[~inside], 0.0)
+        np.testing.assert_array_equal(sb[inside], control[inside])
+
+        batch = SedBatch(self.wavelen, flambda=np.array([self.flux, 2.0*self.flux]))
+        batch.resampleSED(wavelen_match)
+        np.testing.assert_array_equal(batch.flambda[0], ss.flambda)
+        np.testing.assert_array_equal(batch.flambda[1][inside], 2.0*control[inside])
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
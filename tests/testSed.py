@@ -8,18 +8,46 @@ import warnings
 import unittest
 import gzip
 import os
+import sys
+import gc
+import shutil
+import tempfile
+import importlib
+import multiprocessing
+from io import StringIO
 
 import lsst.utils.tests
 from lsst.utils import getPackageDir
 import lsst.sims.photUtils.Sed as Sed
 import lsst.sims.photUtils.Bandpass as Bandpass
-from lsst.sims.photUtils import PhotometricParameters
+from lsst.sims.photUtils import BandpassDict
+from lsst.sims.photUtils.Sed import _write_sed_cache, _load_sed_cache, _sed_cache_index_name
+from lsst.sims.photUtils.Sed import _read_sed_cache_index, _sed_library_changed
+from lsst.sims.photUtils.Sed import _sed_library_files_changed
+from lsst.sims.photUtils.Sed import _generate_sed_cache
+from lsst.sims.photUtils.WavelenGrids import _is_interned, _global_wavelen_grids
+from lsst.sims.photUtils.WavelenGrids import wavelen_grid_fingerprint
+from lsst.sims.photUtils import SedCacheError
+from lsst.sims.photUtils import PhotometricParameters, get_misc_sed_cache, get_ccm_ab_cache
+from lsst.sims.photUtils import publish_LSST_sed_cache, attach_LSST_sed_cache
+from lsst.sims.photUtils import release_LSST_sed_cache
 
 
 def setup_module(module):
     lsst.utils.tests.init()
 
 
+def _read_shared_sed(file_name):
+    """
+    Read an SED in a worker process attached to a shared cache of SEDs
+    """
+    sed_module = importlib.import_module('lsst.sims.photUtils.Sed')
+    ss = Sed()
+    ss.readSED_flambda(file_name)
+    return (file_name in sed_module._global_lsst_sed_cache,
+            ss.flambda.flags.writeable, ss.wavelen.sum(), ss.flambda.sum())
+
+
 class TestSedWavelenLimits(unittest.TestCase):
     def setUp(self):
         warnings.simplefilter('always')
@@ -230,7 +258,11 @@ class SedBasicFunctionsTestCase(unittest.TestCase):
         ss1.readSED_flambda(full_name)
         ss2 = Sed()
         ss2.readSED_flambda(full_name)
-        ss2.flambda *= 2.0
+        # the arrays are read-only views of the cache
+        with self.assertRaises(ValueError):
+            ss2.flambda *= 2.0
+        ss2.multiplyFluxNorm(2.0)
+        ss2.redshiftSED(0.1)
         ss3 = Sed()
         ss3.readSED_flambda(full_name)
         msg = "Changes to SED made it into the cache"
@@ -238,6 +270,563 @@ class SedBasicFunctionsTestCase(unittest.TestCase):
         self.assertNotEqual(ss1, ss2, msg=msg)
         self.assertNotEqual(ss2, ss3, msg=msg)
 
+        # test that SEDs read from the cache share its memory
+        self.assertTrue(np.shares_memory(ss1.flambda, ss3.flambda))
+        self.assertTrue(np.shares_memory(ss1.wavelen, ss3.wavelen))
+        self.assertFalse(np.shares_memory(ss1.flambda, ss2.flambda))
+
+    def test_misc_cache_lru(self):
+        """
+        Test that the cache of SEDs read from ASCII files stays within its
+        byte budget, evicting the least recently used SEDs first
+        """
+        sed_dir = os.path.join(getPackageDir("sims_photUtils"),
+                               "tests", "cartoonSedTestData", "galaxySed")
+        name_list = [os.path.join(sed_dir, file_name)
+                     for file_name in sorted(os.listdir(sed_dir))]
+
+        cache = get_misc_sed_cache()
+        old_max_bytes = cache.maxBytes
+        cache.clear()
+
+        ss = Sed()
+        ss.readSED_flambda(name_list[0])
+        sed_bytes = ss.wavelen.nbytes + ss.flambda.nbytes
+        cache.maxBytes = 2*sed_bytes
+        self.assertEqual(cache.nBytes, sed_bytes)
+
+        ss.readSED_flambda(name_list[1])
+        ss.readSED_flambda(name_list[0])
+        evictions = cache.evictions
+        ss.readSED_flambda(name_list[2])
+        self.assertEqual(cache.evictions, evictions+1)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.nBytes, cache.maxBytes)
+        # name_list[1] was the least recently used SED, so it was evicted
+        self.assertIn(name_list[0].replace('.gz', ''), cache)
+        self.assertNotIn(name_list[1].replace('.gz', ''), cache)
+        self.assertIn(name_list[2].replace('.gz', ''), cache)
+
+        hits = cache.hits
+        ss.readSED_flambda(name_list[2])
+        self.assertEqual(cache.hits, hits+1)
+        misses = cache.misses
+        ss.readSED_flambda(name_list[1])
+        self.assertEqual(cache.misses, misses+1)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.nBytes, 0)
+        cache.maxBytes = old_max_bytes
+
+    def test_ccm_ab_memo(self):
+        """
+        Test that setupCCMab memoizes a_x, b_x for each wavelength grid
+        """
+        ccm_cache = get_ccm_ab_cache()
+        ccm_cache.clear()
+        wavelen = np.arange(200.0, 1200.0, 0.5)
+        ss = Sed(wavelen=wavelen, flambda=np.ones(len(wavelen)))
+        a_x, b_x = ss.setupCCMab()
+        self.assertEqual(len(ccm_cache), 1)
+
+        # an equal grid in a different array finds the same coefficients
+        a_x2, b_x2 = Sed().setupCCMab(wavelen=np.copy(wavelen))
+        self.assertIs(a_x2, a_x)
+        self.assertIs(b_x2, b_x)
+        self.assertEqual(len(ccm_cache), 1)
+        with self.assertRaises(ValueError):
+            a_x[0] = 1.0
+
+        a_x3, b_x3 = Sed().setupCCMab(wavelen=wavelen[:-1])
+        self.assertEqual(len(ccm_cache), 2)
+        np.testing.assert_array_equal(a_x3, a_x[:-1])
+        np.testing.assert_array_equal(b_x3, b_x[:-1])
+
+        # the memoized coefficients still give the same dust
+        ss.addCCMDust(a_x, b_x, A_v=0.3)
+        ccm_cache.clear()
+        control = Sed(wavelen=wavelen, flambda=np.ones(len(wavelen)))
+        control.addCCMDust(*control.setupCCMab(), A_v=0.3)
+        np.testing.assert_array_equal(ss.flambda, control.flambda)
+
+    def test_in_place(self):
+        """
+        Test that the in_place mode of the transformation methods gives exactly
+        the results of the default mode, and reuses the memory of the Sed
+        """
+        rng = np.random.RandomState(8812)
+        wavelen = np.arange(300.0, 1200.0, 0.5)
+        a_x, b_x = Sed().setupCCMab(wavelen=wavelen)
+        ss = Sed()
+        for ix in range(3):
+            flambda = rng.random_sample(len(wavelen))*1.0e-15
+            control = Sed(wavelen=wavelen, flambda=flambda)
+            control.addCCMDust(a_x, b_x, A_v=0.4, R_v=3.4)
+            control.multiplyFluxNorm(2.5e-11)
+            control.redshiftSED(0.3, dimming=True)
+            control.flambdaTofnu()
+
+            ss.setSED(wavelen, flambda=flambda, in_place=True)
+            if ix == 0:
+                buffers = (ss.wavelen, ss.flambda)
+            ss.addCCMDust(a_x, b_x, A_v=0.4, R_v=3.4, in_place=True)
+            ss.multiplyFluxNorm(2.5e-11, in_place=True)
+            ss.redshiftSED(0.3, dimming=True, in_place=True)
+            ss.flambdaTofnu(in_place=True)
+            if ix == 1:
+                fnuBuffer = ss.fnu
+
+            np.testing.assert_array_equal(ss.wavelen, control.wavelen)
+            np.testing.assert_array_equal(ss.flambda, control.flambda)
+            np.testing.assert_array_equal(ss.fnu, control.fnu)
+            self.assertIs(ss.wavelen, buffers[0])
+            self.assertIs(ss.flambda, buffers[1])
+        self.assertIs(ss.fnu, fnuBuffer)
+
+        # passed arrays are overwritten and returned
+        fnu = np.copy(control.fnu)
+        flambda_control = Sed().fnuToflambda(wavelen=control.wavelen, fnu=fnu)[1]
+        wav, flambda = Sed().fnuToflambda(wavelen=control.wavelen, fnu=fnu, in_place=True)
+        self.assertIs(flambda, fnu)
+        np.testing.assert_array_equal(flambda, flambda_control)
+
+        # read-only arrays (e.g. those of cached SEDs) are copied, not changed
+        wavelen_ro = np.copy(wavelen)
+        flambda_ro = np.ones(len(wavelen))
+        wavelen_ro.flags.writeable = False
+        flambda_ro.flags.writeable = False
+        ss = Sed()
+        ss.wavelen = wavelen_ro
+        ss.flambda = flambda_ro
+        ss.redshiftSED(0.5, dimming=True, in_place=True)
+        ss.addCCMDust(np.zeros(len(wavelen)), np.zeros(len(wavelen)), A_v=1.0, in_place=True)
+        ss.multiplyFluxNorm(3.0, in_place=True)
+        np.testing.assert_array_equal(wavelen_ro, wavelen)
+        np.testing.assert_array_equal(flambda_ro, 1.0)
+        np.testing.assert_array_equal(ss.wavelen, wavelen*1.5)
+        np.testing.assert_allclose(ss.flambda, 3.0/1.5, rtol=1.0e-12)
+
+    def test_flux_sync(self):
+        """
+        Test that whichever of flambda and fnu was set last is used, and that
+        the other is only calculated (once) when needed
+        """
+        rng = np.random.RandomState(5521)
+        wavelen = np.arange(200.0, 1400.0, 0.5)
+        flambda = rng.random_sample(len(wavelen))*1.0e-15
+        control = Sed(wavelen=wavelen, flambda=flambda)
+        control.flambdaTofnu()
+
+        ss = Sed(wavelen=wavelen, fnu=control.fnu)
+        self.assertIsNone(ss._flambda)
+        np.testing.assert_array_equal(ss.flambda, control.fnuToflambda(wavelen, control.fnu)[1])
+        self.assertIs(ss.flambda, ss._flambda)
+
+        # setting flambda makes fnu out of date, and vice versa
+        ss.flambda = flambda
+        self.assertIsNone(ss._fnu)
+        np.testing.assert_array_equal(ss.fnu, control.fnu)
+        self.assertIs(ss.fnu, ss._fnu)
+        ss.fnu = 2.0*control.fnu
+        self.assertIsNone(ss._flambda)
+        np.testing.assert_allclose(ss.flambda, 2.0*flambda, rtol=1.0e-12)
+
+        # multiplyFluxNorm leaves flambda to be calculated when needed
+        ss = Sed(wavelen=wavelen, flambda=flambda)
+        ss.multiplyFluxNorm(3.0)
+        self.assertIsNotNone(ss.fnu)
+        self.assertIsNone(ss._flambda)
+        np.testing.assert_allclose(ss.flambda, 3.0*flambda, rtol=1.0e-12)
+
+        # BandpassDicts on the same grid share one resampled copy of a Sed
+        bpList = []
+        for center in (400.0, 600.0, 800.0):
+            sb = np.where(np.abs(wavelen-center) < 50.0, 1.0, 0.0)
+            bpList.append(Bandpass(wavelen=wavelen, sb=sb, wavelen_min=300.0, wavelen_max=1200.0))
+        bpDict1 = BandpassDict(bpList, ['a', 'b', 'c'])
+        bpDict2 = BandpassDict(bpList[:2], ['a', 'b'])
+
+        ss = Sed(wavelen=wavelen, flambda=flambda)
+        mags = bpDict1.magListForSed(ss)
+        resampled = bpDict1._resampledSed(ss)
+        self.assertIsNotNone(resampled.fnu)
+        np.testing.assert_array_equal(bpDict2.magListForSed(ss), mags[:2])
+        self.assertIs(bpDict2._resampledSed(ss), resampled)
+        with self.assertRaises(ValueError):
+            resampled.fnu[0] = 1.0
+
+        # changing the Sed (through its setters or the in_place methods) discards the copy
+        ss.multiplyFluxNorm(10.0)
+        self.assertIsNot(bpDict1._resampledSed(ss), resampled)
+        np.testing.assert_allclose(bpDict1.magListForSed(ss), mags-2.5, rtol=0.0, atol=1.0e-10)
+        ss.flambda *= 0.1
+        np.testing.assert_allclose(bpDict1.magListForSed(ss), mags, rtol=0.0, atol=1.0e-10)
+        a_x, b_x = ss.setupCCMab()
+        resampled = bpDict1._resampledSed(ss)
+        ss.addCCMDust(a_x, b_x, A_v=0.5, in_place=True)
+        self.assertIsNot(bpDict1._resampledSed(ss), resampled)
+        dusty = Sed(wavelen=wavelen, flambda=flambda)
+        dusty.addCCMDust(a_x, b_x, A_v=0.5)
+        np.testing.assert_array_equal(bpDict1.magListForSed(ss), bpDict1.magListForSed(dusty))
+        ss.redshiftSED(0.1, in_place=True)
+        np.testing.assert_array_equal(bpDict1.magListForSed(ss),
+                                      bpDict1.magListForSed(Sed(wavelen=ss.wavelen, flambda=ss.flambda)))
+
+    def test_columnar_cache(self):
+        """
+        Test that SEDs written to the columnar cache format are
+        read back identically through the memory-mapped index
+        """
+        scratch_dir = os.path.join(getPackageDir("sims_photUtils"),
+                                   "tests", "scratchSpace")
+        cache_name = "test_columnar_sed_cache.dat"
+        index_name = _sed_cache_index_name(cache_name)
+
+        sed_dir = os.path.join(getPackageDir("sims_photUtils"),
+                               "tests", "cartoonSedTestData", "galaxySed")
+        sed_list = []
+        for file_name in sorted(os.listdir(sed_dir)):
+            ss = Sed()
+            ss.readSED_flambda(os.path.join(sed_dir, file_name))
+            sed_list.append(ss)
+
+        manifest = {}
+        for ix, ss in enumerate(sed_list):
+            manifest[ss.name] = (os.path.getsize(ss.name), os.path.getmtime(ss.name), ix)
+
+        n_written = _write_sed_cache(scratch_dir, cache_name,
+                                     ((ss.name, ss.wavelen, ss.flambda) for ss in sed_list),
+                                     manifest=manifest)
+        self.assertEqual(n_written, len(sed_list))
+
+        entries, dtype = _read_sed_cache_index(scratch_dir, cache_name)
+        self.assertEqual(dtype, np.dtype(float))
+        for ss in sed_list:
+            self.assertEqual(entries[ss.name][1], len(ss.wavelen))
+            self.assertEqual(entries[ss.name][2:5], manifest[ss.name])
+            self.assertTrue(entries[ss.name][5])
+
+        cache = _load_sed_cache(scratch_dir, cache_name)
+        self.assertEqual(len(cache), len(sed_list))
+        for ss in sed_list:
+            self.assertIn(ss.name, cache)
+            np.testing.assert_array_equal(cache[ss.name][0], ss.wavelen)
+            np.testing.assert_array_equal(cache[ss.name][1], ss.flambda)
+
+        del cache
+        for name in (cache_name, index_name):
+            if os.path.exists(os.path.join(scratch_dir, name)):
+                os.unlink(os.path.join(scratch_dir, name))
+
+    def test_cache_manifest(self):
+        """
+        Test that the manifest stored in the index of the columnar cache
+        detects changes to the library and corruption of the cache
+        """
+        scratch_dir = os.path.join(getPackageDir("sims_photUtils"),
+                                   "tests", "scratchSpace")
+        cache_name = "test_manifest_sed_cache.dat"
+        index_name = _sed_cache_index_name(cache_name)
+        library_dir = os.path.join(scratch_dir, "test_manifest_library")
+        sub_dir = os.path.join(library_dir, "seds")
+        if not os.path.exists(sub_dir):
+            os.makedirs(sub_dir)
+
+        try:
+            wavelen = np.arange(100.0, 200.0, 10.0)
+            sed_list = [(os.path.join("seds", "sed_%d.txt" % ix), wavelen, wavelen*ix)
+                        for ix in range(4)]
+            for name, wav, flambda in sed_list:
+                with open(os.path.join(library_dir, name), "w") as output_file:
+                    for ww, ff in zip(wav, flambda):
+                        output_file.write("%e %e\n" % (ww, ff))
+
+            # (old modification times, so that any change to the files is seen
+            # however coarse the file system's clock is)
+            for name, wav, flambda in sed_list:
+                os.utime(os.path.join(library_dir, name), (1.0e8, 1.0e8))
+            os.utime(sub_dir, (1.0e8, 1.0e8))
+
+            # a cache without a stamp must be treated as stale
+            _write_sed_cache(scratch_dir, cache_name, iter(sed_list))
+            self.assertTrue(_sed_library_changed(scratch_dir, cache_name, library_dir))
+            self.assertTrue(_sed_library_files_changed(scratch_dir, cache_name, library_dir))
+
+            _write_sed_cache(scratch_dir, cache_name, iter(sed_list), stamp_root=library_dir)
+            self.assertFalse(_sed_library_changed(scratch_dir, cache_name, library_dir))
+            self.assertFalse(_sed_library_files_changed(scratch_dir, cache_name, library_dir))
+            self.assertEqual(len(_load_sed_cache(scratch_dir, cache_name)), len(sed_list))
+
+            # adding a file to the library is detected
+            extra_name = os.path.join(sub_dir, "sed_extra.txt")
+            with open(extra_name, "w") as output_file:
+                output_file.write("100.0 1.0\n110.0 2.0\n")
+            self.assertTrue(_sed_library_changed(scratch_dir, cache_name, library_dir))
+            os.unlink(extra_name)
+            os.utime(sub_dir, (1.0e8, 1.0e8))
+            self.assertFalse(_sed_library_changed(scratch_dir, cache_name, library_dir))
+
+            # overwriting a file in place, with the same size, does not change
+            # the directory; it is only found by the check of every file
+            replaced_name = os.path.join(library_dir, sed_list[1][0])
+            with open(replaced_name, "r") as input_file:
+                contents = input_file.read()
+            with open(replaced_name, "w") as output_file:
+                output_file.write(contents.replace("1.", "2."))
+            os.utime(sub_dir, (1.0e8, 1.0e8))
+            self.assertEqual(os.path.getsize(replaced_name), len(contents))
+            self.assertFalse(_sed_library_changed(scratch_dir, cache_name, library_dir))
+            self.assertTrue(_sed_library_files_changed(scratch_dir, cache_name, library_dir))
+            _write_sed_cache(scratch_dir, cache_name, iter(sed_list), stamp_root=library_dir)
+            self.assertFalse(_sed_library_changed(scratch_dir, cache_name, library_dir))
+            self.assertFalse(_sed_library_files_changed(scratch_dir, cache_name, library_dir))
+
+            # and a different version of the library
+            old_version = os.environ.get("SETUP_SIMS_SED_LIBRARY")
+            os.environ["SETUP_SIMS_SED_LIBRARY"] = "sims_sed_library test_version"
+            try:
+                self.assertTrue(_sed_library_changed(scratch_dir, cache_name, library_dir))
+            finally:
+                if old_version is None:
+                    del os.environ["SETUP_SIMS_SED_LIBRARY"]
+                else:
+                    os.environ["SETUP_SIMS_SED_LIBRARY"] = old_version
+            self.assertFalse(_sed_library_changed(scratch_dir, cache_name, library_dir))
+
+            # a truncated data file is detected
+            with open(os.path.join(scratch_dir, cache_name), "r+b") as file_handle:
+                file_handle.truncate(100)
+            with self.assertRaises(SedCacheError):
+                _load_sed_cache(scratch_dir, cache_name)
+
+            # so is an index which does not match its checksum
+            _write_sed_cache(scratch_dir, cache_name, iter(sed_list), stamp_root=library_dir)
+            with np.load(os.path.join(scratch_dir, index_name)) as index:
+                index_dict = dict((key, index[key]) for key in index.files)
+            index_dict["lengths"][0] -= 1
+            with open(os.path.join(scratch_dir, index_name), "wb") as file_handle:
+                np.savez(file_handle, **index_dict)
+            with self.assertRaises(SedCacheError):
+                _load_sed_cache(scratch_dir, cache_name)
+        finally:
+            for name in (cache_name, index_name):
+                if os.path.exists(os.path.join(scratch_dir, name)):
+                    os.unlink(os.path.join(scratch_dir, name))
+            for name, wav, flambda in sed_list:
+                if os.path.exists(os.path.join(library_dir, name)):
+                    os.unlink(os.path.join(library_dir, name))
+            os.rmdir(sub_dir)
+            os.rmdir(library_dir)
+
+    def test_incremental_cache_generation(self):
+        """
+        Test that regenerating the columnar cache (in parallel) only parses the
+        files which changed, and copies the others from the existing cache
+        """
+        scratch_dir = tempfile.mkdtemp(dir=os.path.join(getPackageDir("sims_photUtils"),
+                                                        "tests", "scratchSpace"))
+        cache_name = "test_incremental_sed_cache.dat"
+        library_dir = os.path.join(scratch_dir, "library")
+        cache_dir = os.path.join(scratch_dir, "cache")
+        os.makedirs(os.path.join(library_dir, "seds"))
+        os.mkdir(cache_dir)
+
+        def write_sed(name, flambda):
+            with gzip.open(os.path.join(library_dir, name), "wt") as output_file:
+                for ww, ff in zip(wavelen, flambda):
+                    output_file.write("%.6f %.6e\n" % (ww, ff))
+            os.utime(os.path.join(library_dir, name), (1.0e8, 1.0e8))
+
+        def generate(n_processes):
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                cache = _generate_sed_cache(cache_dir, cache_name, n_processes=n_processes,
+                                            sed_root=library_dir, library_sub_dirs=["seds"])
+                return cache, sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+
+        try:
+            wavelen = np.arange(100.0, 200.0, 10.0)
+            name_list = [os.path.join("seds", "sed_%d.txt.gz" % ix) for ix in range(4)]
+            for ix, name in enumerate(name_list):
+                write_sed(name, wavelen*(ix+1))
+
+            cache, output = generate(1)
+            self.assertIn("Parsing %d SED files" % len(name_list), output)
+            self.assertEqual(len(cache), len(name_list))
+            for ix, name in enumerate(name_list):
+                np.testing.assert_array_equal(cache[os.path.join(library_dir, name)][1], wavelen*(ix+1))
+            del cache
+
+            # mark an unchanged entry in the existing cache: if it is copied
+            # rather than parsed again, the mark is carried into the new cache
+            entries, dtype = _read_sed_cache_index(cache_dir, cache_name)
+            offset, length = entries[name_list[0]][:2]
+            data = np.memmap(os.path.join(cache_dir, cache_name), dtype=dtype, mode="r+")
+            data[offset+length] = -42.0
+            data.flush()
+            del data
+
+            write_sed(name_list[2], wavelen*7.0)
+            cache, output = generate(2)
+            self.assertIn("Re-using %d unchanged SEDs" % (len(name_list)-1), output)
+            self.assertIn("Parsing 1 SED files", output)
+            self.assertEqual(len(cache), len(name_list))
+            self.assertEqual(cache[os.path.join(library_dir, name_list[0])][1][0], -42.0)
+            np.testing.assert_array_equal(cache[os.path.join(library_dir, name_list[0])][1][1:],
+                                          (wavelen*1.0)[1:])
+            np.testing.assert_array_equal(cache[os.path.join(library_dir, name_list[1])][1], wavelen*2.0)
+            np.testing.assert_array_equal(cache[os.path.join(library_dir, name_list[2])][0], wavelen)
+            np.testing.assert_array_equal(cache[os.path.join(library_dir, name_list[2])][1], wavelen*7.0)
+            np.testing.assert_array_equal(cache[os.path.join(library_dir, name_list[3])][1], wavelen*4.0)
+
+            # the manifest records the new file
+            entries, dtype = _read_sed_cache_index(cache_dir, cache_name)
+            full_name = os.path.join(library_dir, name_list[2])
+            self.assertEqual(entries[name_list[2]][2:4], (os.path.getsize(full_name),
+                                                           os.path.getmtime(full_name)))
+            self.assertFalse(_sed_library_changed(cache_dir, cache_name, library_dir))
+            del cache
+        finally:
+            shutil.rmtree(scratch_dir)
+
+    def test_selective_cache_load(self):
+        """
+        Test that _load_sed_cache can load only some sub-directories of
+        the cache, cropped to a wavelength window, as views of the data file
+        """
+        scratch_dir = os.path.join(getPackageDir("sims_photUtils"),
+                                   "tests", "scratchSpace")
+        cache_name = "test_selective_sed_cache.dat"
+        index_name = _sed_cache_index_name(cache_name)
+
+        wavelen = np.arange(100.0, 200.0, 10.0)
+        sed_list = []
+        for sub_dir in (os.path.join("starSED", "kurucz"), os.path.join("starSED", "wDs"),
+                        "galaxySED", "agnSED"):
+            for ix in range(3):
+                sed_list.append((os.path.join(sub_dir, "sed_%d.txt" % ix), wavelen, wavelen*(ix+1)))
+        # an SED which is not sorted, though its first wavelength is less than its last
+        unsorted_wavelen = np.array([100.0, 150.0, 120.0, 190.0, 130.0, 110.0, 170.0, 200.0])
+        unsorted_name = os.path.join("other", "unsorted.txt")
+        sed_list.append((unsorted_name, unsorted_wavelen, 2.0*unsorted_wavelen))
+
+        try:
+            _write_sed_cache(scratch_dir, cache_name, iter(sed_list))
+            entries, dtype = _read_sed_cache_index(scratch_dir, cache_name)
+            self.assertFalse(entries[unsorted_name][5])
+            self.assertTrue(entries[sed_list[0][0]][5])
+
+            cache = _load_sed_cache(scratch_dir, cache_name, root_dir="root",
+                                    sub_dirs=["starSED/kurucz", "galaxySED/"])
+            self.assertEqual(len(cache), 6)
+            for name, wav, flambda in sed_list:
+                full_name = os.path.join("root", name)
+                if name.startswith(os.path.join("starSED", "kurucz")) or name.startswith("galaxySED"):
+                    np.testing.assert_array_equal(cache[full_name][0], wav)
+                    np.testing.assert_array_equal(cache[full_name][1], flambda)
+                else:
+                    self.assertNotIn(full_name, cache)
+
+            # 'starSED/kur' is not a directory, so must not match starSED/kurucz
+            self.assertEqual(len(_load_sed_cache(scratch_dir, cache_name, sub_dirs=["starSED/kur"])), 0)
+            self.assertEqual(len(_load_sed_cache(scratch_dir, cache_name, sub_dirs=["starSED"])), 6)
+            with self.assertRaises(ValueError):
+                _load_sed_cache(scratch_dir, cache_name, sub_dirs=["../starSED"])
+
+            cache = _load_sed_cache(scratch_dir, cache_name, wavelen_min=125.0, wavelen_max=160.0)
+            self.assertEqual(len(cache), len(sed_list))
+            for name, wav, flambda in sed_list:
+                valid = np.logical_and(wav >= 125.0, wav <= 160.0)
+                np.testing.assert_array_equal(cache[name][0], wav[valid])
+                np.testing.assert_array_equal(cache[name][1], flambda[valid])
+
+            # the limits are inclusive, and either may be omitted
+            cache = _load_sed_cache(scratch_dir, cache_name, wavelen_min=130.0)
+            np.testing.assert_array_equal(cache[sed_list[0][0]][0], wavelen[wavelen >= 130.0])
+            cache = _load_sed_cache(scratch_dir, cache_name, wavelen_max=130.0)
+            np.testing.assert_array_equal(cache[sed_list[0][0]][0], wavelen[wavelen <= 130.0])
+
+            # the cropped flambda arrays are views of the memory-mapped file, not
+            # copies; SEDs on the same grid share one interned wavelen array
+            base_list = [cache[name][1].base for name, wav, flambda in sed_list
+                         if name != unsorted_name]
+            self.assertTrue(all(bb is not None and bb is base_list[0] for bb in base_list))
+            wavelen_list = [cache[name][0] for name, wav, flambda in sed_list
+                            if name != unsorted_name]
+            self.assertTrue(_is_interned(wavelen_list[0]))
+            self.assertTrue(all(ww is wavelen_list[0] for ww in wavelen_list))
+            self.assertIsNot(cache[unsorted_name][0], wavelen_list[0])
+            ss = Sed()
+            ss.setSED(wavelen_list[0], flambda=cache[sed_list[0][0]][1])
+            del cache, wavelen_list
+            # the registry keeps the grids of caches alive
+            gc.collect()
+            self.assertIsNotNone(_global_wavelen_grids._pinned.get(wavelen_grid_fingerprint(ss.wavelen)))
+        finally:
+            for name in (cache_name, index_name):
+                if os.path.exists(os.path.join(scratch_dir, name)):
+                    os.unlink(os.path.join(scratch_dir, name))
+
+    def test_shared_memory_cache(self):
+        """
+        Test that SEDs published in shared memory can be read by
+        worker processes
+        """
+        sed_module = importlib.import_module('lsst.sims.photUtils.Sed')
+        if sed_module.shared_memory is None:
+            self.skipTest("multiprocessing.shared_memory is not available")
+
+        sed_dir = os.path.join(getPackageDir('sims_photUtils'), 'tests',
+                               'cartoonSedTestData', 'starSed', 'kurucz')
+        dtype = np.dtype([('wavelen', float), ('flambda', float)])
+        file_name_list = [os.path.join(sed_dir, name) for name in os.listdir(sed_dir)]
+        cache = {}
+        for file_name in file_name_list:
+            data = np.genfromtxt(file_name, dtype=dtype)
+            cache[file_name] = (data['wavelen'], data['flambda'])
+
+        with self.assertRaises(RuntimeError):
+            publish_LSST_sed_cache()
+
+        sed_module._global_lsst_sed_cache = cache
+        handle = publish_LSST_sed_cache()
+        try:
+            self.assertEqual(len(handle), len(file_name_list))
+            self.assertIsNot(sed_module._global_lsst_sed_cache, cache)
+            for file_name in file_name_list:
+                ss = Sed()
+                ss.readSED_flambda(file_name)
+                np.testing.assert_array_equal(ss.wavelen, cache[file_name][0])
+                np.testing.assert_array_equal(ss.flambda, cache[file_name][1])
+                self.assertFalse(ss.flambda.flags.writeable)
+                # the grids were interned when the cache was attached
+                self.assertTrue(_is_interned(ss.wavelen))
+                self.assertIs(ss.wavelen, sed_module._global_lsst_sed_cache[file_name][0])
+
+            pool = multiprocessing.Pool(2, initializer=attach_LSST_sed_cache,
+                                        initargs=(handle,))
+            try:
+                results = pool.map(_read_shared_sed, file_name_list)
+            finally:
+                pool.close()
+                pool.join()
+
+            for file_name, result in zip(file_name_list, results):
+                self.assertTrue(result[0])
+                self.assertFalse(result[1])
+                self.assertAlmostEqual(result[2], cache[file_name][0].sum(), 10)
+                self.assertAlmostEqual(result[3], cache[file_name][1].sum(), 10)
+        finally:
+            release_LSST_sed_cache(handle)
+            sed_module._global_lsst_sed_cache = None
+
+        self.assertIsNone(sed_module._global_lsst_sed_cache)
+        self.assertNotIn(handle.segmentName, sed_module._global_shared_sed_segments)
+
 
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
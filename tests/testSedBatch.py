@@ -0,0 +1,226 @@
+from __future__ import with_statement
+from builtins import range
+import unittest
+import os
+import warnings
+import numpy as np
+import lsst.utils.tests
+from lsst.utils import getPackageDir
+
+from lsst.sims.photUtils import Bandpass, BandpassDict, Sed, SedBatch
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class SedBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(8812)
+        data_dir = os.path.join(getPackageDir('sims_photUtils'), 'tests', 'cartoonSedTestData')
+        sed_dir = os.path.join(data_dir, 'galaxySed')
+        self.sedList = []
+        for file_name in sorted(os.listdir(sed_dir))[:8]:
+            ss = Sed()
+            ss.readSED_flambda(os.path.join(sed_dir, file_name))
+            self.sedList.append(ss)
+
+        self.bpNameList = ['u', 'g', 'r', 'i', 'z']
+        self.bpList = []
+        for name in self.bpNameList:
+            bp = Bandpass()
+            bp.readThroughput(os.path.join(data_dir, 'test_bandpass_%s.dat' % name))
+            self.bpList.append(bp)
+        self.bpDict = BandpassDict(self.bpList, self.bpNameList)
+        self.wavelen_match = self.bpDict.wavelenMatch
+
+    def getBatchAndSeds(self):
+        """
+        Return a SedBatch on self.wavelen_match and a list of the
+        equivalent Seds
+        """
+        seds = []
+        for ss in self.sedList:
+            wav, fl = ss.resampleSED(ss.wavelen, ss.flambda, wavelen_match=self.wavelen_match)
+            seds.append(Sed(wavelen=wav, flambda=fl, name=ss.name))
+        batch = SedBatch.fromSedList(self.sedList, wavelen_match=self.wavelen_match)
+        return batch, seds
+
+    def testConstruction(self):
+        """
+        Test that a SedBatch holds the Seds it was built from
+        """
+        batch, seds = self.getBatchAndSeds()
+        self.assertEqual(len(batch), len(seds))
+        self.assertEqual(batch.flambda.shape, (len(seds), len(self.wavelen_match)))
+        self.assertIsNone(batch.fnu)
+        for ix, ss in enumerate(seds):
+            self.assertEqual(batch.names[ix], ss.name)
+            np.testing.assert_array_equal(batch.flambda[ix], ss.flambda)
+            self.assertEqual(batch[ix], ss)
+
+        fnu_batch = SedBatch(batch.wavelen, fnu=2.0*np.ones((3, len(batch.wavelen))))
+        self.assertEqual(len(fnu_batch), 3)
+        ss = Sed(wavelen=batch.wavelen, fnu=2.0*np.ones(len(batch.wavelen)))
+        np.testing.assert_allclose(fnu_batch.flambda[1], ss.flambda, rtol=1.0e-12)
+
+        with self.assertRaises(ValueError):
+            SedBatch(batch.wavelen)
+        with self.assertRaises(ValueError):
+            SedBatch(batch.wavelen, flambda=np.ones((3, len(batch.wavelen)+1)))
+        with self.assertRaises(ValueError):
+            SedBatch(batch.wavelen, flambda=np.ones((3, len(batch.wavelen))), names=['a', 'b'])
+
+    def testTransformations(self):
+        """
+        Test that the vectorized methods of SedBatch agree with applying the
+        corresponding Sed methods to each Sed
+        """
+        batch, seds = self.getBatchAndSeds()
+        n_sed = len(seds)
+        a_x, b_x = batch.setupCCMab()
+        A_v = self.rng.random_sample(n_sed)*0.5 + 0.1
+        ebv = self.rng.random_sample(n_sed)*0.2 + 0.05
+        fluxNorm = self.rng.random_sample(n_sed)*1.0e-12
+
+        batch.addCCMDust(a_x, b_x, A_v=A_v)
+        batch.addCCMDust(a_x, b_x, ebv=ebv, R_v=2.5)
+        batch.multiplyFluxNorm(fluxNorm)
+        batch.flambdaTofnu()
+        for ix, ss in enumerate(seds):
+            ss.addCCMDust(a_x, b_x, A_v=A_v[ix])
+            ss.addCCMDust(a_x, b_x, ebv=ebv[ix], R_v=2.5)
+            ss.multiplyFluxNorm(fluxNorm[ix])
+            np.testing.assert_allclose(batch.flambda[ix], ss.flambda, rtol=1.0e-10)
+            np.testing.assert_allclose(batch.fnu[ix], ss.fnu, rtol=1.0e-10)
+
+        with self.assertRaises(ValueError):
+            batch.addCCMDust(a_x, b_x, A_v=A_v, ebv=ebv, R_v=2.5)
+        with self.assertRaises(ValueError):
+            batch.multiplyFluxNorm(fluxNorm[:2])
+
+        # a single redshift stretches the shared grid
+        batch.redshiftSED(0.3, dimming=True)
+        self.assertIsNone(batch.fnu)
+        for ix, ss in enumerate(seds):
+            ss.redshiftSED(0.3, dimming=True)
+            np.testing.assert_allclose(batch.wavelen, ss.wavelen, rtol=1.0e-12)
+            np.testing.assert_allclose(batch.flambda[ix], ss.flambda, rtol=1.0e-12)
+
+    def testPerRowRedshift(self):
+        """
+        Test that redshifting each SED by a different amount is equivalent to
+        redshifting and resampling each Sed
+        """
+        batch, seds = self.getBatchAndSeds()
+        redshift = self.rng.random_sample(len(seds))*0.5
+        redshift[0] = -0.1
+        wavelen_match = np.arange(250.0, 1200.0, 2.0)
+        batch.redshiftSED(redshift, dimming=True, wavelen_match=wavelen_match)
+        np.testing.assert_array_equal(batch.wavelen, wavelen_match)
+        for ix, ss in enumerate(seds):
+            ss.redshiftSED(redshift[ix], dimming=True)
+            with warnings.catch_warnings():
+                # the redshifted Seds do not cover all of wavelen_match
+                warnings.simplefilter('ignore')
+                ss.resampleSED(wavelen_match=wavelen_match)
+            np.testing.assert_allclose(batch.flambda[ix], ss.flambda, rtol=1.0e-10)
+            # the same points are undefined
+            np.testing.assert_array_equal(np.isnan(batch.flambda[ix]), np.isnan(ss.flambda))
+
+    def testRedshiftGrid(self):
+        """
+        Test that fromRedshiftGrid is equivalent to redshifting and resampling
+        a copy of the Sed at each redshift
+        """
+        redshift = np.array([-0.05, 0.0, 0.1, 0.55, 1.0, 1.7])
+        for dimming in (False, True):
+            for sedobj in self.sedList[:3]:
+                batch = SedBatch.fromRedshiftGrid(sedobj, redshift, self.wavelen_match,
+                                                  dimming=dimming)
+                self.assertEqual(batch.flambda.shape, (len(redshift), len(self.wavelen_match)))
+                mags = self.bpDict.magListForSedBatch(batch)
+                for ix, zz in enumerate(redshift):
+                    ss = Sed(wavelen=sedobj.wavelen, flambda=sedobj.flambda, name=sedobj.name)
+                    ss.redshiftSED(zz, dimming=dimming)
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('ignore')
+                        ss.resampleSED(wavelen_match=self.wavelen_match)
+                        control_mags = self.bpDict.magListForSed(ss)
+                    self.assertEqual(batch.names[ix], '%s_Z%.2f' % (sedobj.name, zz))
+                    np.testing.assert_allclose(batch.flambda[ix], ss.flambda, rtol=1.0e-12)
+                    np.testing.assert_array_equal(np.isnan(batch.flambda[ix]), np.isnan(ss.flambda))
+                    np.testing.assert_allclose(mags[ix], control_mags, rtol=1.0e-10)
+
+        # the Sed itself is unchanged
+        ss = Sed()
+        ss.readSED_flambda(self.sedList[0].name)
+        self.assertEqual(ss, self.sedList[0])
+
+    def testMagnitudes(self):
+        """
+        Test that SedBatch and BandpassDict calculate the same magnitudes and
+        fluxes as Sed
+        """
+        batch, seds = self.getBatchAndSeds()
+        magArray = self.bpDict.magListForSedBatch(batch)
+        fluxArray = self.bpDict.fluxListForSedBatch(batch)
+        self.assertEqual(magArray.shape, (len(seds), len(self.bpList)))
+        np.testing.assert_allclose(batch.manyMagCalc(self.bpDict.phiArray, self.bpDict.wavelenStep),
+                                   magArray, rtol=1.0e-12)
+        for ix, ss in enumerate(seds):
+            for iy, bp in enumerate(self.bpList):
+                self.assertAlmostEqual(ss.calcMag(bp), magArray[ix][iy], 10)
+                self.assertAlmostEqual(ss.calcFlux(bp)/fluxArray[ix][iy], 1.0, 10)
+
+        for iy, bp in enumerate(self.bpList):
+            np.testing.assert_allclose(batch.calcMag(bp), magArray[:, iy], rtol=1.0e-12)
+            fluxNorm = batch.calcFluxNorm(20.0, bp)
+            for ix, ss in enumerate(seds):
+                self.assertAlmostEqual(fluxNorm[ix], ss.calcFluxNorm(20.0, bp), 10)
+
+        # indices and batches which are not on the bandpass grid
+        magArray = self.bpDict.magListForSedBatch(batch, indices=[1, 3])
+        self.assertTrue(np.isnan(magArray[:, [0, 2, 4]]).all())
+        coarse = SedBatch.fromSedList(self.sedList)
+        magArray = self.bpDict.magListForSedBatch(coarse)
+        for ix in range(len(coarse)):
+            np.testing.assert_allclose(magArray[ix], self.bpDict.magListForSed(coarse[ix]),
+                                       rtol=1.0e-10)
+
+    def testBadval(self):
+        """
+        Test that SEDs with no (or negative) flux get badval from both
+        BandpassDict.magListForSedBatch and SedBatch.manyMagCalc
+        """
+        flambda = np.ones((3, len(self.wavelen_match)))*1.0e-15
+        flambda[1] = 0.0
+        flambda[2] = -1.0e-15
+        batch = SedBatch(self.wavelen_match, flambda=flambda, badval=-99.0)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            magArray = self.bpDict.magListForSedBatch(batch)
+            manyMags = batch.manyMagCalc(self.bpDict.phiArray, self.bpDict.wavelenStep)
+        np.testing.assert_array_equal(magArray, manyMags)
+        self.assertTrue(np.isfinite(magArray[0]).all())
+        np.testing.assert_array_equal(magArray[1:], -99.0)
+        for iy, bp in enumerate(self.bpList):
+            np.testing.assert_allclose(batch.calcMag(bp), magArray[:, iy], rtol=1.0e-12)
+
+        # bandpasses which were not asked for are still NaN
+        magArray = self.bpDict.magListForSedBatch(batch, indices=[1, 3])
+        self.assertTrue(np.isnan(magArray[:, [0, 2, 4]]).all())
+        np.testing.assert_array_equal(magArray[1:, [1, 3]], -99.0)
+        np.testing.assert_array_equal(magArray[:, [1, 3]],
+                                      batch.manyMagCalc(self.bpDict.phiArray, self.bpDict.wavelenStep,
+                                                        observedBandpassInd=[1, 3]))
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -3,11 +3,15 @@ from builtins import zip
 from builtins import range
 import unittest
 import os
+import shutil
+import tempfile
 import numpy as np
 import lsst.utils.tests
 from lsst.utils import getPackageDir
 
-from lsst.sims.photUtils import Bandpass, Sed, SedList
+from lsst.sims.photUtils import Bandpass, BandpassDict, Sed, SedList
+from lsst.sims.photUtils import cache_resampled_seds, get_misc_sed_cache
+from lsst.sims.photUtils.Sed import _global_resampled_sed_caches
 
 
 def setup_module(module):
@@ -725,6 +729,110 @@ class SedListTest(unittest.TestCase):
             np.testing.assert_array_equal(sedControl.flambda, sedTest.flambda)
             np.testing.assert_array_equal(sedControl.fnu, sedTest.fnu)
 
+    def testThreadedReads(self):
+        """
+        Test that reading the Sed files with a pool of threads gives the
+        same results as reading them one at a time
+        """
+        nSed = 50
+        sedNameList = self.getListOfSedNames(nSed)
+        sedNameList[3] = "None"
+        magNormList = self.rng.random_sample(nSed)*5.0 + 15.0
+        redshiftList = self.rng.random_sample(nSed)*2.0
+        wavelen_match = np.arange(300.0, 1500.0, 10.0)
+
+        get_misc_sed_cache().clear()
+        controlList = SedList(sedNameList, magNormList, specMap=None,
+                              fileDir=self.sedDir, wavelenMatch=wavelen_match,
+                              redshiftList=redshiftList, nThreads=1)
+        get_misc_sed_cache().clear()
+        testList = SedList(sedNameList, magNormList, specMap=None,
+                           fileDir=self.sedDir, wavelenMatch=wavelen_match,
+                           redshiftList=redshiftList, nThreads=4)
+
+        self.assertEqual(len(controlList), len(testList))
+        for sedControl, sedTest in zip(controlList, testList):
+            self.assertEqual(sedControl, sedTest)
+        self.assertIsNone(testList[3].wavelen)
+
+    def testResampledCache(self):
+        """
+        Test that Seds taken from the cache of resampled SEDs are the same
+        as Seds which were read in and resampled one at a time
+        """
+        scratch_dir = tempfile.mkdtemp(dir=os.path.join(getPackageDir('sims_photUtils'),
+                                                        'tests', 'scratchSpace'))
+        sedRoot = os.path.dirname(os.path.dirname(self.sedDir))
+        wavelen_match = np.arange(300.0, 1500.0, 10.0)
+        try:
+            nSed = 10
+            sedNameList = self.getListOfSedNames(nSed)
+            magNormList = self.rng.random_sample(nSed)*5.0 + 15.0
+            galacticAvList = self.rng.random_sample(nSed)*0.3 + 0.1
+            controlList = SedList(sedNameList, magNormList, specMap=None,
+                                  fileDir=self.sedDir, wavelenMatch=wavelen_match,
+                                  galacticAvList=galacticAvList)
+
+            n_cached = cache_resampled_seds(wavelen_match, sed_dir=sedRoot,
+                                            sub_dir_list=['galaxySed'],
+                                            cache_dir=scratch_dir)
+            self.assertEqual(n_cached, len(self.sedPossibilities))
+
+            # loading the cache a second time should not regenerate it
+            cache_files = sorted(os.listdir(scratch_dir))
+            mtimes = [os.stat(os.path.join(scratch_dir, name)).st_mtime for name in cache_files]
+            cache_resampled_seds(wavelen_match, sed_dir=sedRoot,
+                                 sub_dir_list=['galaxySed'],
+                                 cache_dir=scratch_dir)
+            self.assertEqual(cache_files, sorted(os.listdir(scratch_dir)))
+            self.assertEqual(mtimes, [os.stat(os.path.join(scratch_dir, name)).st_mtime
+                                      for name in cache_files])
+
+            testList = SedList(sedNameList, magNormList, specMap=None,
+                               fileDir=self.sedDir, wavelenMatch=wavelen_match,
+                               galacticAvList=galacticAvList)
+
+            for sedControl, sedTest in zip(controlList, testList):
+                self.assertEqual(sedControl.name, sedTest.name)
+                np.testing.assert_array_equal(sedControl.wavelen, sedTest.wavelen)
+                np.testing.assert_allclose(sedControl.flambda, sedTest.flambda, rtol=1.0e-12)
+
+            # Seds which are redshifted do not come from the cache
+            redshiftList = self.rng.random_sample(nSed)*2.0
+            testList = SedList(sedNameList, magNormList, specMap=None,
+                               fileDir=self.sedDir, wavelenMatch=wavelen_match,
+                               redshiftList=redshiftList)
+            _global_resampled_sed_caches.clear()
+            controlList = SedList(sedNameList, magNormList, specMap=None,
+                                  fileDir=self.sedDir, wavelenMatch=wavelen_match,
+                                  redshiftList=redshiftList)
+            for sedControl, sedTest in zip(controlList, testList):
+                self.assertEqual(sedControl, sedTest)
+
+            # BandpassDict should use the cache for unaltered templates
+            bpDict = BandpassDict.loadTotalBandpassesFromFiles(
+                bandpassNames=['u', 'g', 'r', 'i', 'z'],
+                bandpassDir=os.path.join(getPackageDir('sims_photUtils'),
+                                         'tests', 'cartoonSedTestData'),
+                bandpassRoot='test_bandpass_')
+            wavelen_match = bpDict.wavelenMatch
+            for name in sedNameList:
+                sedControl = Sed()
+                sedControl.readSED_flambda(os.path.join(self.sedDir, name))
+                controlMags = bpDict.magListForSed(sedControl)
+                controlFluxes = bpDict.fluxListForSed(sedControl)
+                cache_resampled_seds(wavelen_match, sed_dir=sedRoot,
+                                     sub_dir_list=['galaxySed'],
+                                     cache_dir=scratch_dir)
+                sedTest = Sed()
+                sedTest.readSED_flambda(os.path.join(self.sedDir, name))
+                np.testing.assert_allclose(controlMags, bpDict.magListForSed(sedTest), rtol=1.0e-12)
+                np.testing.assert_allclose(controlFluxes, bpDict.fluxListForSed(sedTest), rtol=1.0e-12)
+                _global_resampled_sed_caches.clear()
+        finally:
+            _global_resampled_sed_caches.clear()
+            shutil.rmtree(scratch_dir)
+
 
 class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
     pass
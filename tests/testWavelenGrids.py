@@ -0,0 +1,146 @@
+from __future__ import with_statement
+import unittest
+import gc
+import os
+import numpy as np
+import lsst.utils.tests
+from lsst.utils import getPackageDir
+
+from lsst.sims.photUtils import intern_wavelen_grid, wavelen_grid_fingerprint
+from lsst.sims.photUtils import Sed, Bandpass, BandpassDict, SedBatch, SedList
+from lsst.sims.photUtils.WavelenGrids import _global_wavelen_grids, _is_interned
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+class WavelenGridTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataDir = os.path.join(getPackageDir('sims_photUtils'), 'tests', 'cartoonSedTestData')
+
+    def testIntern(self):
+        """
+        Test that equal grids are interned as one read-only array
+        """
+        wavelen = np.arange(300.0, 1100.0, 0.5)
+        grid = intern_wavelen_grid(wavelen)
+        self.assertIsNot(grid, wavelen)
+        np.testing.assert_array_equal(grid, wavelen)
+        self.assertIs(intern_wavelen_grid(np.copy(wavelen)), grid)
+        self.assertIs(intern_wavelen_grid(grid), grid)
+        self.assertIsNot(intern_wavelen_grid(wavelen[:-1]), grid)
+        with self.assertRaises(ValueError):
+            grid[0] = 2.0
+        # the canonical array is a copy
+        wavelen[0] = 2.0
+        self.assertEqual(grid[0], 300.0)
+
+        fingerprint = wavelen_grid_fingerprint(grid)
+        self.assertEqual(fingerprint.wavelen_min, 300.0)
+        self.assertEqual(fingerprint.wavelen_max, 1099.5)
+        self.assertEqual(fingerprint.wavelen_step, 0.5)
+        self.assertEqual(fingerprint.length, len(grid))
+        self.assertEqual(wavelen_grid_fingerprint(np.copy(grid)), fingerprint)
+        self.assertIsNone(wavelen_grid_fingerprint(wavelen).wavelen_step)
+
+        with self.assertRaises(ValueError):
+            intern_wavelen_grid(np.ones((3, 3)))
+
+    def testRelease(self):
+        """
+        Test that grids nothing refers to are dropped from the registry
+        """
+        grid = intern_wavelen_grid(np.arange(123.0, 456.0, 0.25))
+        fingerprint = wavelen_grid_fingerprint(grid)
+        self.assertIn(fingerprint, _global_wavelen_grids._grids)
+        del grid
+        gc.collect()
+        self.assertNotIn(fingerprint, _global_wavelen_grids._grids)
+
+    def testSharedGrids(self):
+        """
+        Test that templates, BandpassDicts, their Bandpasses and the resampled
+        copies they make of Seds on the same grid share one wavelen array
+        """
+        sedDir = os.path.join(self.dataDir, 'starSed', 'kurucz')
+        sedNames = sorted(os.listdir(sedDir))[:4]
+        sedList = []
+        for name in sedNames:
+            ss = Sed()
+            ss.readSED_flambda(os.path.join(sedDir, name))
+            sedList.append(ss)
+            self.assertTrue(_is_interned(ss.wavelen))
+            if np.array_equal(ss.wavelen, sedList[0].wavelen):
+                self.assertIs(ss.wavelen, sedList[0].wavelen)
+
+        bpList = []
+        for name in 'ugr':
+            bp = Bandpass()
+            bp.readThroughput(os.path.join(self.dataDir, 'test_bandpass_%s.dat' % name))
+            bpList.append(bp)
+
+        bpDict = BandpassDict(bpList, ['u', 'g', 'r'])
+        self.assertTrue(_is_interned(bpDict.wavelenMatch))
+        np.testing.assert_array_equal(bpDict.wavelenMatch, bpList[0].wavelen)
+        self.assertIs(bpDict['g'].wavelen, bpDict.wavelenMatch)
+        self.assertIs(sedList[0]._resampledCopy(bpDict.wavelenMatch).wavelen, bpDict.wavelenMatch)
+
+        resampled = Sed(wavelen=sedList[0].wavelen, flambda=sedList[0].flambda)
+        resampled.resampleSED(wavelen_match=bpDict.wavelenMatch)
+        self.assertFalse(resampled._needResample(wavelen_match=bpDict.wavelenMatch))
+        np.testing.assert_array_equal(bpDict.magListForSed(resampled), bpDict.magListForSed(sedList[0]))
+
+        batch = SedBatch.fromSedList(sedList, wavelen_match=bpDict.wavelenMatch)
+        self.assertIs(batch.wavelen, bpDict.wavelenMatch)
+
+        loaded = SedList(sedNames, [20.0]*len(sedNames), specMap=None, fileDir=sedDir,
+                         wavelenMatch=bpDict.wavelenMatch)
+        for ss in loaded:
+            np.testing.assert_array_equal(ss.wavelen, bpDict.wavelenMatch)
+
+        # the result of the grid comparison does not depend on interning
+        irregular = np.copy(bpList[0].wavelen)
+        irregular[5] += 0.01
+        self.assertTrue(bpList[0].needResample(wavelen=irregular))
+        self.assertTrue(resampled._needResample(wavelen_match=irregular))
+        self.assertFalse(resampled._needResample(wavelen_match=np.copy(bpDict.wavelenMatch)))
+
+    def testWriteableGrids(self):
+        """
+        Test that the grids of Seds and Bandpasses resampled by user code can
+        still be changed in place, without changing any other object
+        """
+        bp = Bandpass()
+        bp.readThroughput(os.path.join(self.dataDir, 'test_bandpass_g.dat'))
+        other = Bandpass()
+        other.readThroughput(os.path.join(self.dataDir, 'test_bandpass_r.dat'))
+        bpDict = BandpassDict([bp, other], ['g', 'r'])
+        self.assertTrue(bp.wavelen.flags.writeable)
+        self.assertFalse(_is_interned(bp.wavelen))
+
+        flat = Bandpass()
+        flat.setBandpass(np.copy(bp.wavelen), np.ones(len(bp.wavelen)))
+        self.assertTrue(flat.wavelen.flags.writeable)
+
+        sed = Sed(wavelen=np.arange(200.0, 1300.0, 0.7), flambda=np.ones(1572))
+        sed.resampleSED(wavelen_match=bpDict.wavelenMatch)
+        self.assertTrue(sed.wavelen.flags.writeable)
+        self.assertIsNot(sed.wavelen, bpDict.wavelenMatch)
+        sed.wavelen *= 1.0
+        bp.wavelen *= 2.0
+        np.testing.assert_array_equal(bpDict.wavelenMatch, other.wavelen)
+        np.testing.assert_array_equal(bpDict['g'].wavelen, other.wavelen)
+
+        # the arrays owned by the BandpassDict are read-only
+        with self.assertRaises(ValueError):
+            bpDict['g'].wavelen[0] = 2.0
+
+
+class MemoryTestClass(lsst.utils.tests.MemoryTestCase):
+    pass
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()